@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Analyze a D associative array in an ELF core dump without a debugger
+
+Usage: dlang_aa_stats.py [core] [Impl address] [--key-size N] [--value-size N] [--jobs N] [--jsonl PATH]
+
+Prints the entry count, load factor, deleted slot ratio and the distribution of
+probe lengths of the AA whose Impl (the `ptr` of the AA) is at the given address.
+The bucket array is split across a pool of processes which read the core file
+through mmap, so AAs with tens of millions of entries are analyzed in seconds.
+With --jsonl every entry is also written as one JSON object per line."""
+
+import argparse
+import bisect
+import collections
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+
+# buckets each task of the process pool scans
+task_buckets = 1 << 20
+# buckets decoded at once inside a task
+block_buckets = 1 << 14
+
+# AA layout, see DAssocArrayPrinter in gdb_dlang.py and lldb_dlang.py:
+# struct Impl
+#   Bucket[] buckets
+#   uint used
+#   uint deleted
+#   void* entryTI
+#   uint firstUsed
+#   uint keysz
+#   uint valsz
+#   uint valoff
+#
+# struct Bucket
+#   size_t hash
+#   void* entry
+HASH_EMPTY = 0
+HASH_DELETED = 1
+
+class DCoreFile(object):
+	"reads the memory of an ELF core file through mmap, using its PT_LOAD segments"
+
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		if self.map[:4] != b'\x7fELF':
+			raise IOError('%s is not an ELF file' % path)
+		self.order = '<' if self.map[5:6] == b'\x01' else '>'
+		self.word = 8 if self.map[4:5] == b'\x02' else 4
+		if self.word == 8:
+			phoff, = struct.unpack_from(self.order + 'Q', self.map, 0x20)
+			phentsize, phnum = struct.unpack_from(self.order + 'HH', self.map, 0x36)
+			header = self.order + 'IIQQQQQQ'
+		else:
+			phoff, = struct.unpack_from(self.order + 'I', self.map, 0x1c)
+			phentsize, phnum = struct.unpack_from(self.order + 'HH', self.map, 0x2a)
+			header = self.order + 'IIIIIIII'
+		segments = []
+		for i in range(phnum):
+			fields = struct.unpack_from(header, self.map, phoff + i * phentsize)
+			if self.word == 8:
+				type, flags, offset, vaddr, paddr, filesz = fields[:6]
+			else:
+				type, offset, vaddr, paddr, filesz = fields[:5]
+			# PT_LOAD segments with contents, the size in memory may be larger if it wasn't dumped
+			if type == 1 and filesz:
+				segments.append((vaddr, vaddr + filesz, offset))
+		segments.sort()
+		self.starts = [segment[0] for segment in segments]
+		self.segments = segments
+
+	def read(self, address, size):
+		i = bisect.bisect_right(self.starts, address) - 1
+		if i < 0 or address + size > self.segments[i][1]:
+			raise IOError('0x%x is not in the core file' % address)
+		offset = self.segments[i][2] + address - self.segments[i][0]
+		return self.map[offset:offset + size]
+
+def read_impl(core, address):
+	"returns the fields of the AA Impl at address as a dict"
+	size_t = 'Q' if core.word == 8 else 'I'
+	fmt = core.order + size_t * 2 + 'II' + size_t + 'IIII'
+	length, bucketptr, used, deleted, entry_ti, first_used, keysz, valsz, valoff = struct.unpack(fmt, core.read(address, struct.calcsize(fmt)))
+	return {
+		"length": length,
+		"bucketptr": bucketptr,
+		"used": used,
+		"deleted": deleted,
+		"firstUsed": first_used,
+		"keysz": keysz,
+		"valsz": valsz,
+		"valoff": valoff,
+	}
+
+def probe_length(hash, index, mask):
+	"number of probes druntime's triangular probing needs to reach index starting from hash"
+	i = hash & mask
+	probes = 1
+	while i != index and probes <= mask:
+		i = (i + probes) & mask
+		probes += 1
+	return probes
+
+core_files = {}
+
+def scan_buckets(task):
+	"""process pool worker, returns (filled, deleted, empty, probe length Counter) of
+	buckets [start, end) and writes their entries to the part file of the task if given"""
+	path, impl, start, end, keysz, valsz, part = task
+	core = core_files.get(path)
+	if core is None:
+		core = core_files[path] = DCoreFile(path)
+	size_t = 'Q' if core.word == 8 else 'I'
+	filled_mark = 1 << (8 * core.word - 1)
+	mask = impl["length"] - 1
+	filled = deleted = empty = 0
+	probes = collections.Counter()
+	dump = open(part, 'w') if part else None
+	try:
+		for first in range(start, end, block_buckets):
+			count = min(block_buckets, end - first)
+			data = core.read(impl["bucketptr"] + first * 2 * core.word, count * 2 * core.word)
+			for i, (hash, entry) in enumerate(struct.iter_unpack(core.order + size_t * 2, data)):
+				if hash & filled_mark:
+					filled += 1
+					length = probe_length(hash, first + i, mask)
+					probes[length] += 1
+					if dump is not None:
+						record = { "index": first + i, "hash": hash, "entry": entry, "probes": length }
+						try:
+							record["key"] = core.read(entry, keysz).hex()
+							record["value"] = core.read(entry + impl["valoff"], valsz).hex()
+						except IOError:
+							pass
+						dump.write(json.dumps(record) + "\n")
+				elif hash == HASH_DELETED:
+					deleted += 1
+				else:
+					empty += 1
+	finally:
+		if dump is not None:
+			dump.close()
+	return filled, deleted, empty, probes
+
+def probe_range(length):
+	"histogram bucket of a probe length, exact up to 8 and powers of two after that"
+	if length <= 8:
+		return (length, length)
+	high = 1 << (length - 1).bit_length()
+	return (high // 2 + 1, high)
+
+def report_lines(impl, filled, deleted, empty, probes):
+	buckets = impl["length"]
+	yield 'buckets: %d' % buckets
+	yield 'entries: %d (Impl says %d)' % (filled, impl["used"] - impl["deleted"])
+	yield 'deleted: %d (Impl says %d), ratio %.4f' % (deleted, impl["deleted"], deleted / buckets if buckets else 0)
+	yield 'empty: %d' % empty
+	yield 'load factor: %.4f (%.4f including deleted)' % (filled / buckets if buckets else 0, (filled + deleted) / buckets if buckets else 0)
+	if filled:
+		total = sum(length * count for length, count in probes.items())
+		yield 'probe length: mean %.3f, max %d' % (total / filled, max(probes))
+		ranges = collections.Counter()
+		for length, count in probes.items():
+			ranges[probe_range(length)] += count
+		for low, high in sorted(ranges):
+			yield '  %s: %d' % (str(low) if low == high else '%d-%d' % (low, high), ranges[(low, high)])
+
+def main(argv):
+	parser = argparse.ArgumentParser(description = 'Analyze a D associative array in an ELF core dump')
+	parser.add_argument('core', help = 'core file')
+	parser.add_argument('impl', type = lambda text: int(text, 0), help = 'address of the AA Impl, the ptr field of the AA')
+	parser.add_argument('--key-size', type = int, help = 'key size in bytes, defaults to keysz of the Impl')
+	parser.add_argument('--value-size', type = int, help = 'value size in bytes, defaults to valsz of the Impl')
+	parser.add_argument('--jobs', type = int, default = os.cpu_count() or 1, help = 'number of processes')
+	parser.add_argument('--jsonl', help = 'write every entry as a JSON line to this file')
+	args = parser.parse_args(argv)
+
+	core = DCoreFile(args.core)
+	impl = read_impl(core, args.impl)
+	buckets = impl["length"]
+	if buckets & (buckets - 1):
+		sys.exit('0x%x is not an AA Impl: %d buckets is not a power of two' % (args.impl, buckets))
+	keysz = impl["keysz"] if args.key_size is None else args.key_size
+	valsz = impl["valsz"] if args.value_size is None else args.value_size
+	if (keysz, valsz) != (impl["keysz"], impl["valsz"]):
+		print('warning: the Impl has %d byte keys and %d byte values' % (impl["keysz"], impl["valsz"]), file = sys.stderr)
+
+	tasks = []
+	for start in range(0, buckets, task_buckets):
+		part = '%s.%d.part' % (args.jsonl, len(tasks)) if args.jsonl else None
+		tasks.append((args.core, impl, start, min(buckets, start + task_buckets), keysz, valsz, part))
+	if args.jobs > 1 and len(tasks) > 1:
+		with multiprocessing.Pool(args.jobs) as pool:
+			results = pool.map(scan_buckets, tasks)
+	else:
+		results = [scan_buckets(task) for task in tasks]
+
+	filled = deleted = empty = 0
+	probes = collections.Counter()
+	for task_filled, task_deleted, task_empty, task_probes in results:
+		filled += task_filled
+		deleted += task_deleted
+		empty += task_empty
+		probes.update(task_probes)
+	if args.jsonl:
+		# the parts are in bucket order, concatenate them into the requested file
+		with open(args.jsonl, 'w') as out:
+			for task in tasks:
+				with open(task[-1], 'r') as part:
+					for line in part:
+						out.write(line)
+				os.remove(task[-1])
+	for line in report_lines(impl, filled, deleted, empty, probes):
+		print(line)
+
+if __name__ == '__main__':
+	main(sys.argv[1:])
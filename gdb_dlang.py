@@ -1,4 +1,326 @@
 import gdb.printing
+import array
+import atexit
+import bisect
+import collections
+import hashlib
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import sys
+
+# size in bytes of the memory blocks variables are fingerprinted and decoded in
+render_cache_block_size = 4096
+# number of variables kept in the render cache
+render_cache_size = 64
+# number of decoded strings kept until the inferior resumes
+string_cache_size = 4096
+# bytes shown per child of ubyte[] / void[] hexdumps
+hexdump_bytes_per_page = 64
+# bytes read at once when rendering hexdumps
+hexdump_read_size = 65536
+# bytes read at once by dlang-find and dlang-stats-of
+scan_chunk_size = 1 << 20
+# GC pages whose page table and bits dlang-heap reads at once
+heap_scan_pages = 4096
+# bytes of a core file each process of dlang-who-refs --jobs scans per task
+core_task_size = 64 << 20
+# show min/max/mean of numeric arrays in their summary, for arrays up to the given length
+array_summary_stats = False
+array_summary_stats_max_length = 1 << 20
+# directory the results of type lookups are cached in per build-id, None disables the cache
+type_cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'dlang-debug')
+# register the printers for all objfiles, not only those containing D code (e.g. for -betterC)
+always_load_d_printers = False
+
+class DTypeCache(object):
+	"""type lookup results of one binary, persisted as JSON by build-id
+
+	The data is loaded once and saved when gdb exits. Entries stay valid as long
+	as the build-id is the same, so sessions of the same build start hot."""
+
+	def __init__(self, build_id, sections):
+		self.path = os.path.join(type_cache_dir, build_id + '.json') if type_cache_dir and build_id else None
+		self.data = dict((section, {}) for section in sections)
+		self.dirty = False
+		if self.path is not None and os.path.exists(self.path):
+			try:
+				with open(self.path, 'r') as f:
+					loaded = json.load(f)
+				for section in sections:
+					self.data[section].update(loaded.get(section, {}))
+			except (IOError, OSError, ValueError) as e:
+				print("Ignoring broken type cache %s: %s" % (self.path, e))
+
+	def get(self, section, key):
+		return self.data[section].get(key)
+
+	def set(self, section, key, value):
+		if self.data[section].get(key) != value:
+			self.data[section][key] = value
+			self.dirty = True
+
+	def forget(self, section, key):
+		if self.data[section].pop(key, None) is not None:
+			self.dirty = True
+
+	def save(self):
+		if not self.dirty or self.path is None:
+			return
+		try:
+			if not os.path.isdir(type_cache_dir):
+				os.makedirs(type_cache_dir)
+			# write to a temporary file first so concurrent sessions never read half written caches
+			temp = '%s.%d.tmp' % (self.path, os.getpid())
+			with open(temp, 'w') as f:
+				json.dump(self.data, f)
+			os.replace(temp, self.path)
+			self.dirty = False
+		except (IOError, OSError) as e:
+			print("Failed saving type cache %s: %s" % (self.path, e))
+
+typeCaches = {}
+currentTypeCache = None
+# type name -> gdb.Type or False if it doesn't exist, cleared when objfiles are loaded
+resolvedTypes = {}
+# identifies the set of loaded objfiles, missing types are only valid for the same set
+loadedObjfilesKey = None
+
+def type_cache():
+	"returns the DTypeCache of the main objfile of the current program space"
+	global currentTypeCache
+	if currentTypeCache is None:
+		build_id = None
+		filename = gdb.current_progspace().filename
+		if filename is not None:
+			try:
+				build_id = gdb.lookup_objfile(filename).build_id
+			except ValueError:
+				pass
+		currentTypeCache = typeCaches.get(build_id)
+		if currentTypeCache is None:
+			currentTypeCache = DTypeCache(build_id, ["missing"])
+			typeCaches[build_id] = currentTypeCache
+	return currentTypeCache
+
+def loaded_objfiles_key():
+	"returns a digest of the build-ids of all loaded objfiles, cached until objfiles are loaded"
+	global loadedObjfilesKey
+	if loadedObjfilesKey is None:
+		ids = sorted(objfile.build_id or objfile.filename or '' for objfile in gdb.objfiles())
+		loadedObjfilesKey = hashlib.sha1('\n'.join(ids).encode('utf-8')).hexdigest()
+	return loadedObjfilesKey
+
+def lookup_type(name):
+	"""gdb.lookup_type remembering found types in memory and missing types on disk
+
+	A type missing with one set of loaded objfiles may be defined by a library
+	loaded later, so misses are stored with the objfiles they were checked
+	against and looked up again once that set changes."""
+	found = resolvedTypes.get(name)
+	if found is None:
+		cache = type_cache()
+		if cache.get("missing", name) == loaded_objfiles_key():
+			found = False
+		else:
+			try:
+				found = gdb.lookup_type(name)
+				cache.forget("missing", name)
+			except gdb.error:
+				cache.set("missing", name, loaded_objfiles_key())
+				found = False
+		resolvedTypes[name] = found
+	if found is False:
+		raise gdb.error("No type named %s." % name)
+	return found
+
+def clear_resolved_types(event):
+	global currentTypeCache, loadedObjfilesKey
+	resolvedTypes.clear()
+	currentTypeCache = None
+	loadedObjfilesKey = None
+
+def save_type_caches():
+	for cache in typeCaches.values():
+		cache.save()
+
+atexit.register(save_type_caches)
+
+def read_memory(address, size):
+	return gdb.selected_inferior().read_memory(address, size).tobytes()
+
+target_byte_order = None
+def byte_order():
+	"returns the struct byte order character of the target"
+	global target_byte_order
+	if target_byte_order is None:
+		endian = gdb.execute("show endian", to_string = True)
+		target_byte_order = '>' if 'big endian' in endian else '<'
+	return target_byte_order
+
+def size_t_format():
+	return 'Q' if lookup_type("size_t").sizeof == 8 else 'I'
+
+class DMemoryRegions(object):
+	"sorted index of the mapped memory regions, used to reject garbage pointers before reading"
+
+	def __init__(self, regions):
+		self.starts = []
+		self.ends = []
+		for start, end in sorted(regions):
+			if self.ends and start <= self.ends[-1]:
+				# merge overlapping and adjacent regions so ranges can span them
+				self.ends[-1] = max(self.ends[-1], end)
+			else:
+				self.starts.append(start)
+				self.ends.append(end)
+
+	def region_end(self, address):
+		"returns the end of the region containing address or None if it is not mapped"
+		i = bisect.bisect_right(self.starts, address) - 1
+		if i >= 0 and address < self.ends[i]:
+			return self.ends[i]
+		return None
+
+mapping_line = re.compile(r'^\s*0x([0-9a-f]+)\s+0x([0-9a-f]+)\s', re.MULTILINE)
+section_line = re.compile(r'^\s*0x([0-9a-f]+) - 0x([0-9a-f]+) is ', re.MULTILINE)
+
+def read_memory_regions():
+	"returns the mapped regions of the inferior or None if they can't be determined"
+	inferior = gdb.selected_inferior()
+	if inferior.pid <= 0:
+		return None
+	try:
+		files = gdb.execute("info files", to_string = True)
+	except gdb.error:
+		return None
+
+	if "core dump file" in files:
+		# core dumps contain the anonymous memory as load sections which are not part of the mappings
+		regions = [(int(start, 16), int(end, 16)) for start, end in section_line.findall(files)]
+	elif "Native process" in files and os.path.exists('/proc/%d/maps' % inferior.pid):
+		regions = []
+		with open('/proc/%d/maps' % inferior.pid, 'r') as f:
+			for line in f:
+				fields = line.split()
+				if fields[1].startswith('r'):
+					start, end = fields[0].split('-')
+					regions.append((int(start, 16), int(end, 16)))
+	else:
+		try:
+			mappings = gdb.execute("info proc mappings", to_string = True)
+		except gdb.error:
+			return None
+		regions = [(int(start, 16), int(end, 16)) for start, end in mapping_line.findall(mappings)]
+
+	if not regions:
+		return None
+	return DMemoryRegions(regions)
+
+memoryRegions = None
+memoryRegionsLoaded = False
+
+def memory_regions():
+	"returns the cached region index of the current stop"
+	global memoryRegions, memoryRegionsLoaded
+	if not memoryRegionsLoaded:
+		memoryRegions = read_memory_regions()
+		memoryRegionsLoaded = True
+	return memoryRegions
+
+def clear_memory_regions(event):
+	global memoryRegions, memoryRegionsLoaded
+	memoryRegions = None
+	memoryRegionsLoaded = False
+
+def validate_slice(address, length, item_size):
+	"returns None if the memory of a slice is mapped or a message to show instead"
+	if length == 0:
+		return None
+	regions = memory_regions()
+	if regions is None:
+		return None
+	end = regions.region_end(address)
+	if end is None:
+		return '<invalid: 0x%x is not mapped>' % address
+	if address + length * item_size > end:
+		return '<invalid: length %d exceeds mapping>' % length
+	return None
+
+class DRenderCache(object):
+	"""decoded variable blocks kept across stops, keyed by (address, type, length)
+
+	Each variable stores a fingerprint of the raw memory of each of its blocks
+	together with what was decoded from it. A block is only decoded again if its
+	memory changed since the last time it was rendered."""
+
+	def __init__(self, max_entries):
+		self.max_entries = max_entries
+		self.entries = {}
+		self.order = []
+
+	def get(self, key):
+		"returns the block map of a variable, evicting the least recently used one if full"
+		entry = self.entries.get(key)
+		if entry is None:
+			entry = {}
+			self.entries[key] = entry
+			if len(self.order) >= self.max_entries:
+				del self.entries[self.order.pop(0)]
+		else:
+			self.order.remove(key)
+		self.order.append(key)
+		return entry
+
+	def block(self, entry, index, data, decode):
+		"returns the cached decoded block if `data` is unchanged, otherwise calls decode()"
+		fingerprint = hash(data)
+		cached = entry.get(index)
+		if cached is not None and cached[0] == fingerprint:
+			return cached[1]
+		decoded = decode()
+		entry[index] = (fingerprint, decoded)
+		return decoded
+
+	def clear(self):
+		self.entries = {}
+		self.order = []
+
+render_cache = DRenderCache(render_cache_size)
+
+class DStringCache(object):
+	"least recently used decoded strings keyed by (ptr, length, encoding)"
+
+	def __init__(self, max_entries):
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict()
+
+	def get(self, key, decode):
+		"returns the cached string for key or stores the result of decode()"
+		value = self.entries.pop(key, None)
+		if value is None:
+			value = decode()
+			if len(self.entries) >= self.max_entries:
+				self.entries.popitem(last = False)
+		self.entries[key] = value
+		return value
+
+	def clear(self):
+		self.entries.clear()
+
+string_cache = DStringCache(string_cache_size)
+
+def read_d_string(val, char_type, encoding):
+	length = int(val['length'])
+	ptr = val['ptr'].cast(lookup_type(char_type).pointer())
+	invalid = validate_slice(int(ptr), length, ptr.type.target().sizeof)
+	if invalid is not None:
+		return invalid
+	return string_cache.get((int(ptr), length, encoding), lambda: ptr.string(encoding, length = length))
 
 class DCStringPrinter(object):
 	"print D string values"
@@ -10,8 +332,7 @@ class DCStringPrinter(object):
 		return 'string'
 
 	def to_string(self):
-		length = int(self.val['length'])
-		return self.val['ptr'].cast(gdb.lookup_type("char").pointer()).string('utf-8', length = length)
+		return read_d_string(self.val, "char", 'utf-8')
 
 class DWStringPrinter(object):
 	"print D wstring values"
@@ -23,8 +344,7 @@ class DWStringPrinter(object):
 		return 'string'
 
 	def to_string(self):
-		length = int(self.val['length'])
-		return self.val['ptr'].cast(gdb.lookup_type("wchar").pointer()).string('utf-16', length = length)
+		return read_d_string(self.val, "wchar", 'utf-16')
 
 class DDStringPrinter(object):
 	"print D dstring values"
@@ -36,8 +356,7 @@ class DDStringPrinter(object):
 		return 'string'
 
 	def to_string(self):
-		length = int(self.val['length'])
-		return self.val['ptr'].cast(gdb.lookup_type("dchar").pointer()).string('utf-32', length = length)
+		return read_d_string(self.val, "dchar", 'utf-32')
 
 class DArrayPrinter(object):
 	"print D arrays"
@@ -54,22 +373,96 @@ class DArrayPrinter(object):
 	def ptr(self):
 		return self.val['ptr']
 
+	def item_size(self):
+		return self.ptr().type.strip_typedefs().target().sizeof
+
+	def invalid(self):
+		"returns a message if the slice points to unmapped memory"
+		return validate_slice(int(self.ptr()), self.length(), max(1, self.item_size()))
+
 	def to_string(self):
-		return '[' + str(self.length()) + '] @ ' + str(self.ptr())
+		invalid = self.invalid()
+		if invalid is not None:
+			return invalid
+		summary = '[' + str(self.length()) + '] @ ' + str(self.ptr())
+		if array_summary_stats and 0 < self.length() <= array_summary_stats_max_length:
+			stats = self.stats()
+			if stats is not None:
+				summary += ' ' + stats.summary()
+		return summary
+
+	def stats(self):
+		"returns the DSliceStats of numeric arrays or None"
+		type = self.ptr().type.strip_typedefs().target().strip_typedefs()
+		typecode = array_typecode(type)
+		if typecode is None:
+			return None
+		address = int(self.ptr())
+		return slice_stats(lambda offset, size: read_memory(address + offset, size), self.length(), typecode, byte_order())
 
 	def children(self):
+		if self.invalid() is not None:
+			return
 		length = self.length()
 		ptr = self.ptr()
-		for i in range(length):
+		item_size = self.item_size()
+		start = 0
+		if item_size > 0:
+			address = int(ptr)
+			per_block = max(1, render_cache_block_size // item_size)
+			entry = render_cache.get((address, str(self.val.type), length))
+			try:
+				while start < length:
+					count = min(per_block, length - start)
+					data = read_memory(address + start * item_size, count * item_size)
+					items = render_cache.block(entry, start, data, lambda: [ptr[i] for i in range(start, start + count)])
+					for i, item in enumerate(items):
+						yield str(start + i), item
+					start += count
+			except gdb.MemoryError:
+				pass
+		# unsized items or unreadable memory, let gdb report the errors per element
+		for i in range(start, length):
 			yield str(i), ptr[i]
 
+class DByteBufferPrinter(DArrayPrinter):
+	"print D ubyte[] and void[] as hexdump, one child per page"
+
+	def item_size(self):
+		return 1
+
+	def to_string(self):
+		invalid = self.invalid()
+		if invalid is not None:
+			return invalid
+		return '[' + str(self.length()) + ' bytes] @ ' + str(self.ptr())
+
+	def children(self):
+		if self.invalid() is not None:
+			return
+		length = self.length()
+		address = int(self.ptr())
+		# round down so chunks always contain whole pages
+		chunk_size = max(hexdump_bytes_per_page, hexdump_read_size - hexdump_read_size % hexdump_bytes_per_page)
+		for chunk in range(0, length, chunk_size):
+			data = read_memory(address + chunk, min(chunk_size, length - chunk))
+			for page in range(0, len(data), hexdump_bytes_per_page):
+				yield '0x%08x' % (chunk + page), hexdump_line(data[page:page + hexdump_bytes_per_page])
+
+def hexdump_line(data):
+	"formats bytes as hex in groups of 8 followed by their printable ASCII characters"
+	data = bytearray(data)
+	groups = [' '.join('%02x' % b for b in data[i:i + 8]) for i in range(0, len(data), 8)]
+	text = ''.join(chr(b) if 0x20 <= b < 0x7f else '.' for b in data)
+	return '  '.join(groups) + '  |' + text + '|'
+
 class DAssocArrayPrinter(object):
 	"print D associative arrays"
 
 	def __init__(self, val):
 		self.val = val
-		self.key_type = gdb.lookup_type("void")
-		self.value_type = gdb.lookup_type("void")
+		self.key_type = lookup_type("void")
+		self.value_type = lookup_type("void")
 
 		tag = val.type.tag
 		if tag != None:
@@ -137,56 +530,99 @@ class DAssocArrayPrinter(object):
 	def used(self):
 		# *(uint*)((void*)ptr + 16)
 		# (uint)ptr@16
-		return (self.val['ptr'].cast(gdb.lookup_type("void").pointer()) + gdb.lookup_type("size_t").alignof * 2).cast(gdb.lookup_type("uint").pointer()).dereference()
+		return (self.val['ptr'].cast(lookup_type("void").pointer()) + lookup_type("size_t").alignof * 2).cast(lookup_type("uint").pointer()).dereference()
 
 	def deleted(self):
-		return (self.val['ptr'].cast(gdb.lookup_type("void").pointer()) + gdb.lookup_type("size_t").alignof * 2 + gdb.lookup_type("uint").alignof).cast(gdb.lookup_type("uint").pointer()).dereference()
+		return (self.val['ptr'].cast(lookup_type("void").pointer()) + lookup_type("size_t").alignof * 2 + lookup_type("uint").alignof).cast(lookup_type("uint").pointer()).dereference()
 
 	def valoff(self):
-		return (self.val['ptr'].cast(gdb.lookup_type("void").pointer()) + gdb.lookup_type("size_t").alignof * 3 + gdb.lookup_type("uint").alignof * 5).cast(gdb.lookup_type("uint").pointer()).dereference()
+		return (self.val['ptr'].cast(lookup_type("void").pointer()) + lookup_type("size_t").alignof * 3 + lookup_type("uint").alignof * 5).cast(lookup_type("uint").pointer()).dereference()
+
+	def keysz(self):
+		return (self.val['ptr'].cast(lookup_type("void").pointer()) + lookup_type("size_t").alignof * 3 + lookup_type("uint").alignof * 3).cast(lookup_type("uint").pointer()).dereference()
+
+	def bucket_array(self):
+		"returns the (length, address) of the bucket array"
 
-	def buckets(self):
-		"returns an iterator of bucket pointers"
+		# *(size_t*)ptr, *(void**)ptr@8
+		size_t_size = lookup_type("size_t").sizeof
+		return struct.unpack(byte_order() + size_t_format() * 2, read_memory(int(self.val['ptr']), size_t_size * 2))
+
+	def bucket_blocks(self, length, bucketptr):
+		"returns an iterator of (first bucket index, raw bucket memory) blocks"
 
-		# *(size_t*)ptr
-		length = self.val['ptr'].cast(gdb.lookup_type("size_t").pointer()).dereference()
-		# (void*)ptr@8
-		bucketptr = self.val['ptr'].cast(gdb.lookup_type("void").pointer()) + gdb.lookup_type("size_t").alignof
-		bucketptr = bucketptr.cast(gdb.lookup_type("void").pointer().pointer()).dereference()
 		bucketsize = self.bucket_size()
+		per_block = max(1, render_cache_block_size // bucketsize)
 
-		for i in range(length):
-			yield bucketptr + (i * bucketsize)
+		for start in range(0, length, per_block):
+			count = min(per_block, length - start)
+			yield start, read_memory(bucketptr + start * bucketsize, count * bucketsize)
 
-	def bucket_filled(self, bucket):
-		hashval = bucket.cast(gdb.lookup_type("size_t").pointer()).dereference()
-		HASH_FILLED_MARK = 1 << (8 * gdb.lookup_type("size_t").alignof) - 1
-		return hashval & HASH_FILLED_MARK != 0
+	def filled_entries(self, data):
+		"returns the entry addresses and decoded keys of the filled buckets in a block"
+		void_ptr = lookup_type("void").pointer()
+		HASH_FILLED_MARK = 1 << (8 * lookup_type("size_t").sizeof) - 1
+		entries = []
+		for hashval, entry in struct.iter_unpack(byte_order() + size_t_format() * 2, data):
+			if hashval & HASH_FILLED_MARK != 0:
+				entries.append((entry, reinterpret_aa_key(gdb.Value(entry).cast(void_ptr), self.key_type)))
+		return entries
 
-	def bucket_entry(self, bucket):
-		# *(void**)bucket@8
-		ret = bucket.cast(gdb.lookup_type("void").pointer()) + gdb.lookup_type("size_t").alignof
-		return ret.cast(gdb.lookup_type("void").pointer().pointer()).dereference()
+	def key_memory(self, data, keysz):
+		"returns the raw keys of the filled buckets in a block, so changed keys are decoded again"
+		HASH_FILLED_MARK = 1 << (8 * lookup_type("size_t").sizeof) - 1
+		keys = []
+		for hashval, entry in struct.iter_unpack(byte_order() + size_t_format() * 2, data):
+			if hashval & HASH_FILLED_MARK != 0:
+				try:
+					keys.append(read_memory(entry, keysz))
+				except gdb.MemoryError:
+					keys.append(b'')
+		return b''.join(keys)
 
 	def bucket_size(self):
-		return gdb.lookup_type("void").pointer().alignof + gdb.lookup_type("size_t").alignof
+		return lookup_type("void").pointer().alignof + lookup_type("size_t").alignof
 
 	def length(self):
 		return self.used() - self.deleted()
 
+	def invalid(self):
+		"returns a message if the AA or its buckets point to unmapped memory"
+		impl = int(self.val['ptr'])
+		if impl == 0:
+			return None
+		size_t_size = lookup_type("size_t").sizeof
+		invalid = validate_slice(impl, 1, size_t_size * 3 + lookup_type("uint").sizeof * 6)
+		if invalid is not None:
+			return invalid
+		length, bucketptr = self.bucket_array()
+		return validate_slice(bucketptr, length, self.bucket_size())
+
 	def to_string(self):
+		if int(self.val['ptr']) == 0:
+			return '[0]'
+		invalid = self.invalid()
+		if invalid is not None:
+			return invalid
 		return '[' + str(self.length()) + ']'
 
 	def children(self):
-		off = self.valoff()
-		for bucket in self.buckets():
-			if self.bucket_filled(bucket):
-				entry = self.bucket_entry(bucket)
-				yield reinterpret_aa_key(entry, self.key_type), reinterpret_aa_val(entry + off, self.value_type)
+		if int(self.val['ptr']) == 0 or self.invalid() is not None:
+			return
+		off = int(self.valoff())
+		void_ptr = lookup_type("void").pointer()
+		length, bucketptr = self.bucket_array()
+		# keys are decoded once per unchanged bucket block, values are always read fresh
+		entry = render_cache.get((int(self.val['ptr']), str(self.val.type), length))
+		keysz = int(self.keysz())
+		for start, data in self.bucket_blocks(length, bucketptr):
+			fingerprinted = data + self.key_memory(data, keysz)
+			for address, key in render_cache.block(entry, start, fingerprinted, lambda: self.filled_entries(data)):
+				yield key, reinterpret_aa_val(gdb.Value(address + off).cast(void_ptr), self.value_type)
 
 def reinterpret_aa_key(value, type):
 	if type is None:
-		return '(?) %s' % str(value.cast(gdb.lookup_type("void").pointer()))
+		return '(?) %s' % str(value.cast(lookup_type("void").pointer()))
 	elif type.name == 'void':
 		return '[(void*) %s]' % str(value.cast(type.pointer()))
 	else:
@@ -199,203 +635,1751 @@ def reinterpret_aa_val(value, type):
 		return value.cast(type.pointer()).dereference()
 
 def parse_d_type(type):
-	return gdb.lookup_type(type)
+	return lookup_type(type)
+
+# DMD backend type names -> functions returning the D type
+dmd_types = {
+	"bool": lambda: lookup_type("bool"),
+	"char": lambda: lookup_type("char"),
+	"signed char": lambda: lookup_type("byte"),
+	"unsigned char": lambda: lookup_type("ubyte"),
+	"char8_t": lambda: lookup_type("char"),
+	"char16_t": lambda: lookup_type("wchar"),
+	"short": lambda: lookup_type("short"),
+	"wchar_t": lambda: lookup_type("wchar"),
+	"unsigned short": lambda: lookup_type("ushort"),
+	"enum": lambda: lookup_type("uint"),
+	"int": lambda: lookup_type("int"),
+	"unsigned": lambda: lookup_type("uint"),
+	"long": lambda: lookup_type("int"),
+	"unsigned long": lambda: lookup_type("uint"),
+	"dchar": lambda: lookup_type("dchar"),
+	"long long": lambda: lookup_type("long"),
+	"uns long long": lambda: lookup_type("ulong"),
+	"cent": lambda: lookup_type("void"),
+	"ucent": lambda: lookup_type("void"),
+	"float": lambda: lookup_type("float"),
+	"double": lambda: lookup_type("double"),
+	"double alias": lambda: lookup_type("double"),
+	"long double": lambda: lookup_type("real"),
+	"imaginary float": lambda: lookup_type("ifloat"),
+	"imaginary double": lambda: lookup_type("idouble"),
+	"imaginary long double": lambda: lookup_type("ireal"),
+	"complex float": lambda: lookup_type("cfloat"),
+	"complex double": lambda: lookup_type("cdouble"),
+	"complex long double": lambda: lookup_type("creal"),
+	"float[4]": lambda: lookup_type("float").vector(4 - 1),
+	"double[2]": lambda: lookup_type("double").vector(2 - 1),
+	"signed char[16]": lambda: lookup_type("byte").vector(16 - 1),
+	"unsigned char[16]": lambda: lookup_type("ubyte").vector(16 - 1),
+	"short[8]": lambda: lookup_type("short").vector(8 - 1),
+	"unsigned short[8]": lambda: lookup_type("ushort").vector(8 - 1),
+	"long[4]": lambda: lookup_type("int").vector(4 - 1),
+	"unsigned long[4]": lambda: lookup_type("uint").vector(4 - 1),
+	"long long[2]": lambda: lookup_type("long").vector(2 - 1),
+	"unsigned long long[2]": lambda: lookup_type("ulong").vector(2 - 1),
+	"float[8]": lambda: lookup_type("float").vector(8 - 1),
+	"double[4]": lambda: lookup_type("double").vector(4 - 1),
+	"signed char[32]": lambda: lookup_type("byte").vector(32 - 1),
+	"unsigned char[32]": lambda: lookup_type("ubyte").vector(32 - 1),
+	"short[16]": lambda: lookup_type("short").vector(16 - 1),
+	"unsigned short[16]": lambda: lookup_type("ushort").vector(16 - 1),
+	"long[8]": lambda: lookup_type("int").vector(8 - 1),
+	"unsigned long[8]": lambda: lookup_type("uint").vector(8 - 1),
+	"long long[4]": lambda: lookup_type("long").vector(4 - 1),
+	"unsigned long long[4]": lambda: lookup_type("ulong").vector(4 - 1),
+	"float[16]": lambda: lookup_type("float").vector(16 - 1),
+	"double[8]": lambda: lookup_type("double").vector(8 - 1),
+	"signed char[64]": lambda: lookup_type("byte").vector(64 - 1),
+	"unsigned char[64]": lambda: lookup_type("ubyte").vector(64 - 1),
+	"short[32]": lambda: lookup_type("short").vector(32 - 1),
+	"unsigned short[32]": lambda: lookup_type("ushort").vector(32 - 1),
+	"long[16]": lambda: lookup_type("int").vector(16 - 1),
+	"unsigned long[16]": lambda: lookup_type("uint").vector(16 - 1),
+	"long long[8]": lambda: lookup_type("long").vector(8 - 1),
+	"unsigned long long[8]": lambda: lookup_type("ulong").vector(8 - 1),
+	"nullptr_t": lambda: lookup_type("void"),
+	"*": lambda: lookup_type("void").pointer(),
+	"&": lambda: lookup_type("void").reference(),
+	"void": lambda: lookup_type("void"),
+	"noreturn": lambda: lookup_type("void"),
+	"struct": lambda: lookup_type("void"),
+	"array": lambda: lookup_type("void"),
+	"C func": lambda: lookup_type("void").pointer(),
+	"Pascal func": lambda: lookup_type("void").pointer(),
+	"std func": lambda: lookup_type("void").pointer(),
+	"*": lambda: lookup_type("void").pointer(),
+	"member func": lambda: lookup_type("void").pointer(),
+	"D func": lambda: lookup_type("void").pointer(),
+	"C func": lambda: lookup_type("void").pointer(),
+	"__near &": lambda: lookup_type("void").reference(),
+	"__ss *": lambda: lookup_type("void").pointer(),
+	"__cs *": lambda: lookup_type("void").pointer(),
+	"__far16 *": lambda: lookup_type("void").pointer(),
+	"__far *": lambda: lookup_type("void").pointer(),
+	"__huge *": lambda: lookup_type("void").pointer(),
+	"__handle *": lambda: lookup_type("void").pointer(),
+	"__immutable *": lambda: lookup_type("void").pointer(),
+	"__shared *": lambda: lookup_type("void").pointer(),
+	"__restrict *": lambda: lookup_type("void").pointer(),
+	"__fg *": lambda: lookup_type("void").pointer(),
+	"far C func": lambda: lookup_type("void").pointer(),
+	"far Pascal func": lambda: lookup_type("void").pointer(),
+	"far std func": lambda: lookup_type("void").pointer(),
+	"_far16 Pascal func": lambda: lookup_type("void").pointer(),
+	"sys func": lambda: lookup_type("void").pointer(),
+	"far sys func": lambda: lookup_type("void").pointer(),
+	"__far &": lambda: lookup_type("void").reference(),
+	"interrupt func": lambda: lookup_type("void").pointer(),
+	"memptr": lambda: lookup_type("void").pointer(),
+	"ident": lambda: lookup_type("void"),
+	"template": lambda: lookup_type("void"),
+	"vtshape": lambda: lookup_type("void"),
+}
 
 def parse_dmd_type(type):
-	return {
-		"bool": gdb.lookup_type("bool"),
-		"char": gdb.lookup_type("char"),
-		"signed char": gdb.lookup_type("byte"),
-		"unsigned char": gdb.lookup_type("ubyte"),
-		"char8_t": gdb.lookup_type("char"),
-		"char16_t": gdb.lookup_type("wchar"),
-		"short": gdb.lookup_type("short"),
-		"wchar_t": gdb.lookup_type("wchar"),
-		"unsigned short": gdb.lookup_type("ushort"),
-		"enum": gdb.lookup_type("uint"),
-		"int": gdb.lookup_type("int"),
-		"unsigned": gdb.lookup_type("uint"),
-		"long": gdb.lookup_type("int"),
-		"unsigned long": gdb.lookup_type("uint"),
-		"dchar": gdb.lookup_type("dchar"),
-		"long long": gdb.lookup_type("long"),
-		"uns long long": gdb.lookup_type("ulong"),
-		"cent": gdb.lookup_type("void"),
-		"ucent": gdb.lookup_type("void"),
-		"float": gdb.lookup_type("float"),
-		"double": gdb.lookup_type("double"),
-		"double alias": gdb.lookup_type("double"),
-		"long double": gdb.lookup_type("real"),
-		"imaginary float": gdb.lookup_type("ifloat"),
-		"imaginary double": gdb.lookup_type("idouble"),
-		"imaginary long double": gdb.lookup_type("ireal"),
-		"complex float": gdb.lookup_type("cfloat"),
-		"complex double": gdb.lookup_type("cdouble"),
-		"complex long double": gdb.lookup_type("creal"),
-		"float[4]": gdb.lookup_type("float").vector(4 - 1),
-		"double[2]": gdb.lookup_type("double").vector(2 - 1),
-		"signed char[16]": gdb.lookup_type("byte").vector(16 - 1),
-		"unsigned char[16]": gdb.lookup_type("ubyte").vector(16 - 1),
-		"short[8]": gdb.lookup_type("short").vector(8 - 1),
-		"unsigned short[8]": gdb.lookup_type("ushort").vector(8 - 1),
-		"long[4]": gdb.lookup_type("int").vector(4 - 1),
-		"unsigned long[4]": gdb.lookup_type("uint").vector(4 - 1),
-		"long long[2]": gdb.lookup_type("long").vector(2 - 1),
-		"unsigned long long[2]": gdb.lookup_type("ulong").vector(2 - 1),
-		"float[8]": gdb.lookup_type("float").vector(8 - 1),
-		"double[4]": gdb.lookup_type("double").vector(4 - 1),
-		"signed char[32]": gdb.lookup_type("byte").vector(32 - 1),
-		"unsigned char[32]": gdb.lookup_type("ubyte").vector(32 - 1),
-		"short[16]": gdb.lookup_type("short").vector(16 - 1),
-		"unsigned short[16]": gdb.lookup_type("ushort").vector(16 - 1),
-		"long[8]": gdb.lookup_type("int").vector(8 - 1),
-		"unsigned long[8]": gdb.lookup_type("uint").vector(8 - 1),
-		"long long[4]": gdb.lookup_type("long").vector(4 - 1),
-		"unsigned long long[4]": gdb.lookup_type("ulong").vector(4 - 1),
-		"float[16]": gdb.lookup_type("float").vector(16 - 1),
-		"double[8]": gdb.lookup_type("double").vector(8 - 1),
-		"signed char[64]": gdb.lookup_type("byte").vector(64 - 1),
-		"unsigned char[64]": gdb.lookup_type("ubyte").vector(64 - 1),
-		"short[32]": gdb.lookup_type("short").vector(32 - 1),
-		"unsigned short[32]": gdb.lookup_type("ushort").vector(32 - 1),
-		"long[16]": gdb.lookup_type("int").vector(16 - 1),
-		"unsigned long[16]": gdb.lookup_type("uint").vector(16 - 1),
-		"long long[8]": gdb.lookup_type("long").vector(8 - 1),
-		"unsigned long long[8]": gdb.lookup_type("ulong").vector(8 - 1),
-		"nullptr_t": gdb.lookup_type("void"),
-		"*": gdb.lookup_type("void").pointer(),
-		"&": gdb.lookup_type("void").reference(),
-		"void": gdb.lookup_type("void"),
-		"noreturn": gdb.lookup_type("void"),
-		"struct": gdb.lookup_type("void"),
-		"array": gdb.lookup_type("void"),
-		"C func": gdb.lookup_type("void").pointer(),
-		"Pascal func": gdb.lookup_type("void").pointer(),
-		"std func": gdb.lookup_type("void").pointer(),
-		"*": gdb.lookup_type("void").pointer(),
-		"member func": gdb.lookup_type("void").pointer(),
-		"D func": gdb.lookup_type("void").pointer(),
-		"C func": gdb.lookup_type("void").pointer(),
-		"__near &": gdb.lookup_type("void").reference(),
-		"__ss *": gdb.lookup_type("void").pointer(),
-		"__cs *": gdb.lookup_type("void").pointer(),
-		"__far16 *": gdb.lookup_type("void").pointer(),
-		"__far *": gdb.lookup_type("void").pointer(),
-		"__huge *": gdb.lookup_type("void").pointer(),
-		"__handle *": gdb.lookup_type("void").pointer(),
-		"__immutable *": gdb.lookup_type("void").pointer(),
-		"__shared *": gdb.lookup_type("void").pointer(),
-		"__restrict *": gdb.lookup_type("void").pointer(),
-		"__fg *": gdb.lookup_type("void").pointer(),
-		"far C func": gdb.lookup_type("void").pointer(),
-		"far Pascal func": gdb.lookup_type("void").pointer(),
-		"far std func": gdb.lookup_type("void").pointer(),
-		"_far16 Pascal func": gdb.lookup_type("void").pointer(),
-		"sys func": gdb.lookup_type("void").pointer(),
-		"far sys func": gdb.lookup_type("void").pointer(),
-		"__far &": gdb.lookup_type("void").reference(),
-		"interrupt func": gdb.lookup_type("void").pointer(),
-		"memptr": gdb.lookup_type("void").pointer(),
-		"ident": gdb.lookup_type("void"),
-		"template": gdb.lookup_type("void"),
-		"vtshape": gdb.lookup_type("void"),
-	}.get(type, "void")
-
-def build_pretty_printer():
-	pp = gdb.printing.RegexpCollectionPrettyPrinter("dlang_utils")
+	return dmd_types.get(type, lambda: lookup_type("void"))()
+
+# type name -> layout of a SumType, Nullable or Tuple instantiation, computed once per type
+phobosLayouts = {}
+
+def phobos_layout(type, compute):
+	"returns compute(type) cached by the type name, so arrays of these types are introspected once"
+	type = type.strip_typedefs()
+	name = str(type)
+	layout = phobosLayouts.get(name)
+	if layout is None:
+		layout = phobosLayouts[name] = compute(type)
+	return layout
+
+def template_arguments(name):
+	"""splits the top level template arguments of a type name like Tuple!(int, "a").Tuple
+
+	Names may end with the eponymous member and single arguments may be given
+	without parentheses, like Nullable!int.Nullable."""
+	start = name.find('!')
+	if start < 0:
+		return []
+	if name[start + 1:start + 2] != '(':
+		argument = name[start + 1:]
+		suffix = '.' + name[:start].split('.')[-1]
+		if argument.endswith(suffix):
+			argument = argument[:-len(suffix)]
+		return [argument] if argument else []
+	args = []
+	current = ''
+	depth = 0
+	quoted = False
+	for c in name[start + 2:]:
+		if quoted:
+			quoted = c != '"'
+		elif c == '"':
+			quoted = True
+		elif c in '([':
+			depth += 1
+		elif c in ')]':
+			if depth == 0:
+				# the closing parenthesis of the arguments, an eponymous member may follow
+				break
+			depth -= 1
+		elif c == ',' and depth == 0:
+			args.append(current.strip())
+			current = ''
+			continue
+		current += c
+	if current.strip():
+		args.append(current.strip())
+	return args
+
+def tuple_field_names(type_name, count):
+	"returns the names given to the fields of a Tuple instantiation, None for unnamed fields"
+	names = []
+	for arg in template_arguments(type_name):
+		if len(arg) >= 2 and arg[0] == arg[-1] == '"':
+			if names:
+				names[-1] = arg[1:-1]
+		else:
+			names.append(None)
+	return names if len(names) == count else [None] * count
+
+def sumtype_layout(type):
+	"returns ({tag: storage member name}, whether the tag is a field) of a SumType"
+	members = {}
+	for field in type['storage'].type.strip_typedefs().fields():
+		match = re.match(r'^values_(\d+)$', field.name or '')
+		if match:
+			members[int(match.group(1))] = field.name
+	return members, any(field.name == 'tag' for field in type.fields())
+
+def nullable_layout(type):
+	"returns (payload field path, whether there is an _isNull field) of a Nullable"
+	path = ['_value']
+	value_type = type['_value'].type.strip_typedefs()
+	# newer phobos wraps the value in a union to not call its destructor
+	if value_type.code == gdb.TYPE_CODE_UNION and any(field.name == 'payload' for field in value_type.fields()):
+		path.append('payload')
+	return path, any(field.name == '_isNull' for field in type.fields())
+
+def tuple_layout(type):
+	"returns (child name, field name) of the fields of a Tuple"
+	fields = [field.name for field in type.fields() if not field.is_base_class and hasattr(field, 'bitpos')]
+	names = tuple_field_names(str(type), len(fields))
+	return [(names[i] or '[%d]' % i, field) for i, field in enumerate(fields)]
+
+class DSumTypePrinter(object):
+	"print the active member of std.sumtype.SumType"
+
+	def __init__(self, val):
+		self.val = val
+
+	def to_string(self):
+		members, has_tag = phobos_layout(self.val.type, sumtype_layout)
+		tag = int(self.val['tag']) if has_tag else 0
+		if tag not in members:
+			return '<invalid tag %d>' % tag
+		return self.val['storage'][members[tag]]
+
+class DNullablePrinter(object):
+	"print std.typecons.Nullable as null or its value"
+
+	def __init__(self, val):
+		self.val = val
+
+	def to_string(self):
+		path, has_is_null = phobos_layout(self.val.type, nullable_layout)
+		if has_is_null and bool(self.val['_isNull']):
+			return 'null'
+		value = self.val
+		for name in path:
+			value = value[name]
+		return value
+
+class DTuplePrinter(object):
+	"print std.typecons.Tuple fields by their names"
+
+	def __init__(self, val):
+		self.val = val
+
+	def to_string(self):
+		return 'Tuple'
+
+	def children(self):
+		for name, field in phobos_layout(self.val.type, tuple_layout):
+			yield name, self.val[field]
+
+class DObjfilePrettyPrinter(gdb.printing.RegexpCollectionPrettyPrinter):
+	"regex printer collection only looking at the types of its own objfile"
+
+	def __init__(self, name, objfile):
+		super (DObjfilePrettyPrinter, self).__init__(name)
+		self.objfile = objfile
+
+	def __call__(self, val):
+		if not owns_type(self.objfile, val.type):
+			return None
+		return super (DObjfilePrettyPrinter, self).__call__(val)
+
+def owns_type(objfile, type):
+	# Type.objfile is not available before GDB 9 and None for architecture owned types, check those everywhere
+	type_objfile = getattr(type, 'objfile', None)
+	if objfile is None or type_objfile is None:
+		return True
+	# types of separate debug info files belong to the objfile they were loaded for
+	return (type_objfile.owner or type_objfile) == (objfile.owner or objfile)
+
+def build_pretty_printer(objfile):
+	pp = DObjfilePrettyPrinter("dlang_utils", objfile)
 	pp.add_printer('string', r'^_Array_char$|^_Array_char8_t$|^string$|^(?:const|immutable)?\(?char\)?\s*\[\]$', DCStringPrinter)
 	pp.add_printer('wstring', r'^_Array_wchar_t$|^_Array_char16_t$|^wstring$|^(?:const|immutable)?\(?wchar\)?\s*\[\]$', DWStringPrinter)
 	pp.add_printer('dstring', r'^_Array_dchar$|^dstring$|^(?:const|immutable)?\(?dchar\)?\s*\[\]$', DDStringPrinter)
+	pp.add_printer('bytes', r'^_Array_ubyte$|^_Array_unsigned char$|^_Array_void$|^(?:const|immutable|shared)?\(?(?:ubyte|void)\)?\s*\[\]$', DByteBufferPrinter)
 	pp.add_printer('arrays', r'^_Array_|\[\]$', DArrayPrinter)
 	pp.add_printer('hashmaps', r'^_AArray_|[^0-9\[][^\[]*\]$', DAssocArrayPrinter)
+	pp.add_printer('sumtype', r'^(?:std\.)?sumtype\.SumType!(?:\(.*\)(?:\.SumType)?|[\w.]+)$', DSumTypePrinter)
+	pp.add_printer('nullable', r'^std\.typecons\.Nullable!(?:\(.*\)(?:\.Nullable)?|[\w.]+)$', DNullablePrinter)
+	pp.add_printer('tuple', r'^std\.typecons\.Tuple!(?:\(.*\)(?:\.Tuple)?|[\w.]+)$', DTuplePrinter)
 	return pp
 
-gdb.printing.register_pretty_printer(gdb.current_objfile(), build_pretty_printer())
-
-# # Register map:
-# # fully qualified enum name -> {
-# #   basetype: string,
-# #   values: { [index: string]: gdb.Value }
-# # }
-# registeredEnums = {}
-# class RegisterDlangEnum(gdb.Command):
-# 	"""Register custom enums for debugging view (done by IDE)"""
-
-# 	def __init__(self):
-# 		super (RegisterDlangEnum, self).__init__("register-dlang-enum", gdb.COMMAND_DATA)
-
-# 	def invoke(self, arg, from_tty):
-# 		args = gdb.string_to_argv(arg)
-# 		global registeredEnums
-
-# 		if len(args) < 2 or len(args) % 2 != 0:
-# 			raise Exception("Usage: register-dlang-enum [enum FQN] [basetype FQN] ([key value] ...)")
-# 		else:
-# 			enumfqn = args[0]
-# 			basetype = args[1]
-# 			values = {}
-# 			try:
-# 				for i in range(2, len(args), 2):
-# 					values[args[i]] = gdb.parse_and_eval(args[i + 1])
-# 				registeredEnums[enumfqn] = { "basetype": basetype, "values": values }
-# 			except Exception as e:
-# 				print("Ignoring values because failed to parse for enum: " + str(e))
-# 				registeredEnums[enumfqn] = { "basetype": basetype }
-# RegisterDlangEnum()
-
-# class DFallbackEnumPrinter(object):
-# 	"prints broken D enum values"
-
-# 	def __init__(self, val):
-# 		self.val = val
-
-# 	def display_hint(self):
-# 		return 'enum'
-
-# 	def to_string(self):
-# 		type = self.val.type
-# 		if type.sizeof == 1:
-# 			return 'cast(' + str(type) + ')' + str(self.val.address.cast(gdb.lookup_type("ubyte").pointer()).dereference())
-# 		elif type.sizeof == 2:
-# 			return 'cast(' + str(type) + ')' + str(self.val.address.cast(gdb.lookup_type("ushort").pointer()).dereference())
-# 		elif type.sizeof == 4:
-# 			return 'cast(' + str(type) + ')' + str(self.val.address.cast(gdb.lookup_type("uint").pointer()).dereference())
-# 		elif type.sizeof == 8:
-# 			return 'cast(' + str(type) + ')' + str(self.val.address.cast(gdb.lookup_type("ulong").pointer()).dereference())
-# 		else:
-# 			return 'cast(' + str(type) + ')<unknown>'
-
-# class DRegisteredEnumPrinter(object):
-# 	"prints an IDE registered D enum value"
-
-# 	def __init__(self, val, register):
-# 		self.val = val
-# 		self.register = register
-# 		self.basetype = gdb.lookup_type(register['basetype'])
-
-# 	def display_hint(self):
-# 		return 'enum'
-
-# 	def to_string(self):
-# 		type = str(self.val.type)
-# 		val = self.val.address.cast(self.basetype.pointer()).dereference()
-# 		moduleend = type.rfind('.')
-# 		if moduleend != -1:
-# 			type = type[(moduleend + 1):]
-# 		if self.register['values'] != None:
-# 			for named in self.register['values']:
-# 				if self.register['values'][named] == val:
-# 					return type + '.' + named + ' (' + str(val) + ')'
-# 		return 'cast(' + type + ')' + str(val)
-
-# def dlang_enum_printer(v):
-# 	if v.type.code == 5:
-# 		global registeredEnums
-# 		registered = registeredEnums.get(v.type.name, None)
-# 		if registered != None:
-# 			return DRegisteredEnumPrinter(v, registered)
-# 		elif str(v) == "<incomplete type>":
-# 			return DFallbackEnumPrinter(v)
-# 	return None
-
-# gdb.printing.register_pretty_printer(gdb.current_objfile(), dlang_enum_printer)
+gdb.events.exited.connect(lambda event: render_cache.clear())
+gdb.events.cont.connect(lambda event: string_cache.clear())
+gdb.events.exited.connect(lambda event: string_cache.clear())
+gdb.events.memory_changed.connect(lambda event: string_cache.clear())
+gdb.events.cont.connect(clear_memory_regions)
+gdb.events.exited.connect(clear_memory_regions)
+gdb.events.new_objfile.connect(clear_memory_regions)
+gdb.events.new_objfile.connect(clear_resolved_types)
+gdb.events.exited.connect(lambda event: save_type_caches())
+
+# Register map:
+# fully qualified enum name -> DRegisteredEnum
+registeredEnums = {}
+
+class DRegisteredEnum(object):
+	"value -> name index of an IDE registered D enum"
+
+	def __init__(self, basetype, values, flags = False):
+		self.basetype_name = basetype
+		self.basetype = None
+		self.flags = flags
+		# reverse index, first registered name wins for aliased values
+		self.names = {}
+		for name, value in values:
+			if value not in self.names:
+				self.names[value] = name
+		# members used for decomposing flag values, largest first so combined
+		# members (e.g. `ReadWrite = Read | Write`) are preferred over single bits
+		self.flag_members = sorted(((value, name) for value, name in self.names.items() if value > 0), reverse = True)
+
+	def lookup_basetype(self):
+		if self.basetype is None:
+			self.basetype = lookup_type(self.basetype_name)
+		return self.basetype
+
+	def name_of(self, value):
+		"returns the member name(s) for an integer value or None if it can't be named"
+		name = self.names.get(value)
+		if name is not None:
+			return [name]
+		if not self.flags or value <= 0:
+			return None
+		names = []
+		remaining = value
+		for member, name in self.flag_members:
+			if remaining & member == member:
+				names.append(name)
+				remaining &= ~member
+				if remaining == 0:
+					return names
+		return None
+
+def parse_enum_value(value):
+	try:
+		return int(value, 0)
+	except ValueError:
+		return int(gdb.parse_and_eval(value))
+
+def register_dlang_enum(args):
+	flags = False
+	if len(args) > 0 and args[0] == '--flags':
+		flags = True
+		args = args[1:]
+
+	if len(args) < 2 or len(args) % 2 != 0:
+		raise Exception("Usage: register-dlang-enum [--flags] [enum FQN] [basetype FQN] ([key value] ...) (; ...)")
+
+	enumfqn = args[0]
+	basetype = args[1]
+	values = []
+	try:
+		for i in range(2, len(args), 2):
+			values.append((args[i], parse_enum_value(args[i + 1])))
+	except Exception as e:
+		print("Ignoring values because failed to parse for enum: " + str(e))
+		values = []
+	registeredEnums[enumfqn] = DRegisteredEnum(basetype, values, flags)
+
+class RegisterDlangEnum(gdb.Command):
+	"""Register custom enums for debugging view (done by IDE)
+
+Usage: register-dlang-enum [--flags] [enum FQN] [basetype FQN] ([key value] ...) (; ...)
+       register-dlang-enum --file [path]
+
+Multiple enums can be registered at once by separating them with `;`.
+A file contains one enum per line in the same format, lines starting with # are ignored."""
+
+	def __init__(self):
+		super (RegisterDlangEnum, self).__init__("register-dlang-enum", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		args = gdb.string_to_argv(arg)
+
+		if len(args) == 2 and args[0] == '--file':
+			with open(args[1], 'r') as f:
+				for line in f:
+					line = line.strip()
+					if line and not line.startswith('#'):
+						register_dlang_enums(line)
+			return
+
+		register_dlang_enums(arg)
+
+def register_dlang_enums(arg):
+	# split before tokenizing so `;` doesn't need to be surrounded by spaces
+	for part in arg.split(';'):
+		args = gdb.string_to_argv(part)
+		if args:
+			register_dlang_enum(args)
+RegisterDlangEnum()
+
+class DFallbackEnumPrinter(object):
+	"prints broken D enum values"
+
+	def __init__(self, val):
+		self.val = val
+
+	def display_hint(self):
+		return 'enum'
+
+	def to_string(self):
+		type = self.val.type
+		if type.sizeof == 1:
+			return 'cast(' + str(type) + ')' + str(self.val.address.cast(lookup_type("ubyte").pointer()).dereference())
+		elif type.sizeof == 2:
+			return 'cast(' + str(type) + ')' + str(self.val.address.cast(lookup_type("ushort").pointer()).dereference())
+		elif type.sizeof == 4:
+			return 'cast(' + str(type) + ')' + str(self.val.address.cast(lookup_type("uint").pointer()).dereference())
+		elif type.sizeof == 8:
+			return 'cast(' + str(type) + ')' + str(self.val.address.cast(lookup_type("ulong").pointer()).dereference())
+		else:
+			return 'cast(' + str(type) + ')<unknown>'
+
+class DRegisteredEnumPrinter(object):
+	"prints an IDE registered D enum value"
+
+	def __init__(self, val, register):
+		self.val = val
+		self.register = register
+
+	def display_hint(self):
+		return 'enum'
+
+	def to_string(self):
+		type = str(self.val.type)
+		basetype = self.register.lookup_basetype()
+		if self.val.address is not None:
+			val = int(self.val.address.cast(basetype.pointer()).dereference())
+		else:
+			val = int(self.val.cast(basetype))
+		moduleend = type.rfind('.')
+		if moduleend != -1:
+			type = type[(moduleend + 1):]
+		names = self.register.name_of(val)
+		if names is not None:
+			return ' | '.join(type + '.' + named for named in names) + ' (' + str(val) + ')'
+		return 'cast(' + type + ')' + str(val)
+
+def build_enum_printer(objfile):
+	def dlang_enum_printer(v):
+		if v.type.code == gdb.TYPE_CODE_ENUM and owns_type(objfile, v.type):
+			registered = registeredEnums.get(v.type.name, None)
+			if registered != None:
+				return DRegisteredEnumPrinter(v, registered)
+			elif v.format_string(raw = True) == "<incomplete type>":
+				return DFallbackEnumPrinter(v)
+		return None
+	return dlang_enum_printer
+
+# sections druntime collects the ModuleInfo of each D module in
+d_module_sections = set([b'__minfo', b'.minfo', b'__minfodata'])
+# symbols only present in D programs and druntime
+d_symbols = ["D main", "_Dmain", "_d_run_main"]
+
+def elf_section_names(filename):
+	"returns the section names of an ELF file or None if it is not one"
+	with open(filename, 'rb') as f:
+		ident = f.read(16)
+		if len(ident) < 16 or ident[:4] != b'\x7fELF':
+			return None
+		order = '<' if ident[5] == 1 else '>'
+		if ident[4] == 2:
+			shoff, shentsize, shnum, shstrndx = struct.unpack(order + '24xQ10xHHH', f.read(48))
+			section_format = order + 'I20xQQ'
+		else:
+			shoff, shentsize, shnum, shstrndx = struct.unpack(order + '16xI10xHHH', f.read(36))
+			section_format = order + 'I12xII'
+		if shoff == 0 or shstrndx >= shnum:
+			return None
+		f.seek(shoff)
+		headers = f.read(shnum * shentsize)
+		sections = [struct.unpack_from(section_format, headers, i * shentsize) for i in range(shnum)]
+		_, strtab_offset, strtab_size = sections[shstrndx]
+		f.seek(strtab_offset)
+		strtab = f.read(strtab_size)
+		return set(strtab[name:strtab.find(b'\0', name)] for name, _, _ in sections)
+
+def is_d_objfile(objfile):
+	"checks if an objfile contains D code by its ModuleInfo sections or D specific symbols"
+	try:
+		sections = elf_section_names(objfile.filename)
+		if sections is not None and not sections.isdisjoint(d_module_sections):
+			return True
+	except (IOError, OSError, struct.error):
+		pass
+	if hasattr(objfile, 'lookup_global_symbol'):
+		for symbol in d_symbols:
+			if objfile.lookup_global_symbol(symbol) is not None:
+				return True
+	return False
+
+def register_d_printers(objfile):
+	"registers the D printers for an objfile once if it contains D code"
+	if objfile is None or not objfile.is_valid() or objfile.filename is None:
+		return
+	if any(getattr(printer, 'name', None) == 'dlang_utils' for printer in objfile.pretty_printers):
+		return
+	if always_load_d_printers or is_d_objfile(objfile):
+		gdb.printing.register_pretty_printer(objfile, build_pretty_printer(objfile))
+		gdb.printing.register_pretty_printer(objfile, build_enum_printer(objfile))
+
+if gdb.current_objfile() is not None:
+	# auto-loaded for a specific objfile, which is D code by definition
+	gdb.printing.register_pretty_printer(gdb.current_objfile(), build_pretty_printer(gdb.current_objfile()))
+	gdb.printing.register_pretty_printer(gdb.current_objfile(), build_enum_printer(gdb.current_objfile()))
+else:
+	for objfile in gdb.objfiles():
+		register_d_printers(objfile)
+	gdb.events.new_objfile.connect(lambda event: register_d_printers(event.new_objfile))
+
+# handle id -> (gdb.Value, first child) of subtrees left out by dlang-json, valid until the inferior resumes
+jsonHandles = {}
+lastJsonHandle = 0
+
+def clear_json_handles(event):
+	jsonHandles.clear()
+
+gdb.events.cont.connect(clear_json_handles)
+gdb.events.exited.connect(clear_json_handles)
+
+def value_json(name, value, depth, max_children, offset = 0):
+	"converts a value to a JSON compatible dict using the registered pretty printers, starting at child `offset`"
+	node = { "name": name }
+	if not isinstance(value, gdb.Value):
+		node["value"] = str(value)
+		return node
+
+	node["type"] = str(value.type)
+	try:
+		printer = gdb.default_visualizer(value)
+		if printer is not None:
+			summary = printer.to_string() if hasattr(printer, 'to_string') else None
+			if summary is not None:
+				node["value"] = str(summary)
+			children = printer.children() if hasattr(printer, 'children') else None
+			if children is not None and hasattr(printer, 'display_hint') and printer.display_hint() == 'map':
+				children = map_children(children)
+		else:
+			node["value"] = str(value)
+			children = raw_children(value)
+
+		if children is None:
+			return node
+
+		if depth <= 0:
+			# only check if there are any children without decoding them
+			for _ in children:
+				node["handle"] = add_json_handle(value, 0)
+				break
+			return node
+
+		if offset:
+			node["offset"] = offset
+		node["children"] = []
+		for index, (child_name, child) in enumerate(children):
+			if index < offset:
+				continue
+			if len(node["children"]) >= max_children:
+				node["truncated"] = True
+				node["handle"] = add_json_handle(value, index)
+				break
+			node["children"].append(value_json(child_name, child, depth - 1, max_children))
+	except gdb.error as e:
+		# errors while decoding the children only end this node, not the whole document
+		node["error"] = str(e)
+	return node
+
+def map_children(children):
+	"pairs up the alternating key, value children of printers with a 'map' display hint"
+	children = iter(children)
+	for _, key in children:
+		_, value = next(children)
+		yield str(key), value
+
+def raw_children(value):
+	"returns an iterator over the fields or elements of values without a pretty printer or None"
+	type = value.type.strip_typedefs()
+	if type.code == gdb.TYPE_CODE_ARRAY:
+		low, high = type.range()
+		return ((str(i), value[i]) for i in range(low, high + 1))
+	elif type.code in (gdb.TYPE_CODE_STRUCT, gdb.TYPE_CODE_UNION):
+		return ((field.name, value.cast(field.type) if field.is_base_class else value[field]) for field in type.fields() if not field.artificial)
+	return None
+
+def add_json_handle(value, offset):
+	"returns a handle expanding value starting at its child `offset`"
+	global lastJsonHandle
+	lastJsonHandle += 1
+	jsonHandles[lastJsonHandle] = (value, offset)
+	return lastJsonHandle
+
+class DlangJson(gdb.Command):
+	"""Print a D value and its children as a single JSON document (done by IDE)
+
+Usage: dlang-json [expression] [--depth N] [--max-children M]
+       dlang-json --handle H [--depth N] [--max-children M]
+
+Subtrees deeper than N (default 1) or with more than M (default 100) children
+get a "handle" which can be expanded with --handle until the program resumes.
+The handle of a truncated node continues with the children that were left out."""
+
+	def __init__(self):
+		super (DlangJson, self).__init__("dlang-json", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		args = gdb.string_to_argv(arg)
+		depth = 1
+		max_children = 100
+		handle = None
+		expression = []
+		i = 0
+		while i < len(args):
+			if args[i] in ('--depth', '--max-children', '--handle') and i + 1 < len(args):
+				if args[i] == '--depth':
+					depth = int(args[i + 1])
+				elif args[i] == '--max-children':
+					max_children = int(args[i + 1])
+				else:
+					handle = int(args[i + 1])
+				i += 2
+			else:
+				expression.append(args[i])
+				i += 1
+
+		offset = 0
+		if handle is not None:
+			if handle not in jsonHandles:
+				raise gdb.GdbError("Unknown or expired handle: " + str(handle))
+			value, offset = jsonHandles[handle]
+			name = str(handle)
+		elif expression:
+			name = ' '.join(expression)
+			value = gdb.parse_and_eval(name)
+		else:
+			raise gdb.GdbError("Usage: dlang-json [expression] [--depth N] [--max-children M]")
+
+		gdb.write(json.dumps(value_json(name, value, depth, max_children, offset), separators = (',', ':')) + "\n")
+DlangJson()
+
+def slice_of(value):
+	"returns (address, length, element type) of a slice or static array"
+	type = value.type.strip_typedefs()
+	if type.code == gdb.TYPE_CODE_ARRAY:
+		low, high = type.range()
+		return int(value.address), high - low + 1, type.target().strip_typedefs()
+	ptr = value['ptr']
+	return int(ptr), int(value['length']), ptr.type.strip_typedefs().target().strip_typedefs()
+
+def element_kind(type):
+	"returns 'char', 'int', 'float' or 'bool' for the scalar element types dlang-find can search"
+	if type.name in ('char', 'wchar', 'dchar', 'char8_t', 'char16_t', 'char32_t'):
+		return 'char'
+	elif type.code in (gdb.TYPE_CODE_INT, gdb.TYPE_CODE_ENUM, gdb.TYPE_CODE_CHAR, gdb.TYPE_CODE_VOID):
+		return 'int'
+	elif type.code == gdb.TYPE_CODE_FLT:
+		return 'float'
+	elif type.code == gdb.TYPE_CODE_BOOL:
+		return 'bool'
+	return None
+
+def find_needles(kind, item_size, text, order):
+	"encodes the searched value or substring as it is stored in memory, returns a list of byte patterns"
+	integer_formats = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+	if kind == 'char' or (kind == 'int' and item_size == 1 and not re.match(r'^-?(0x[0-9a-fA-F]+|[0-9]+)$', text)):
+		if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+			text = text[1:-1]
+		encoding = { 1: 'utf-8', 2: 'utf-16', 4: 'utf-32' }[item_size]
+		if item_size > 1:
+			encoding += '-le' if order == '<' else '-be'
+		return [text.encode(encoding)]
+	elif kind == 'int':
+		try:
+			value = int(text, 0)
+		except ValueError:
+			raise ValueError('%s is not an integer' % text)
+		# masking makes negative values match their two's complement representation
+		value &= (1 << (8 * item_size)) - 1
+		return [struct.pack(order + integer_formats[item_size], value)]
+	elif kind == 'float':
+		try:
+			value = float(text)
+		except ValueError:
+			raise ValueError('%s is not a floating point number' % text)
+		format = order + { 4: 'f', 8: 'd' }[item_size]
+		if value == 0:
+			return [struct.pack(format, 0.0), struct.pack(format, -0.0)]
+		return [struct.pack(format, value)]
+	elif kind == 'bool':
+		if text not in ('true', 'false'):
+			raise ValueError('%s is not true or false' % text)
+		return [struct.pack('B', 1 if text == 'true' else 0)]
+	raise ValueError('cannot search %s elements of size %d' % (kind, item_size))
+
+def find_in_chunks(read, size, needle, alignment, limit):
+	"""returns up to limit byte offsets aligned to alignment at which needle occurs
+
+	read(offset, length) is called with chunks of scan_chunk_size bytes, the end
+	of the previous chunk is kept so matches crossing chunk borders are found."""
+	matches = []
+	overlap = (len(needle) - 1 + alignment - 1) // alignment * alignment
+	chunk_size = max(alignment, scan_chunk_size - scan_chunk_size % alignment)
+	offset = 0
+	min_match = 0
+	tail = b''
+	while offset < size and len(matches) < limit:
+		chunk = read(offset, min(chunk_size, size - offset))
+		data = tail + chunk
+		base = offset - len(tail)
+		pos = data.find(needle)
+		while pos != -1 and len(matches) < limit:
+			if pos % alignment == 0 and base + pos >= min_match:
+				matches.append(base + pos)
+			pos = data.find(needle, pos + 1)
+		offset += len(chunk)
+		# matches starting before this were fully contained in the scanned data
+		min_match = offset - len(needle) + 1
+		tail = data[len(data) - overlap:] if overlap else b''
+	return matches
+
+class DlangFind(gdb.Command):
+	"""Find the indices of a value or substring in a D slice without expanding it
+
+Usage: dlang-find [slice expression] [value|substring] [--limit N]
+
+Works on char, integral, floating point and bool slices and prints up to N (default 100) indices."""
+
+	def __init__(self):
+		super (DlangFind, self).__init__("dlang-find", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		args = gdb.string_to_argv(arg)
+		limit = 100
+		if len(args) >= 2 and args[-2] == '--limit':
+			try:
+				limit = int(args[-1])
+			except ValueError:
+				raise gdb.GdbError("--limit %s is not a number" % args[-1])
+			args = args[:-2]
+		if len(args) != 2:
+			raise gdb.GdbError("Usage: dlang-find [slice expression] [value|substring] [--limit N]")
+
+		address, length, type = slice_of(gdb.parse_and_eval(args[0]))
+		item_size = max(1, type.sizeof)
+		kind = element_kind(type)
+		if kind is None:
+			raise gdb.GdbError("Cannot search slices of " + str(type))
+		invalid = validate_slice(address, length, item_size)
+		if invalid is not None:
+			raise gdb.GdbError(invalid)
+
+		try:
+			needles = find_needles(kind, item_size, args[1], byte_order())
+		except ValueError as e:
+			raise gdb.GdbError(str(e))
+		read = lambda offset, size: read_memory(address + offset, size)
+		matches = []
+		for needle in needles:
+			# one more than shown tells whether the search was cut short
+			matches.extend(find_in_chunks(read, length * item_size, needle, item_size, limit + 1))
+		matches = sorted(matches)
+		for offset in matches[:limit]:
+			gdb.write('[%d] @ 0x%x\n' % (offset // item_size, address + offset))
+		if len(matches) > limit:
+			gdb.write('stopped after %d matches\n' % limit)
+		else:
+			gdb.write('%d matches\n' % len(matches))
+DlangFind()
+
+def is_signed(type):
+	if hasattr(type, 'is_signed'):
+		return type.is_signed
+	# Type.is_signed needs GDB 12, guess from the D type names before that
+	name = type.name or ''
+	return not (name.startswith('u') or name in ('bool', 'size_t', 'char', 'wchar', 'dchar'))
+
+def array_typecode(type):
+	"returns the array module typecode for numeric element types or None"
+	kind = element_kind(type)
+	if kind in ('int', 'bool') and type.sizeof in (1, 2, 4, 8):
+		typecode = { 1: 'b', 2: 'h', 4: 'i', 8: 'q' }[type.sizeof]
+		return typecode if kind == 'int' and is_signed(type) else typecode.upper()
+	elif kind == 'float' and type.sizeof in (4, 8):
+		return { 4: 'f', 8: 'd' }[type.sizeof]
+	return None
+
+class DSliceStats(object):
+	"min, max, mean, NaN and infinity counts and power of two magnitude histogram, updated chunk by chunk"
+
+	def __init__(self):
+		self.count = 0
+		self.nan = 0
+		self.inf = 0
+		self.negative_inf = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+		self.histogram = collections.Counter()
+
+	def add(self, values):
+		if not values:
+			return
+		self.count += len(values)
+		try:
+			total = math.fsum(values)
+		except (OverflowError, ValueError):
+			# ValueError for +inf and -inf in one chunk, OverflowError for finite sums out of range
+			total = float('nan')
+		if math.isinf(total) or total != total:
+			# only filter element by element if there is a NaN, an infinity or an overflow in the chunk
+			numbers = [x for x in values if x == x]
+			self.nan += len(values) - len(numbers)
+			values = numbers
+			if not values:
+				return
+			finite = [x for x in values if not math.isinf(x)]
+			infinite = len(values) - len(finite)
+			if infinite:
+				positive = sum(1 for x in values if x > 0 and math.isinf(x))
+				self.inf += positive
+				self.negative_inf += infinite - positive
+			try:
+				total = math.fsum(finite)
+			except OverflowError:
+				total = sum(finite)
+		self.total += total
+		low = min(values)
+		high = max(values)
+		self.min = low if self.min is None else min(self.min, low)
+		self.max = high if self.max is None else max(self.max, high)
+		self.histogram.update(map(magnitude_bucket, values))
+
+	def mean(self):
+		if self.inf and self.negative_inf:
+			return float('nan')
+		elif self.inf:
+			return float('inf')
+		elif self.negative_inf:
+			return float('-inf')
+		numbers = self.count - self.nan
+		return self.total / numbers if numbers else float('nan')
+
+	def summary(self):
+		return '{min=%s, max=%s, mean=%s}' % (self.min, self.max, self.mean())
+
+	def lines(self):
+		yield 'count: %d' % self.count
+		yield 'min: %s' % self.min
+		yield 'max: %s' % self.max
+		yield 'mean: %s' % self.mean()
+		yield 'nan: %d' % self.nan
+		yield 'inf: %d, -inf: %d' % (self.inf, self.negative_inf)
+		yield 'histogram:'
+		for bucket in sorted(self.histogram, key = magnitude_order):
+			yield '  %s: %d' % (magnitude_range(bucket), self.histogram[bucket])
+
+def magnitude_bucket(x):
+	"returns (sign, e) with 2^(e-1) <= |x| < 2^e, e is inf for infinite values"
+	if x == 0:
+		return (0, 0)
+	sign = 1 if x > 0 else -1
+	if math.isinf(x):
+		return (sign, x * sign)
+	return (sign, math.frexp(x)[1])
+
+def magnitude_order(bucket):
+	sign, exponent = bucket
+	return (sign, sign * exponent)
+
+def power_of_two(exponent):
+	try:
+		return '%g' % math.ldexp(1, exponent)
+	except OverflowError:
+		# the upper bound of the bucket of values >= 2^1023 like double.max is no double anymore
+		return '2^%d' % exponent
+
+def magnitude_range(bucket):
+	sign, exponent = bucket
+	if sign == 0:
+		return '0'
+	elif math.isinf(exponent):
+		return 'inf' if sign > 0 else '-inf'
+	elif sign > 0:
+		return '[%s, %s)' % (power_of_two(exponent - 1), power_of_two(exponent))
+	else:
+		return '(-%s, -%s]' % (power_of_two(exponent), power_of_two(exponent - 1))
+
+def slice_stats(read, length, typecode, order):
+	"computes DSliceStats over a slice reading and decoding it in chunks of scan_chunk_size bytes"
+	item_size = array.array(typecode).itemsize
+	chunk_size = max(item_size, scan_chunk_size - scan_chunk_size % item_size)
+	swap = order != ('<' if sys.byteorder == 'little' else '>')
+	stats = DSliceStats()
+	size = length * item_size
+	for offset in range(0, size, chunk_size):
+		values = array.array(typecode)
+		values.frombytes(read(offset, min(chunk_size, size - offset)))
+		if swap:
+			values.byteswap()
+		stats.add(values)
+	return stats
+
+class DlangStatsOf(gdb.Command):
+	"""Print min, max, mean, NaN count and a histogram of a numeric D slice
+
+Usage: dlang-stats-of [slice expression]
+
+The slice is read in chunks, so this works on slices of any size."""
+
+	def __init__(self):
+		super (DlangStatsOf, self).__init__("dlang-stats-of", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		if not arg.strip():
+			raise gdb.GdbError("Usage: dlang-stats-of [slice expression]")
+
+		address, length, type = slice_of(gdb.parse_and_eval(arg))
+		typecode = array_typecode(type)
+		if typecode is None:
+			raise gdb.GdbError("Cannot compute statistics of " + str(type))
+		invalid = validate_slice(address, length, type.sizeof)
+		if invalid is not None:
+			raise gdb.GdbError(invalid)
+
+		stats = slice_stats(lambda offset, size: read_memory(address + offset, size), length, typecode, byte_order())
+		for line in stats.lines():
+			gdb.write(line + "\n")
+DlangStatsOf()
+
+gc_page_size = 4096
+# qualified names of druntime's GC instance, newer druntime moved the GC into core.internal
+gc_instance_names = ['core.internal.gc.proxy.instance', 'gc.proxy.instance']
+# Bins of druntime versions before 2.097, used if the Bins enum is not in the debug info
+default_gc_bins = [('B_16', 0), ('B_32', 1), ('B_64', 2), ('B_128', 3), ('B_256', 4), ('B_512', 5),
+	('B_1024', 6), ('B_2048', 7), ('B_PAGE', 8), ('B_PAGEPLUS', 9), ('B_FREE', 10)]
+
+DGcPool = collections.namedtuple('DGcPool', ['base', 'npages', 'pagetable', 'large', 'freebits', 'finals', 'struct_finals', 'appendable'])
+
+def d_qualified_name(mangled):
+	"returns 'a.b.C' for mangled identifier lists like 3a1b1C or None for other manglings"
+	parts = []
+	i = 0
+	while i < len(mangled):
+		j = i
+		while j < len(mangled) and mangled[j].isdigit():
+			j += 1
+		if j == i:
+			return None
+		length = int(mangled[i:j])
+		parts.append(mangled[j:j + length])
+		i = j + length
+	if i != len(mangled) or not parts or any(part.startswith('__T') for part in parts):
+		return None
+	return '.'.join(parts)
+
+def gc_bins(enumerators):
+	"returns ({Bins value: block size}, B_PAGE, B_PAGEPLUS) from the (name, value) pairs of druntime's Bins enum"
+	sizes = {}
+	values = {}
+	for name, value in enumerators:
+		name = name.split('.')[-1]
+		values[name] = value
+		if name[2:].isdigit():
+			sizes[value] = int(name[2:])
+	return sizes, values['B_PAGE'], values['B_PAGEPLUS']
+
+def read_gc_bits(read, data, first, count, word, order):
+	"""reads bits [first, first + count) of GCBits data, first being a multiple of the
+	word size in bits, returns whole words as bytes in little endian bit order"""
+	bits = word * 8
+	raw = read(data + first // 8, (count + bits - 1) // bits * word)
+	if order == '>':
+		raw = b''.join(raw[i:i + word][::-1] for i in range(0, len(raw), word))
+	return raw
+
+def bit_count(x):
+	return bin(x).count('1')
+
+class DGcTypeNames(object):
+	"names the types of finalized GC blocks from their vtable or TypeInfo, cached per address"
+
+	def __init__(self, read, word, order):
+		self.read = read
+		self.word = word
+		self.format = order + ('Q' if word == 8 else 'I')
+		self.names = {}
+
+	def __call__(self, kind, address):
+		name = self.names.get((kind, address))
+		if name is None:
+			try:
+				if kind == 'class':
+					# vtbl[0] is the TypeInfo_Class, its name follows vtbl, monitor and m_init
+					name = self.read_string(self.read_word(address) + 4 * self.word)
+				else:
+					# the name of TypeInfo_Struct follows vtbl and monitor, newer druntime keeps it mangled
+					name = self.read_string(address + 2 * self.word)
+					if name and name[0] == 'S':
+						name = d_qualified_name(name[1:]) or name
+			except gdb.MemoryError:
+				name = None
+			name = name or '<unknown %s>' % kind
+			self.names[(kind, address)] = name
+		return name
+
+	def read_word(self, address):
+		return struct.unpack(self.format, self.read(address, self.word))[0]
+
+	def read_string(self, address):
+		length = self.read_word(address)
+		if length > 4096:
+			return None
+		return self.read(self.read_word(address + self.word), length).decode('utf-8', 'replace')
+
+class DHeapStats(object):
+	"allocated GC blocks and bytes by size class and by type, updated pool chunk by pool chunk"
+
+	def __init__(self):
+		self.blocks = collections.Counter()
+		self.bytes = collections.Counter()
+		self.type_blocks = collections.Counter()
+		self.type_bytes = collections.Counter()
+		self.pools = 0
+		self.pages = 0
+		self.free_pages = 0
+
+	def add(self, size_class, count, size):
+		"size_class is (0, bin size) for small and (1, power of two) for large blocks"
+		self.blocks[size_class] += count
+		self.bytes[size_class] += count * size
+
+	def add_type(self, name, count, size):
+		self.type_blocks[name] += count
+		self.type_bytes[name] += count * size
+
+	def lines(self, top):
+		yield 'pools: %d, pages: %d (%d free)' % (self.pools, self.pages, self.free_pages)
+		yield '%-16s %12s %16s' % ('size class', 'blocks', 'bytes')
+		for size_class in sorted(self.blocks):
+			large, size = size_class
+			label = ('large <= %d' if large else '%d') % size
+			yield '%-16s %12d %16d' % (label, self.blocks[size_class], self.bytes[size_class])
+		yield '%-16s %12d %16d' % ('total', sum(self.blocks.values()), sum(self.bytes.values()))
+		if self.type_blocks:
+			yield ''
+			yield '%-48s %12s %16s' % ('type', 'blocks', 'bytes')
+			for name, size in self.type_bytes.most_common(top):
+				yield '%-48s %12d %16d' % (name, self.type_blocks[name], size)
+
+def scan_gc_pool(read, pool, bins, word, order, stats, type_name=None):
+	"""adds the allocated blocks of a GC pool to stats, reading heap_scan_pages pages at once
+
+	type_name(kind, address) names the type of blocks with the FINALIZE (kind 'class',
+	address of the vtable) or STRUCTFINAL (kind 'struct', address of the TypeInfo)
+	attribute, None skips the type breakdown."""
+	stats.pools += 1
+	stats.pages += pool.npages
+	if pool.large:
+		scan_large_gc_pool(read, pool, bins, word, order, stats, type_name)
+	else:
+		scan_small_gc_pool(read, pool, bins, word, order, stats, type_name)
+
+def scan_small_gc_pool(read, pool, bins, word, order, stats, type_name):
+	sizes = bins[0]
+	# small pools have a bit per 16 bytes, blocks of bin b start at the bits of block_masks[b]
+	page_bits = gc_page_size >> 4
+	page_bytes = page_bits // 8
+	block_masks = dict((bin, sum(1 << (k * size >> 4) for k in range(gc_page_size // size))) for bin, size in sizes.items())
+	format = order + ('Q' if word == 8 else 'I')
+	for first in range(0, pool.npages, heap_scan_pages):
+		count = min(heap_scan_pages, pool.npages - first)
+		pagetable = bytearray(read(pool.pagetable + first, count))
+		bits = [read_gc_bits(read, data, first * page_bits, count * page_bits, word, order) if data else None
+			for data in (pool.freebits, pool.finals if type_name else 0, pool.struct_finals if type_name else 0)]
+		page_int = lambda raw, i: int.from_bytes(raw[i * page_bytes:(i + 1) * page_bytes], 'little') if raw else 0
+		for i, bin in enumerate(pagetable):
+			size = sizes.get(bin)
+			if size is None:
+				stats.free_pages += 1
+				continue
+			allocated = ~page_int(bits[0], i) & block_masks[bin]
+			blocks = bit_count(allocated)
+			stats.add((0, size), blocks, size)
+			if type_name is None or not blocks:
+				continue
+			finals = page_int(bits[1], i)
+			typed = allocated & (finals | page_int(bits[2], i))
+			if blocks > bit_count(typed):
+				stats.add_type('<untyped>', blocks - bit_count(typed), size)
+			if not typed:
+				continue
+			data = read(pool.base + (first + i) * gc_page_size, gc_page_size)
+			while typed:
+				low = typed & -typed
+				typed ^= low
+				offset = (low.bit_length() - 1) << 4
+				if finals & low:
+					name = type_name('class', struct.unpack_from(format, data, offset)[0])
+				else:
+					# the TypeInfo of small blocks is stored in their last word
+					name = type_name('struct', struct.unpack_from(format, data, offset + size - word)[0])
+				stats.add_type(name, 1, size)
+
+def scan_large_gc_pool(read, pool, bins, word, order, stats, type_name):
+	page, page_plus = bins[1], bins[2]
+	format = order + ('Q' if word == 8 else 'I')
+	block = None
+	def flush(block):
+		pages, name, struct_address = block
+		size = pages * gc_page_size
+		stats.add((1, 1 << (size - 1).bit_length()), 1, size)
+		if struct_address is not None:
+			# structs which aren't array elements keep their TypeInfo in the last word of the block
+			name = type_name('struct', struct.unpack(format, read(struct_address + size - word, word))[0])
+		if name is not None:
+			stats.add_type(name, 1, size)
+	for first in range(0, pool.npages, heap_scan_pages):
+		count = min(heap_scan_pages, pool.npages - first)
+		pagetable = bytearray(read(pool.pagetable + first, count))
+		# large pools have a bit per page, read from the word containing the first one
+		aligned = first - first % (word * 8)
+		finals, struct_finals, appendable = [int.from_bytes(read_gc_bits(read, data, aligned, first + count - aligned, word, order), 'little') >> (first - aligned) if data else 0
+			for data in (pool.finals if type_name else 0, pool.struct_finals if type_name else 0, pool.appendable if type_name else 0)]
+		for i, bin in enumerate(pagetable):
+			if bin == page_plus and block is not None:
+				block[0] += 1
+				continue
+			if block is not None:
+				flush(block)
+				block = None
+			if bin != page:
+				stats.free_pages += 1
+				continue
+			name = None
+			struct_address = None
+			if type_name is not None:
+				address = pool.base + (first + i) * gc_page_size
+				if (finals >> i) & 1:
+					name = type_name('class', struct.unpack(format, read(address, word))[0])
+				elif (struct_finals >> i) & 1 and (appendable >> i) & 1:
+					# large arrays store their length first and the element TypeInfo after it
+					name = type_name('struct', struct.unpack(format, read(address + word, word))[0])
+				elif (struct_finals >> i) & 1:
+					# read from the end of the block once its size is known
+					struct_address = address
+				else:
+					name = '<untyped>'
+			block = [1, name, struct_address]
+	if block is not None:
+		flush(block)
+
+def find_gc_pools():
+	"returns the DGcPools and gc_bins of druntime's conservative GC instance"
+	symbol = None
+	for name in gc_instance_names:
+		symbol = gdb.lookup_global_symbol(name) or gdb.lookup_static_symbol(name)
+		if symbol is not None:
+			break
+	if symbol is None:
+		raise gdb.GdbError("GC instance not found, druntime needs to be built with debug info")
+	word = lookup_type("size_t").sizeof
+	names = DGcTypeNames(read_memory, word, byte_order())
+	interface = int(symbol.value())
+	if not interface:
+		raise gdb.GdbError("The GC is not initialized")
+	# the instance is a GC interface reference, the Interface in its vtable has the offset to the object
+	address = interface - names.read_word(names.read_word(names.read_word(interface)) + 3 * word)
+	class_name = names('class', names.read_word(address))
+	if not class_name.endswith('.ConservativeGC'):
+		raise gdb.GdbError("Only the conservative GC is supported, the GC is " + class_name)
+	try:
+		gc_type = lookup_type(class_name)
+	except gdb.error:
+		raise gdb.GdbError("No debug info for %s, druntime needs to be built with debug info" % class_name)
+
+	pooltable = gdb.Value(address).cast(gc_type.pointer()).dereference()['gcx'].dereference()['pooltable']
+	pools = []
+	enumerators = None
+	for i in range(int(pooltable['npools'])):
+		pool = pooltable['pools'][i].dereference()
+		pools.append(DGcPool(int(pool['baseAddr']), int(pool['npages']), int(pool['pagetable']), bool(pool['isLargeObject']),
+			int(pool['freebits']['data']), int(pool['finals']['data']), int(pool['structFinals']['data']),
+			int(pool['appendable']['data'])))
+		bins_type = pool['pagetable'].type.strip_typedefs().target().strip_typedefs()
+		if bins_type.code == gdb.TYPE_CODE_ENUM:
+			enumerators = [(field.name, field.enumval) for field in bins_type.fields()]
+	if enumerators is None:
+		try:
+			bins_type = lookup_type(class_name[:-len('ConservativeGC')] + 'Bins')
+			enumerators = [(field.name, field.enumval) for field in bins_type.fields()]
+		except gdb.error:
+			enumerators = default_gc_bins
+	return pools, gc_bins(enumerators)
+
+class DlangHeap(gdb.Command):
+	"""Print the allocated blocks and bytes of the D GC heap by size class
+
+Usage: dlang-heap [--types] [--top N]
+
+Reads the pools of druntime's conservative GC, which needs druntime debug info.
+With --types blocks of classes and of structs with destructors are also grouped
+by type and the N (default 20) types using the most memory are shown."""
+
+	def __init__(self):
+		super (DlangHeap, self).__init__("dlang-heap", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		args = gdb.string_to_argv(arg)
+		types = False
+		top = 20
+		i = 0
+		while i < len(args):
+			if args[i] == '--types':
+				types = True
+				i += 1
+			elif args[i] == '--top' and i + 1 < len(args):
+				top = int(args[i + 1])
+				i += 2
+			else:
+				raise gdb.GdbError("Usage: dlang-heap [--types] [--top N]")
+
+		pools, bins = find_gc_pools()
+		word = lookup_type("size_t").sizeof
+		order = byte_order()
+		stats = DHeapStats()
+		type_name = DGcTypeNames(read_memory, word, order) if types else None
+		for pool in pools:
+			scan_gc_pool(read_memory, pool, bins, word, order, stats, type_name)
+		for line in stats.lines(top):
+			gdb.write(line + "\n")
+DlangHeap()
+
+# qualified names of druntime's thread class, whose static members hold the thread and context lists
+thread_class_names = ['core.thread.threadbase.ThreadBase', 'core.thread.osthread.Thread', 'core.thread.Thread']
+# words pushed by fiber_switchContext between the saved stack pointer and its return address
+saved_ip_slots = { 'x86_64': 6 }
+
+DThread = collections.namedtuple('DThread', ['address', 'id', 'name', 'daemon', 'bstack', 'tstack', 'context'])
+DFiber = collections.namedtuple('DFiber', ['context', 'bstack', 'tstack', 'within', 'thread', 'ip'])
+
+def walk_stack_contexts(read, address, size, offsets, format):
+	"yields (address, bstack, tstack, within) of a StackContext list, reading each node at once"
+	seen = set()
+	while address and address not in seen:
+		seen.add(address)
+		data = read(address, size)
+		bstack, tstack, within, next = [struct.unpack_from(format, data, offset)[0] for offset in offsets]
+		yield address, bstack, tstack, within
+		address = next
+
+def list_options(args, flags):
+	"parses --skip N, --limit N, --match TEXT and the given flags of dlang-threads and dlang-fibers"
+	options = { 'skip': 0, 'limit': 50, 'match': None }
+	i = 0
+	while i < len(args):
+		name = args[i][2:]
+		if args[i] in flags:
+			options[name] = True
+			i += 1
+		elif name in options and args[i].startswith('--') and i + 1 < len(args):
+			options[name] = args[i + 1] if name == 'match' else int(args[i + 1])
+			i += 2
+		else:
+			raise ValueError(args[i])
+	return options
+
+def page_lines(items, options, format):
+	"yields the formatted lines of the page of items selected by --skip and --limit"
+	skip = options['skip']
+	page = items[skip:skip + options['limit']]
+	for i, item in enumerate(page):
+		yield format(skip + i, item)
+	if len(page) < len(items):
+		yield 'showing %d-%d of %d, use --skip and --limit to page' % (skip, skip + len(page), len(items))
+
+def format_thread(index, thread):
+	return '#%d Thread 0x%x id 0x%x%s%s stack [0x%x, 0x%x) context 0x%x' % (index, thread.address, thread.id,
+		' "%s"' % thread.name if thread.name else '', ' daemon' if thread.daemon else '', thread.tstack, thread.bstack, thread.context)
+
+def format_fiber(index, fiber, function):
+	line = '#%d context 0x%x stack [0x%x, 0x%x) %d bytes used, %s' % (index, fiber.context, fiber.tstack, fiber.bstack,
+		fiber.bstack - fiber.tstack, 'running on Thread 0x%x' % fiber.thread if fiber.thread else 'suspended')
+	if fiber.within:
+		line += ' within 0x%x' % fiber.within
+	if fiber.ip:
+		line += ', ip 0x%x' % fiber.ip + (' in ' + function if function else '')
+	return line
+
+def field_offsets(type, names):
+	"returns the byte offsets of the named fields of a struct type"
+	offsets = dict((field.name, field.bitpos // 8) for field in type.fields() if hasattr(field, 'bitpos'))
+	return [offsets[name] for name in names]
+
+def target_arch():
+	"returns 'x86_64' for x86-64 targets not using the Windows ABI, else the architecture name"
+	try:
+		name = gdb.selected_inferior().architecture().name()
+	except (AttributeError, gdb.error):
+		name = gdb.selected_frame().architecture().name()
+	if name == 'i386:x86-64' and 'Windows' not in gdb.execute("show osabi", to_string = True):
+		return 'x86_64'
+	return name
+
+def pc_function_name(pc):
+	try:
+		block = gdb.block_for_pc(pc)
+	except RuntimeError:
+		block = None
+	while block is not None and block.function is None:
+		block = block.superblock
+	return block.function.print_name if block is not None else None
+
+class DThreadLists(object):
+	"druntime's threads and fiber contexts, read once per stop"
+
+	def __init__(self):
+		tbeg = cbeg = None
+		for class_name in thread_class_names:
+			tbeg = gdb.lookup_global_symbol(class_name + '.sm_tbeg') or gdb.lookup_static_symbol(class_name + '.sm_tbeg')
+			cbeg = gdb.lookup_global_symbol(class_name + '.sm_cbeg') or gdb.lookup_static_symbol(class_name + '.sm_cbeg')
+			if tbeg is not None and cbeg is not None:
+				break
+		if tbeg is None or cbeg is None:
+			raise gdb.GdbError("druntime thread list not found, druntime needs to be built with debug info")
+		self.functions = {}
+		self.threads = []
+		main_contexts = set()
+		running = {}
+		seen = set()
+		thread = tbeg.value()
+		while int(thread) and int(thread) not in seen:
+			seen.add(int(thread))
+			value = thread.dereference()
+			main = value['m_main']
+			name = value['m_name']
+			length = min(int(name['length']), 256)
+			try:
+				name = read_memory(int(name['ptr']), length).decode('utf-8', 'replace') if length else ''
+			except gdb.MemoryError:
+				name = '<unreadable>'
+			self.threads.append(DThread(int(thread), int(value['m_addr']), name, bool(value['m_isDaemon']),
+				int(main['bstack']), int(main['tstack']), int(value['m_curr'])))
+			main_contexts.add(int(main.address))
+			running[int(value['m_curr'])] = int(thread)
+			thread = value['next']
+
+		context_type = cbeg.type.strip_typedefs().target().strip_typedefs()
+		offsets = field_offsets(context_type, ['bstack', 'tstack', 'within', 'next'])
+		format = byte_order() + size_t_format()
+		word = struct.calcsize(format)
+		slots = saved_ip_slots.get(target_arch())
+		self.fibers = []
+		for address, bstack, tstack, within in walk_stack_contexts(read_memory, int(cbeg.value()), context_type.sizeof, offsets, format):
+			if address in main_contexts:
+				continue
+			thread = running.get(address)
+			ip = None
+			if thread is None and slots is not None and tstack:
+				try:
+					ip = struct.unpack(format, read_memory(tstack + slots * word, word))[0]
+				except gdb.MemoryError:
+					pass
+			self.fibers.append(DFiber(address, bstack, tstack, within, thread, ip))
+
+	def function(self, ip):
+		if ip not in self.functions:
+			self.functions[ip] = pc_function_name(ip) if ip else None
+		return self.functions[ip]
+
+threadLists = None
+
+def thread_lists():
+	global threadLists
+	if threadLists is None:
+		threadLists = DThreadLists()
+	return threadLists
+
+def clear_thread_lists(event):
+	global threadLists
+	threadLists = None
+
+gdb.events.cont.connect(clear_thread_lists)
+gdb.events.exited.connect(clear_thread_lists)
+gdb.events.memory_changed.connect(clear_thread_lists)
+
+class DlangThreads(gdb.Command):
+	"""List the threads registered with druntime
+
+Usage: dlang-threads [--match NAME] [--skip N] [--limit N]
+
+Shows the Thread object, thread id, name, stack bounds and current context of up
+to N (default 50) threads. The lists are read once per stop."""
+
+	def __init__(self):
+		super (DlangThreads, self).__init__("dlang-threads", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		try:
+			options = list_options(gdb.string_to_argv(arg), [])
+		except ValueError:
+			raise gdb.GdbError("Usage: dlang-threads [--match NAME] [--skip N] [--limit N]")
+		threads = [thread for thread in thread_lists().threads if options['match'] is None or options['match'] in thread.name]
+		for line in page_lines(threads, options, format_thread):
+			gdb.write(line + "\n")
+DlangThreads()
+
+class DlangFibers(gdb.Command):
+	"""List the fibers of the D program
+
+Usage: dlang-fibers [--running|--suspended] [--match FUNCTION] [--skip N] [--limit N]
+
+Walks druntime's context list and shows the context, stack bounds, state and, for
+suspended fibers on x86-64, the saved instruction pointer of up to N (default 50)
+fibers. --match keeps fibers whose saved instruction pointer is in a function
+containing FUNCTION. The lists are read once per stop, so paging is instant."""
+
+	def __init__(self):
+		super (DlangFibers, self).__init__("dlang-fibers", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		try:
+			options = list_options(gdb.string_to_argv(arg), ['--running', '--suspended'])
+		except ValueError:
+			raise gdb.GdbError("Usage: dlang-fibers [--running|--suspended] [--match FUNCTION] [--skip N] [--limit N]")
+		lists = thread_lists()
+		fibers = lists.fibers
+		if options.get('running'):
+			fibers = [fiber for fiber in fibers if fiber.thread]
+		if options.get('suspended'):
+			fibers = [fiber for fiber in fibers if not fiber.thread]
+		if options['match'] is not None:
+			fibers = [fiber for fiber in fibers if options['match'] in (lists.function(fiber.ip) or '')]
+		for line in page_lines(fibers, options, lambda index, fiber: format_fiber(index, fiber, lists.function(fiber.ip))):
+			gdb.write(line + "\n")
+DlangFibers()
+
+# sections holding global variables scanned by dlang-who-refs
+data_section_names = ['.data', '.bss', '.data.rel.ro', '__data', '__bss', '__common']
+data_section_line = re.compile(r'^\s*0x([0-9a-f]+) - 0x([0-9a-f]+) is (\S+)(?: in (.*))?$', re.MULTILINE)
+# stacks larger than this are not assumed to belong to a stack pointer
+max_stack_size = 1 << 30
+# errors of the read functions passed to scan_range_for_refs
+read_errors = (gdb.MemoryError, IOError)
+
+class DCoreFile(object):
+	"reads the memory of an ELF core file through mmap, using its PT_LOAD segments"
+
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		if self.map[:4] != b'\x7fELF':
+			raise IOError('%s is not an ELF file' % path)
+		order = '<' if self.map[5:6] == b'\x01' else '>'
+		if self.map[4:5] == b'\x02':
+			phoff, = struct.unpack_from(order + 'Q', self.map, 0x20)
+			phentsize, phnum = struct.unpack_from(order + 'HH', self.map, 0x36)
+			header = order + 'IIQQQQQQ'
+		else:
+			phoff, = struct.unpack_from(order + 'I', self.map, 0x1c)
+			phentsize, phnum = struct.unpack_from(order + 'HH', self.map, 0x2a)
+			header = order + 'IIIIIIII'
+		segments = []
+		for i in range(phnum):
+			fields = struct.unpack_from(header, self.map, phoff + i * phentsize)
+			if self.map[4:5] == b'\x02':
+				type, flags, offset, vaddr, paddr, filesz = fields[:6]
+			else:
+				type, offset, vaddr, paddr, filesz = fields[:5]
+			# PT_LOAD segments with contents, the size in memory may be larger if it wasn't dumped
+			if type == 1 and filesz:
+				segments.append((vaddr, vaddr + filesz, offset))
+		segments.sort()
+		self.starts = [segment[0] for segment in segments]
+		self.segments = segments
+
+	def read(self, address, size):
+		i = bisect.bisect_right(self.starts, address) - 1
+		if i < 0 or address + size > self.segments[i][1]:
+			raise IOError('0x%x is not in the core file' % address)
+		offset = self.segments[i][2] + address - self.segments[i][0]
+		return self.map[offset:offset + size]
+
+def find_words_in_range(data, low, high, word, order):
+	"""returns (offset, value) of the aligned words of data with low <= value < high
+
+	Candidates are found with bytes.find on the high order bytes all values in the
+	range share, so only those are decoded."""
+	typecode = 'Q' if word == 8 else 'I'
+	size = len(data) - len(data) % word
+	if order == ('<' if sys.byteorder == 'little' else '>'):
+		words = memoryview(data[:size]).cast(typecode)
+	else:
+		words = array.array(typecode)
+		words.frombytes(data[:size])
+		words.byteswap()
+	common = word
+	while common and (low >> (8 * (word - common))) != ((high - 1) >> (8 * (word - common))):
+		common -= 1
+	if not common:
+		return [(i * word, value) for i, value in enumerate(words) if low <= value < high]
+	prefix = (low >> (8 * (word - common))).to_bytes(common, 'little' if order == '<' else 'big')
+	# position of the shared bytes inside a word
+	skip = word - common if order == '<' else 0
+	matches = []
+	pos = data.find(prefix, skip)
+	while pos != -1 and pos - skip + word <= size:
+		start = pos - skip
+		if start % word:
+			pos = data.find(prefix, pos + 1)
+			continue
+		value = words[start // word]
+		if low <= value < high:
+			matches.append((start, value))
+		pos = data.find(prefix, start + word + skip)
+	return matches
+
+def scan_range_for_refs(read, start, end, low, high, word, order):
+	"returns (address, value) of the words in [start, end) pointing into [low, high), read in chunks of scan_chunk_size"
+	matches = []
+	start += -start % word
+	chunk_size = max(word, scan_chunk_size - scan_chunk_size % word)
+	for offset in range(start, end, chunk_size):
+		try:
+			data = read(offset, min(chunk_size, end - offset))
+		except read_errors:
+			continue
+		matches.extend((offset + position, value) for position, value in find_words_in_range(data, low, high, word, order))
+	return matches
+
+core_files = {}
+
+def scan_core_task(task):
+	"process pool worker of dlang-who-refs, scans one range of a core file"
+	path, start, end, low, high, word, order = task
+	core = core_files.get(path)
+	if core is None:
+		core = core_files[path] = DCoreFile(path)
+	return scan_range_for_refs(core.read, start, end, low, high, word, order)
+
+def scan_core_parallel(path, ranges, low, high, word, order, jobs):
+	"""scans ranges of a core file in core_task_size pieces on a pool of jobs processes,
+	returns the matches per range"""
+	tasks = []
+	owners = []
+	for i, (start, end) in enumerate(ranges):
+		for offset in range(start, end, core_task_size):
+			tasks.append((path, offset, min(end, offset + core_task_size), low, high, word, order))
+			owners.append(i)
+	matches = [[] for start, end in ranges]
+	pool = multiprocessing.get_context('fork').Pool(jobs)
+	try:
+		for i, found in zip(owners, pool.map(scan_core_task, tasks)):
+			matches[i].extend(found)
+	finally:
+		pool.terminate()
+	return matches
+
+def gc_block_of(pools, pagetables, bins, address):
+	"returns (start, size) of the GC block containing address or None"
+	sizes, page, page_plus = bins
+	for pool, pagetable in zip(pools, pagetables):
+		if not pool.base <= address < pool.base + pool.npages * gc_page_size:
+			continue
+		index = (address - pool.base) // gc_page_size
+		size = sizes.get(pagetable[index])
+		if size is not None:
+			page_start = pool.base + index * gc_page_size
+			return page_start + (address - page_start) // size * size, size
+		first = index
+		while first > 0 and pagetable[first] == page_plus:
+			first -= 1
+		if pagetable[first] != page:
+			return None
+		last = index + 1
+		while last < pool.npages and pagetable[last] == page_plus:
+			last += 1
+		return pool.base + first * gc_page_size, (last - first) * gc_page_size
+	return None
+
+def gc_block_is_free(read, pools, pagetables, bins, address, word, order):
+	"returns whether address is in a free block of a small GC pool, according to its freebits"
+	sizes = bins[0]
+	for pool, pagetable in zip(pools, pagetables):
+		if not pool.base <= address < pool.base + pool.npages * gc_page_size:
+			continue
+		index = (address - pool.base) // gc_page_size
+		size = sizes.get(pagetable[index])
+		if pool.large or size is None or not pool.freebits:
+			return False
+		# small pools have a freebit per 16 bytes, set for the first 16 bytes of free blocks
+		page_start = pool.base + index * gc_page_size
+		bit = (page_start + (address - page_start) // size * size - pool.base) >> 4
+		aligned = bit - bit % (word * 8)
+		try:
+			bits = read_gc_bits(read, pool.freebits, aligned, word * 8, word, order)
+		except read_errors:
+			return False
+		return bool((int.from_bytes(bits, 'little') >> (bit - aligned)) & 1)
+	return False
+
+def gc_used_ranges(pools, pagetables, bins):
+	"returns (start, end) of the runs of pages of the GC pools that are not free"
+	sizes, page, page_plus = bins
+	ranges = []
+	for pool, pagetable in zip(pools, pagetables):
+		run = None
+		for i, bin in enumerate(pagetable):
+			used = bin in sizes or bin == page or bin == page_plus
+			if used and run is None:
+				run = i
+			elif not used and run is not None:
+				ranges.append((pool.base + run * gc_page_size, pool.base + i * gc_page_size))
+				run = None
+		if run is not None:
+			ranges.append((pool.base + run * gc_page_size, pool.base + pool.npages * gc_page_size))
+	return ranges
+
+def referrer_lines(found, label, low, high, pools, pagetables, bins, is_free):
+	"""returns the lines describing the matches of a scanned range which are real referrers,
+	dropping words inside [low, high) and stale words of freed small GC blocks"""
+	lines = []
+	for referrer, value in found:
+		if low <= referrer < high:
+			continue
+		if label is None:
+			if is_free(referrer):
+				continue
+			block = gc_block_of(pools, pagetables, bins, referrer)
+			where = "GC block 0x%x (%d bytes)" % block if block else "GC pool"
+		else:
+			where = label
+		lines.append("0x%x -> 0x%x in %s" % (referrer, value, where))
+	return lines
+
+def read_pagetable(read, pool):
+	return bytearray(b''.join(read(pool.pagetable + first, min(heap_scan_pages, pool.npages - first))
+		for first in range(0, pool.npages, heap_scan_pages)))
+
+def stack_ranges(lists, stack_pointers):
+	"""returns (start, end, label) of the used parts of the thread and fiber stacks
+
+	Running stacks are scanned from the stack pointers of the threads, stacks
+	without one from the top saved in their context."""
+	bottoms = sorted([(thread.bstack, 'stack of Thread 0x%x' % thread.address) for thread in lists.threads] +
+		[(fiber.bstack, 'stack of fiber context 0x%x' % fiber.context) for fiber in lists.fibers])
+	ranges = []
+	used = set()
+	for sp in stack_pointers:
+		i = bisect.bisect_right(bottoms, (sp, ''))
+		if i < len(bottoms) and bottoms[i][0] - sp < max_stack_size:
+			ranges.append((sp, bottoms[i][0], bottoms[i][1]))
+			used.add(bottoms[i][0])
+	for thread in lists.threads:
+		if thread.bstack not in used and thread.tstack:
+			ranges.append((thread.tstack, thread.bstack, 'stack of Thread 0x%x' % thread.address))
+	for fiber in lists.fibers:
+		if fiber.bstack not in used and fiber.tstack:
+			ranges.append((fiber.tstack, fiber.bstack, 'stack of fiber context 0x%x' % fiber.context))
+	return ranges
+
+def thread_stack_pointers():
+	"returns the stack pointers of all threads of the inferior, keeping the selected thread and frame"
+	selected = gdb.selected_thread()
+	try:
+		frame = gdb.selected_frame()
+	except gdb.error:
+		frame = None
+	pointers = []
+	try:
+		for thread in gdb.selected_inferior().threads():
+			thread.switch()
+			pointers.append(int(gdb.parse_and_eval('$sp')))
+	finally:
+		if selected is not None:
+			selected.switch()
+		# switching threads selects their innermost frame
+		if frame is not None and frame.is_valid():
+			frame.select()
+	return pointers
+
+def data_section_ranges():
+	"returns (start, end, label) of the sections holding global variables"
+	files = gdb.execute("info files", to_string = True)
+	main = gdb.current_progspace().filename
+	return [(int(start, 16), int(end, 16), 'section %s of %s' % (name, objfile or main))
+		for start, end, name, objfile in data_section_line.findall(files) if name in data_section_names]
+
+class DlangWhoRefs(gdb.Command):
+	"""Find the words pointing into the GC block containing an address
+
+Usage: dlang-who-refs [address expression] [--size N] [--limit N] [--core PATH] [--jobs N]
+
+Scans the allocated blocks of the GC pools, the thread and fiber stacks and the data
+sections in chunks for aligned words pointing into the block and prints up to
+N (default 100) of them with the block, stack or section they are in. --size
+looks for pointers into [address, address + N) instead of the GC block. --core
+reads the memory by mapping PATH, the core file being debugged, which
+also allows splitting the scan across N processes with --jobs."""
+
+	def __init__(self):
+		super (DlangWhoRefs, self).__init__("dlang-who-refs", gdb.COMMAND_DATA)
+
+	def invoke(self, arg, from_tty):
+		usage = "Usage: dlang-who-refs [address expression] [--size N] [--limit N] [--core PATH] [--jobs N]"
+		args = gdb.string_to_argv(arg)
+		options = { '--size': None, '--limit': 100, '--core': None, '--jobs': 1 }
+		expression = []
+		i = 0
+		while i < len(args):
+			if args[i] in options and i + 1 < len(args):
+				options[args[i]] = args[i + 1] if args[i] == '--core' else int(args[i + 1], 0)
+				i += 2
+			else:
+				expression.append(args[i])
+				i += 1
+		if not expression:
+			raise gdb.GdbError(usage)
+		address = int(gdb.parse_and_eval(' '.join(expression)))
+
+		pools, bins = find_gc_pools()
+		pagetables = [read_pagetable(read_memory, pool) for pool in pools]
+		if options['--size'] is not None:
+			low, high = address, address + options['--size']
+		else:
+			block = gc_block_of(pools, pagetables, bins, address)
+			if block is None:
+				gdb.write("0x%x is not in a GC block, looking for pointers to it\n" % address)
+				low, high = address, address + 1
+			else:
+				low, high = block[0], block[0] + block[1]
+				gdb.write("GC block 0x%x (%d bytes)\n" % block)
+
+		ranges = [(start, end, None) for start, end in gc_used_ranges(pools, pagetables, bins)]
+		try:
+			ranges += stack_ranges(thread_lists(), thread_stack_pointers())
+		except (gdb.GdbError, gdb.error) as e:
+			gdb.write("Not scanning stacks: %s\n" % e)
+		ranges += data_section_ranges()
+
+		word = lookup_type("size_t").sizeof
+		order = byte_order()
+		is_free = lambda address: gc_block_is_free(read_memory, pools, pagetables, bins, address, word, order)
+		lines = []
+		complete = True
+		if options['--core'] is not None and options['--jobs'] > 1:
+			matches = scan_core_parallel(options['--core'], [(start, end) for start, end, label in ranges], low, high, word, order, options['--jobs'])
+			for (start, end, label), found in zip(ranges, matches):
+				lines += referrer_lines(found, label, low, high, pools, pagetables, bins, is_free)
+		else:
+			read = DCoreFile(options['--core']).read if options['--core'] is not None else read_memory
+			for start, end, label in ranges:
+				# only referrers which are shown count towards the limit, one more tells if there are others
+				if len(lines) > options['--limit']:
+					complete = False
+					break
+				found = scan_range_for_refs(read, start, end, low, high, word, order)
+				lines += referrer_lines(found, label, low, high, pools, pagetables, bins, is_free)
+		for line in lines[:options['--limit']]:
+			gdb.write(line + "\n")
+		if len(lines) > options['--limit'] and complete:
+			gdb.write("%d more, use --limit to show them\n" % (len(lines) - options['--limit']))
+		elif len(lines) > options['--limit']:
+			gdb.write("stopped after %d referrers, use --limit to show more\n" % options['--limit'])
+DlangWhoRefs()
@@ -1,8 +1,21 @@
 # Based on https://github.com/vadimcn/vscode-lldb/blob/master/formatters/rust.py
 from __future__ import print_function, division
 import sys
+import array
+import atexit
+import bisect
+import collections
+import hashlib
 import logging
+import json
+import math
+import mmap
+import multiprocessing
+import os
 import re
+import shlex
+import threading
+import struct
 import lldb
 
 if sys.version_info[0] == 2:
@@ -14,16 +27,48 @@ else:
 
 string_encoding = "escape" # remove | unicode | escape
 
+# size in bytes of the memory blocks variables are fingerprinted and decoded in
+render_cache_block_size = 4096
+# number of variables kept in the render cache
+render_cache_size = 64
+# number of decoded and escaped strings kept until the process resumes
+string_cache_size = 4096
+# bytes shown per child of ubyte[] / void[] hexdumps
+hexdump_bytes_per_page = 64
+# bytes read at once when rendering hexdumps
+hexdump_read_size = 65536
+# bytes read at once by dlang-find and dlang-stats-of
+scan_chunk_size = 1 << 20
+# GC pages whose page table and bits dlang-heap reads at once
+heap_scan_pages = 4096
+# bytes of a core file each process of dlang-who-refs --jobs scans per task
+core_task_size = 64 << 20
+# show min/max/mean of numeric arrays in their summary, for arrays up to the given length
+array_summary_stats = False
+array_summary_stats_max_length = 1 << 20
+# warm the caches for the D locals of the selected frame on each stop, reading at most prefetch_budget bytes
+prefetch_locals = False
+prefetch_budget = 1 << 20
+# directory the results of type lookups are cached in per build-id, None disables the cache
+type_cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'dlang-debug')
+# enable the printers without waiting for a module containing D code (e.g. for -betterC)
+always_load_d_printers = False
+
 log = logging.getLogger(__name__)
 
 module = sys.modules[__name__]
 d_category = None
+# (compiled type name regex, synth class) in the order they were attached
+synthetic_types = []
 
 def __lldb_init_module(debugger, dict):
 	global d_category
 
 	d_category = debugger.CreateCategory('D')
-	d_category.SetEnabled(True)
+	# the category applies to all types, so only enable it once D code is loaded
+	d_category.SetEnabled(always_load_d_printers or has_d_module(debugger))
+	if not d_category.GetEnabled():
+		watch_module_loads(debugger)
 
 	attach_synthetic_to_type(DAssocArrayPrinter, r'^_AArray_|[^0-9\[][^\[]*\]$', True)
 
@@ -34,15 +79,90 @@ def __lldb_init_module(debugger, dict):
 	attach_synthetic_to_type(DCStringPrinter, r'^_Array_char$|^_Array_char8_t$|^string$|^(const|immutable)?\(?char\)?\s*\[\]$', True)
 	attach_synthetic_to_type(DWStringPrinter, r'^_Array_wchar_t$|^_Array_char16_t$|^wstring$|^(const|immutable)?\(?wchar\)?\s*\[\]$', True)
 	attach_synthetic_to_type(DDStringPrinter, r'^_Array_dchar$|^dstring$|^(const|immutable)?\(?dchar\)?\s*\[\]$', True)
+
+	attach_synthetic_to_type(DByteBufferPrinter, r'^_Array_ubyte$|^_Array_unsigned char$|^_Array_void$|^(const|immutable|shared)?\(?(ubyte|void)\)?\s*\[\]$', True)
 	
 	attach_synthetic_to_type(DObjectPrinter, r' \*$', True)
 
+	attach_synthetic_to_type(DSumTypePrinter, r'^(std\.)?sumtype\.SumType!(\(.*\)(\.SumType)?|[\w.]+)$', True)
+	attach_synthetic_to_type(DNullablePrinter, r'^std\.typecons\.Nullable!(\(.*\)(\.Nullable)?|[\w.]+)$', True)
+	attach_synthetic_to_type(DTuplePrinter, r'^std\.typecons\.Tuple!(\(.*\)(\.Tuple)?|[\w.]+)$', True)
+
+	debugger.HandleCommand('command script add -f %s.dlang_json dlang-json' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_find dlang-find' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_stats_of dlang-stats-of' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_prefetch dlang-prefetch' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_heap dlang-heap' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_threads dlang-threads' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_fibers dlang-fibers' % __name__)
+	debugger.HandleCommand('command script add -f %s.dlang_who_refs dlang-who-refs' % __name__)
+
+	if prefetch_locals:
+		start_prefetcher(debugger)
+
+# sections druntime collects the ModuleInfo of each D module in
+d_module_sections = ["__minfo", ".minfo", "__minfodata"]
+# symbols only present in D programs and druntime
+d_symbols = ["_Dmain", "_d_run_main"]
+d_modules = {}
+
+def is_d_module(module):
+	"checks if a module contains D code by its ModuleInfo sections, D specific symbols or compile unit languages"
+	key = str(module.GetFileSpec()) + str(module.GetUUIDString())
+	known = d_modules.get(key)
+	if known is not None:
+		return known
+	d_modules[key] = False
+	for section in d_module_sections:
+		if module.FindSection(section).IsValid():
+			d_modules[key] = True
+			return True
+	for symbol in d_symbols:
+		if module.FindSymbol(symbol).IsValid():
+			d_modules[key] = True
+			return True
+	for i in range(module.GetNumCompileUnits()):
+		if module.GetCompileUnitAtIndex(i).GetLanguage() == lldb.eLanguageTypeD:
+			d_modules[key] = True
+			return True
+	return False
+
+def has_d_module(debugger):
+	for i in range(debugger.GetNumTargets()):
+		target = debugger.GetTargetAtIndex(i)
+		for j in range(target.GetNumModules()):
+			if is_d_module(target.GetModuleAtIndex(j)):
+				return True
+	return False
+
+def watch_module_loads(debugger):
+	"enables the D category from a background thread as soon as a module with D code is loaded"
+	listener = lldb.SBListener('lldb_dlang.modules')
+	listener.StartListeningForEventClass(debugger, lldb.SBTarget.GetBroadcasterClassName(), lldb.SBTarget.eBroadcastBitModulesLoaded)
+
+	def run():
+		event = lldb.SBEvent()
+		while not d_category.GetEnabled():
+			if not listener.WaitForEvent(1, event) or not lldb.SBTarget.EventIsTargetEvent(event):
+				continue
+			for i in range(lldb.SBTarget.GetNumModulesFromEvent(event)):
+				if is_d_module(lldb.SBTarget.GetModuleAtIndexFromEvent(i, event)):
+					log.debug('enabling D category')
+					d_category.SetEnabled(True)
+					break
+
+	thread = threading.Thread(target=run, name='lldb_dlang module watcher')
+	thread.daemon = True
+	thread.start()
+
 def attach_synthetic_to_type(synth_class, type_name, is_regex=False):
 	global module, d_category
 	synth = lldb.SBTypeSynthetic.CreateWithClassName(__name__ + '.' + synth_class.__name__)
 	synth.SetOptions(lldb.eTypeOptionCascade)
 	ret = d_category.AddTypeSynthetic(lldb.SBTypeNameSpecifier(type_name, is_regex), synth)
 	log.debug('attaching synthetic %s to "%s", is_regex=%s -> %s', synth_class.__name__, type_name, is_regex, ret)
+	if is_regex:
+		synthetic_types.append((re.compile(type_name), synth_class))
 
 	summary_fn = lambda valobj, dict: get_synth_summary(synth_class, valobj, dict)
 	# LLDB accesses summary fn's by name, so we need to create a unique one.
@@ -65,17 +185,305 @@ def get_synth_summary(synth_class, valobj, dict):
 	summary = synth.get_summary()
 	return to_lldb_str(summary)
 
+# guards the string, render and memory region caches shared by formatters and the prefetch worker
+#
+# Lock order: formatters run with LLDB's API mutex held and take cache_lock
+# after it, so cache_lock must never be held while calling into LLDB (reading
+# memory, stop IDs, creating values). Reads and decodes happen outside of it,
+# it only protects looking up and publishing entries.
+cache_lock = threading.RLock()
+
+class DStringCache(object):
+	"least recently used strings keyed by (ptr, length, encoding), cleared when the stop ID changes"
+
+	def __init__(self, max_entries):
+		self.max_entries = max_entries
+		self.entries = collections.OrderedDict()
+		self.stop_id = None
+
+	def get(self, process, key, decode):
+		"returns the cached string for key or stores the result of decode() unless it's None"
+		stop_id = process.GetStopID()
+		with cache_lock:
+			if stop_id != self.stop_id:
+				self.entries.clear()
+				self.stop_id = stop_id
+			value = self.entries.pop(key, None)
+			if value is not None:
+				self.entries[key] = value
+				return value
+		value = decode()
+		if value is None:
+			return None
+		with cache_lock:
+			# don't publish strings read before the process resumed into the cache of the next stop
+			if self.stop_id == stop_id:
+				if key not in self.entries and len(self.entries) >= self.max_entries:
+					self.entries.popitem(last=False)
+				self.entries[key] = value
+		return value
+
+string_cache = DStringCache(string_cache_size)
+
 def string_from_ptr(pointer, length, charsize, encoding):
 	if length <= 0:
 		return u''
-	error = lldb.SBError()
 	process = pointer.GetProcess()
-	data = process.ReadMemory(pointer.GetValueAsUnsigned(), length * charsize, error)
+	address = pointer.GetValueAsUnsigned()
+	return string_cache.get(process, (address, length, encoding), lambda: decode_string(process, address, length * charsize, encoding))
+
+def decode_string(process, address, size, encoding):
+	error = lldb.SBError()
+	data = process.ReadMemory(address, size, error)
 	if error.Success():
 		return data.decode(encoding, 'backslashreplace')
 	else:
 		log.error('ReadMemory error: %s', error.GetCString())
 
+def read_memory(process, address, size):
+	error = lldb.SBError()
+	data = process.ReadMemory(address, size, error)
+	if error.Success():
+		return data
+	else:
+		log.error('ReadMemory error: %s', error.GetCString())
+
+def pointer_data(process, address):
+	if process.GetAddressByteSize() == 8:
+		return lldb.SBData.CreateDataFromUInt64Array(process.GetByteOrder(), 8, [address])
+	else:
+		return lldb.SBData.CreateDataFromUInt32Array(process.GetByteOrder(), 4, [address])
+
+def struct_byte_order(process):
+	return '>' if process.GetByteOrder() == lldb.eByteOrderBig else '<'
+
+def size_t_format(process):
+	return 'Q' if process.GetAddressByteSize() == 8 else 'I'
+
+class DMemoryRegions(object):
+	"sorted index of the readable memory regions, used to reject garbage pointers before reading"
+
+	def __init__(self, regions):
+		self.starts = []
+		self.ends = []
+		for start, end in sorted(regions):
+			if self.ends and start <= self.ends[-1]:
+				# merge overlapping and adjacent regions so ranges can span them
+				self.ends[-1] = max(self.ends[-1], end)
+			else:
+				self.starts.append(start)
+				self.ends.append(end)
+
+	def region_end(self, address):
+		"returns the end of the region containing address or None if it is not mapped"
+		i = bisect.bisect_right(self.starts, address) - 1
+		if i >= 0 and address < self.ends[i]:
+			return self.ends[i]
+		return None
+
+def read_memory_regions(process):
+	"returns the readable regions of the process or None if the platform doesn't report them"
+	regions = []
+	infos = process.GetMemoryRegions()
+	info = lldb.SBMemoryRegionInfo()
+	for i in range(infos.GetSize()):
+		if infos.GetMemoryRegionAtIndex(i, info) and info.IsMapped() and info.IsReadable():
+			regions.append((info.GetRegionBase(), info.GetRegionEnd()))
+	if not regions:
+		return None
+	return DMemoryRegions(regions)
+
+memory_regions_stop_id = None
+memory_regions_index = None
+
+def memory_regions(process):
+	"returns the cached region index of the current stop"
+	global memory_regions_stop_id, memory_regions_index
+	stop_id = process.GetStopID()
+	with cache_lock:
+		if stop_id == memory_regions_stop_id:
+			return memory_regions_index
+	regions = read_memory_regions(process)
+	with cache_lock:
+		memory_regions_index = regions
+		memory_regions_stop_id = stop_id
+	return regions
+
+def validate_slice(process, address, length, item_size):
+	"returns None if the memory of a slice is mapped or a message to show instead"
+	if length == 0 or not process.IsValid():
+		return None
+	regions = memory_regions(process)
+	if regions is None:
+		return None
+	end = regions.region_end(address)
+	if end is None:
+		return '<invalid: 0x%x is not mapped>' % address
+	if address + length * item_size > end:
+		return '<invalid: length %d exceeds mapping>' % length
+	return None
+
+class DRenderCache(object):
+	"""decoded variable blocks kept across stops, keyed by (address, type, length)
+
+	Each variable stores a fingerprint of the raw memory of each of its blocks
+	together with what was decoded from it. A block is only decoded again if its
+	memory changed since the last time it was rendered. Blocks are only read
+	once per stop, `checked` tracks which were validated since `stop_id`."""
+
+	def __init__(self, max_entries):
+		self.max_entries = max_entries
+		self.entries = {}
+		self.order = []
+
+	def get(self, key, stop_id):
+		"returns the cache entry of a variable, evicting the least recently used one if full"
+		with cache_lock:
+			entry = self.entries.get(key)
+			if entry is None:
+				entry = { "stop_id": stop_id, "blocks": {}, "checked": set() }
+				self.entries[key] = entry
+				if len(self.order) >= self.max_entries:
+					del self.entries[self.order.pop(0)]
+			else:
+				self.order.remove(key)
+				if entry["stop_id"] != stop_id:
+					entry["stop_id"] = stop_id
+					entry["checked"] = set()
+			self.order.append(key)
+			return entry
+
+	def block(self, entry, index, read, decode):
+		"""returns the decoded block, only calling decode(data) if the memory returned by read() changed
+
+		returns None if the memory could not be read"""
+		with cache_lock:
+			cached = entry["blocks"].get(index)
+			if cached is not None and index in entry["checked"]:
+				return cached[1]
+			stop_id = entry["stop_id"]
+		data = read()
+		if data is None:
+			return None
+		fingerprint = hash(data)
+		if cached is not None and cached[0] == fingerprint:
+			decoded = cached[1]
+		else:
+			decoded = decode(data)
+		with cache_lock:
+			# a newer stop may have used the entry meanwhile, only publish into the stop that was read
+			if entry["stop_id"] == stop_id:
+				entry["checked"].add(index)
+				entry["blocks"][index] = (fingerprint, decoded)
+		return decoded
+
+	def clear(self):
+		with cache_lock:
+			self.entries = {}
+			self.order = []
+
+render_cache = DRenderCache(render_cache_size)
+
+class DTypeCache(object):
+	"""type lookup results of one binary, persisted as JSON by build-id
+
+	The data is loaded once and saved when lldb exits. Entries stay valid as long
+	as the build-id is the same, so sessions of the same build start hot. Cached
+	names which don't resolve anymore are dropped when they are used."""
+
+	def __init__(self, build_id, sections):
+		self.path = os.path.join(type_cache_dir, build_id + '.json') if type_cache_dir and build_id else None
+		self.data = dict((section, {}) for section in sections)
+		# type name -> SBType, only kept for this session and cleared when modules are loaded
+		self.resolved = {}
+		# number of modules and digest of their UUIDs that resolved was filled with
+		self.modules = (None, None)
+		self.dirty = False
+		if self.path is not None and os.path.exists(self.path):
+			try:
+				with open(self.path, 'r') as f:
+					loaded = json.load(f)
+				for section in sections:
+					self.data[section].update(loaded.get(section, {}))
+			except (IOError, OSError, ValueError) as e:
+				log.error('ignoring broken type cache %s: %s', self.path, e)
+
+	def get(self, section, key):
+		return self.data[section].get(key)
+
+	def set(self, section, key, value):
+		if self.data[section].get(key) != value:
+			self.data[section][key] = value
+			self.dirty = True
+
+	def forget(self, section, key):
+		if self.data[section].pop(key, None) is not None:
+			self.dirty = True
+
+	def save(self):
+		if not self.dirty or self.path is None:
+			return
+		try:
+			if not os.path.isdir(type_cache_dir):
+				os.makedirs(type_cache_dir)
+			# write to a temporary file first so concurrent sessions never read half written caches
+			temp = '%s.%d.tmp' % (self.path, os.getpid())
+			with open(temp, 'w') as f:
+				json.dump(self.data, f)
+			if os.path.exists(self.path) and sys.platform == 'win32':
+				os.remove(self.path)
+			os.rename(temp, self.path)
+			self.dirty = False
+		except (IOError, OSError) as e:
+			log.error('failed saving type cache %s: %s', self.path, e)
+
+type_caches = {}
+
+def type_cache(target):
+	"returns the DTypeCache of the executable of a target"
+	build_id = target.GetModuleAtIndex(0).GetUUIDString() if target.GetNumModules() > 0 else None
+	cache = type_caches.get(build_id)
+	if cache is None:
+		cache = DTypeCache(build_id, ["missing", "classes", "classinfo", "classindex"])
+		type_caches[build_id] = cache
+	return cache
+
+def loaded_modules_key(target, cache):
+	"returns a digest of the UUIDs of the modules of target, clearing the resolved types if they changed"
+	count = target.GetNumModules()
+	if cache.modules[0] != count:
+		ids = sorted(target.GetModuleAtIndex(i).GetUUIDString() or target.GetModuleAtIndex(i).GetFileSpec().fullpath or '' for i in range(count))
+		cache.modules = (count, hashlib.sha1('\n'.join(ids).encode('utf-8')).hexdigest())
+		cache.resolved = {}
+	return cache.modules[1]
+
+def find_type(target, name):
+	"""FindFirstType remembering found types in memory and missing types on disk
+
+	A type missing with one set of modules may be defined by a library loaded
+	later, so misses are stored with the modules they were checked against and
+	looked up again once that set changes."""
+	cache = type_cache(target)
+	modules = loaded_modules_key(target, cache)
+	found = cache.resolved.get(name)
+	if found is None:
+		if cache.get("missing", name) == modules:
+			found = lldb.SBType()
+		else:
+			found = target.FindFirstType(name)
+			if found.IsValid():
+				cache.forget("missing", name)
+			else:
+				cache.set("missing", name, modules)
+		cache.resolved[name] = found
+	return found
+
+def save_type_caches():
+	for cache in type_caches.values():
+		cache.save()
+
+atexit.register(save_type_caches)
+
 def get_obj_summary(valobj, unavailable='{...}'):
 	summary = valobj.GetSummary()
 	if summary is not None:
@@ -148,6 +556,12 @@ class DArrayPrinter(BaseSynthProvider):
 		self.length = length
 		self.item_type = self.ptr.GetType().GetPointeeType()
 		self.item_size = self.item_type.GetByteSize()
+		self.process = self.valobj.GetProcess()
+		self.address = self.ptr.GetValueAsUnsigned()
+		self.per_block = max(1, render_cache_block_size // self.item_size) if self.item_size else 0
+		self.invalid = validate_slice(self.process, self.address, self.length, max(1, self.item_size))
+		if self.invalid is not None:
+			self.length = 0
 
 	def ptr_and_length(self, val):
 		return (
@@ -165,12 +579,31 @@ class DArrayPrinter(BaseSynthProvider):
 		try:
 			if not 0 <= index < self.length:
 				return None
+			if self.per_block and self.process.IsValid():
+				block = self.get_block(index // self.per_block)
+				if block is not None:
+					return block[index % self.per_block]
 			offset = index * self.item_size
 			return self.ptr.CreateChildAtOffset('[%s]' % index, offset, self.item_type)
 		except Exception as e:
 			log.error('%s', e)
 			raise
 
+	def get_block(self, block):
+		"returns the children of a block, reusing the ones of the previous stops if the memory didn't change"
+		entry = render_cache.get((self.address, self.valobj.GetTypeName(), self.length), self.process.GetStopID())
+		start = block * self.per_block
+		count = min(self.per_block, self.length - start)
+		return render_cache.block(entry, block,
+			lambda: read_memory(self.process, self.address + start * self.item_size, count * self.item_size),
+			lambda data: self.decode_block(start, data))
+
+	def decode_block(self, start, data):
+		# the bulk read fills the process memory cache, the children stay address backed
+		# so they can be edited, watched and have their address taken
+		return [self.valobj.CreateValueFromAddress('[%s]' % (start + i), self.address + (start + i) * self.item_size, self.item_type)
+			for i in range(len(data) // self.item_size)]
+
 	def get_child_index(self, name):
 		try:
 			return int(name.lstrip('[').rstrip(']'))
@@ -179,7 +612,25 @@ class DArrayPrinter(BaseSynthProvider):
 			raise
 
 	def get_summary(self):
-		return '&' + get_array_summary(self)
+		if self.invalid is not None:
+			return self.invalid
+		summary = '&' + get_array_summary(self)
+		if array_summary_stats and 0 < self.length <= array_summary_stats_max_length:
+			stats = self.stats()
+			if stats is not None:
+				summary += ' ' + stats.summary()
+		return summary
+
+	def stats(self):
+		"returns the DSliceStats of numeric arrays or None"
+		typecode = array_typecode(self.item_type.GetCanonicalType())
+		if typecode is None or not self.process.IsValid():
+			return None
+		try:
+			return slice_stats(lambda offset, size: read_slice(self.process, self.address, offset, size), self.length, typecode, struct_byte_order(self.process))
+		except IOError as e:
+			log.error('%s', e)
+			return None
 
 class DBaseStringPrinter(DArrayPrinter):
 	def get_child_at_index(self, index):
@@ -205,12 +656,21 @@ class DBaseStringPrinter(DArrayPrinter):
 	def get_summary(self):
 		# original code used string length limit to avoid garbage from uninitialized values
 		# this issue is less common in D, but it's good practice for the rare cases anyway.
-		strval = string_from_ptr(self.ptr, min(self.length, 10000), self.get_charsize(), self.get_encoding())
-		global log
+		if self.invalid is not None:
+			return self.invalid
+		length = min(self.length, 10000)
+		key = (self.address, length, self.get_encoding(), string_encoding)
+		escaped = string_cache.get(self.process, key, lambda: self.get_escaped(length))
+		if escaped == None:
+			return None
+		if self.length > 10000: escaped += u'...'
+		return (u'"%s"' % escaped) + self.get_suffix()
+
+	def get_escaped(self, length):
+		strval = string_from_ptr(self.ptr, length, self.get_charsize(), self.get_encoding())
 		if strval == None:
 			return None
-		if self.length > 10000: strval += u'...'
-		return (u'"%s"' % escape_string(strval)) + self.get_suffix()
+		return escape_string(strval)
 
 class DCStringPrinter(DBaseStringPrinter):
 	"print D string values"
@@ -245,13 +705,76 @@ class DDStringPrinter(DBaseStringPrinter):
 	def get_suffix(self):
 		return "d"
 
+class DByteBufferPrinter(DArrayPrinter):
+	"print D ubyte[] and void[] as hexdump, one child per page"
+
+	def initialize(self):
+		DArrayPrinter.initialize(self)
+		self.char_type = find_type(self.valobj.target, "char")
+		# round down so chunks always contain whole pages
+		self.chunk_size = max(hexdump_bytes_per_page, hexdump_read_size - hexdump_read_size % hexdump_bytes_per_page)
+		self.chunk_offset = None
+		self.chunk = None
+
+	def num_children(self):
+		return (self.length + hexdump_bytes_per_page - 1) // hexdump_bytes_per_page
+
+	def read_page(self, offset):
+		chunk_offset = offset - offset % self.chunk_size
+		if chunk_offset != self.chunk_offset:
+			self.chunk = read_memory(self.process, self.address + chunk_offset, min(self.chunk_size, self.length - chunk_offset))
+			self.chunk_offset = chunk_offset
+		if self.chunk is None:
+			return None
+		start = offset - chunk_offset
+		return self.chunk[start:start + hexdump_bytes_per_page]
+
+	def get_child_at_index(self, index):
+		try:
+			if not 0 <= index < self.num_children():
+				return None
+			offset = index * hexdump_bytes_per_page
+			page = self.read_page(offset)
+			if page is None:
+				return None
+			line = hexdump_line(page).encode('ascii')
+			data = lldb.SBData()
+			data.SetData(lldb.SBError(), line, self.process.GetByteOrder(), self.process.GetAddressByteSize())
+			return self.valobj.CreateValueFromData('[0x%08x]' % offset, data, self.char_type.GetArrayType(len(line)))
+		except Exception as e:
+			log.error('%s', e)
+			raise
+
+	def get_child_index(self, name):
+		try:
+			return int(name.lstrip('[').rstrip(']'), 16) // hexdump_bytes_per_page
+		except Exception as e:
+			log.error('%s', e)
+			raise
+
+	def get_summary(self):
+		if self.invalid is not None:
+			return self.invalid
+		return '&[%d bytes]' % self.length
+
+def hexdump_line(data):
+	"formats bytes as hex in groups of 8 followed by their printable ASCII characters"
+	data = bytearray(data)
+	groups = [' '.join('%02x' % b for b in data[i:i + 8]) for i in range(0, len(data), 8)]
+	text = ''.join(chr(b) if 0x20 <= b < 0x7f else '.' for b in data)
+	return '  '.join(groups) + '  |' + text + '|'
+
 class DAssocArrayPrinter(BaseSynthProvider):
 	"print D arrays"
 
 	def initialize(self):
 		self.target = self.valobj.target
-		self.voidPtr = self.target.FindFirstType("void").GetPointerType()
+		self.voidPtr = find_type(self.target, "void").GetPointerType()
 		self.ptr = self.valobj.GetChildMemberWithName("ptr").Cast(self.voidPtr)
+		self.process = self.valobj.GetProcess()
+		self.header = None
+		self.entries = None
+		self.invalid = None
 		tag = self.valobj.type.name
 		if tag != None:
 			if tag.startswith("_AArray_"):
@@ -316,42 +839,107 @@ class DAssocArrayPrinter(BaseSynthProvider):
 	#   void* entry
 
 	def lookup_type(self, name):
-		return self.target.FindFirstType(name)
+		return find_type(self.target, name)
+
+	def read_header(self):
+		"reads the bucket array, used, deleted and valoff fields of the AA in one go"
+		if self.header is None:
+			impl = self.ptr.GetValueAsUnsigned()
+			if not impl or not self.process.IsValid():
+				return None
+			size_t = size_t_format(self.process)
+			fmt = struct_byte_order(self.process) + size_t * 2 + 'II' + size_t + 'IIII'
+			self.invalid = validate_slice(self.process, impl, 1, struct.calcsize(fmt))
+			if self.invalid is not None:
+				return None
+			data = read_memory(self.process, impl, struct.calcsize(fmt))
+			if data is None:
+				return None
+			length, bucketptr, used, deleted, _, _, keysz, _, valoff = struct.unpack(fmt, data)
+			self.invalid = validate_slice(self.process, bucketptr, length, self.bucket_size())
+			if self.invalid is not None:
+				return None
+			self.header = {
+				"length": length,
+				"bucketptr": bucketptr,
+				"used": used,
+				"deleted": deleted,
+				"keysz": keysz,
+				"valoff": valoff,
+			}
+		return self.header
 
 	def used(self):
-		return self.ptr.CreateChildAtOffset("used", self.lookup_type("size_t").size * 2, self.lookup_type("int")).unsigned
+		header = self.read_header()
+		return header["used"] if header else 0
 
 	def deleted(self):
-		return self.ptr.CreateChildAtOffset("deleted", self.lookup_type("size_t").size * 2 + self.lookup_type("int").size, self.lookup_type("int")).unsigned
+		header = self.read_header()
+		return header["deleted"] if header else 0
 
 	def valoff(self):
-		return self.ptr.CreateChildAtOffset("valoff", self.lookup_type("size_t").size * 3 + self.lookup_type("int").size * 5, self.lookup_type("int")).unsigned
-
-	def buckets(self):
-		"returns an iterator of bucket pointers"
+		header = self.read_header()
+		return header["valoff"] if header else 0
 
-		length = self.ptr.Cast(self.lookup_type("size_t").GetPointerType()).Dereference().unsigned
-		bucketptr = self.ptr.CreateChildAtOffset("bucketptr", self.lookup_type("size_t").size, self.voidPtr)
+	def bucket_blocks(self):
+		"returns an iterator of the filled [entry address, key name] pairs of each block of buckets"
+		header = self.read_header()
+		if header is None:
+			return
+		length = header["length"]
 		bucketsize = self.bucket_size()
+		per_block = max(1, render_cache_block_size // bucketsize)
+		entry = render_cache.get((self.ptr.GetValueAsUnsigned(), self.valobj.GetTypeName(), length), self.process.GetStopID())
+
+		for block in range((length + per_block - 1) // per_block):
+			start = block * per_block
+			count = min(per_block, length - start)
+			entries = render_cache.block(entry, block,
+				lambda: self.read_buckets(header["bucketptr"] + start * bucketsize, count * bucketsize, header["keysz"]),
+				lambda data: self.decode_buckets(data[:count * bucketsize]))
+			if entries is None:
+				return
+			yield entries
 
-		for i in range(length):
-			yield bucketptr.CreateChildAtOffset("bucketptr", i * bucketsize, self.voidPtr).AddressOf()
-
-	def bucket_filled(self, bucket):
-		hashval = bucket.CreateChildAtOffset("hashval", 0, self.lookup_type("size_t")).unsigned
+	def read_buckets(self, address, size, keysz):
+		"returns the memory of a block of buckets followed by the raw keys of its filled buckets, so changed keys are decoded again"
+		data = read_memory(self.process, address, size)
+		if data is None:
+			return None
+		keys = []
+		for entry, key in self.decode_buckets(data):
+			keys.append(read_memory(self.process, entry, keysz) or b'')
+		return data + b''.join(keys)
+
+	def decode_buckets(self, data):
+		size_t = size_t_format(self.process)
+		values = struct.unpack(struct_byte_order(self.process) + size_t * (len(data) // struct.calcsize(size_t)), data)
 		HASH_FILLED_MARK = 1 << (8 * self.lookup_type("size_t").size) - 1
-		return hashval & HASH_FILLED_MARK != 0
-
-	def bucket_entry(self, bucket):
-		return bucket.CreateChildAtOffset("bucket_entry", self.lookup_type("size_t").size, self.voidPtr.GetPointerType())
+		# key names are resolved lazily and kept as long as the bucket block doesn't change
+		return [[entry, None] for hashval, entry in zip(values[0::2], values[1::2]) if hashval & HASH_FILLED_MARK != 0]
 
 	def bucket_size(self):
 		return self.voidPtr.size + self.lookup_type("size_t").size
 
+	def entry_at(self, index):
+		if self.entries is None:
+			self.entries = []
+			self.entry_blocks = self.bucket_blocks()
+		while len(self.entries) <= index:
+			block = next(self.entry_blocks, None)
+			if block is None:
+				return None
+			self.entries.extend(block)
+		return self.entries[index]
+
 	def child_iter(self):
-		for bucket in self.buckets():
-			if self.bucket_filled(bucket):
-				yield self.bucket_entry(bucket)
+		index = 0
+		while True:
+			entry = self.entry_at(index)
+			if entry is None:
+				return
+			yield entry
+			index += 1
 
 	def num_children(self):
 		return self.used() - self.deleted()
@@ -359,28 +947,28 @@ class DAssocArrayPrinter(BaseSynthProvider):
 	def has_children(self):
 		return self.num_children() > 0 #self.ptr.unsigned != 0
 
-	def get_key_name(self, child, index):
-		key = child.CreateChildAtOffset('[%s]' % index, 0, self.key_type)
-		summary = get_obj_summary(key)
-		if key.error.Fail():
-			summary = '[(void*) %s]' % str(child.addr)
-		return summary
+	def get_key_name(self, entry, index):
+		if entry[1] is None:
+			key = self.valobj.CreateValueFromAddress('[%s]' % index, entry[0], self.key_type)
+			summary = get_obj_summary(key)
+			if key.error.Fail():
+				summary = '[(void*) 0x%x]' % entry[0]
+			entry[1] = summary
+		return entry[1]
 
 	def get_child_at_index(self, index):
 		try:
-			remaining = index
-			for child in self.child_iter():
-				if remaining == 0:
-					summary = self.get_key_name(child, index)
-					if self.value_type.name == "void":
-						return child.CreateChildAtOffset(summary, self.valoff(), self.voidPtr).AddressOf().Cast(self.voidPtr)
-					else:
-						return child.CreateChildAtOffset(summary, self.valoff(), self.value_type)
-				else:
-					remaining -= 1
+			entry = self.entry_at(index)
+			if entry is None:
+				log.error("not found index %s, len: %s", index, self.num_children())
+				return None
 
-			log.error("not found index %s, remaining %s, len: %s", index, remaining, self.num_children())
-			return None
+			summary = self.get_key_name(entry, index)
+			address = entry[0] + self.valoff()
+			if self.value_type.name == "void":
+				return self.valobj.CreateValueFromData(summary, pointer_data(self.process, address), self.voidPtr)
+			else:
+				return self.valobj.CreateValueFromAddress(summary, address, self.value_type)
 		except Exception as e:
 			log.error('%s', e)
 			raise
@@ -398,9 +986,178 @@ class DAssocArrayPrinter(BaseSynthProvider):
 			raise
 
 	def get_summary(self):
+		if self.read_header() is None and self.invalid is not None:
+			return self.invalid
 		return get_map_summary(self)
 
 
+# type name -> layout of a SumType, Nullable or Tuple instantiation, computed once per type
+phobos_layouts = {}
+
+def phobos_layout(type, compute):
+	"returns compute(type) cached by the type name, so arrays of these types are introspected once"
+	type = type.GetCanonicalType()
+	name = type.GetName()
+	layout = phobos_layouts.get(name)
+	if layout is None:
+		layout = phobos_layouts[name] = compute(type)
+	return layout
+
+def type_fields(type):
+	return [type.GetFieldAtIndex(i) for i in range(type.GetNumberOfFields())]
+
+def template_arguments(name):
+	"""splits the top level template arguments of a type name like Tuple!(int, "a").Tuple
+
+	Names may end with the eponymous member and single arguments may be given
+	without parentheses, like Nullable!int.Nullable."""
+	start = name.find('!')
+	if start < 0:
+		return []
+	if name[start + 1:start + 2] != '(':
+		argument = name[start + 1:]
+		suffix = '.' + name[:start].split('.')[-1]
+		if argument.endswith(suffix):
+			argument = argument[:-len(suffix)]
+		return [argument] if argument else []
+	args = []
+	current = ''
+	depth = 0
+	quoted = False
+	for c in name[start + 2:]:
+		if quoted:
+			quoted = c != '"'
+		elif c == '"':
+			quoted = True
+		elif c in '([':
+			depth += 1
+		elif c in ')]':
+			if depth == 0:
+				# the closing parenthesis of the arguments, an eponymous member may follow
+				break
+			depth -= 1
+		elif c == ',' and depth == 0:
+			args.append(current.strip())
+			current = ''
+			continue
+		current += c
+	if current.strip():
+		args.append(current.strip())
+	return args
+
+def tuple_field_names(type_name, count):
+	"returns the names given to the fields of a Tuple instantiation, None for unnamed fields"
+	names = []
+	for arg in template_arguments(type_name):
+		if len(arg) >= 2 and arg[0] == arg[-1] == '"':
+			if names:
+				names[-1] = arg[1:-1]
+		else:
+			names.append(None)
+	return names if len(names) == count else [None] * count
+
+def sumtype_layout(type):
+	"returns ({tag: storage member name}, whether the tag is a field) of a SumType"
+	members = {}
+	fields = type_fields(type)
+	for field in fields:
+		if field.GetName() == 'storage':
+			for member in type_fields(field.GetType().GetCanonicalType()):
+				match = re.match(r'^values_(\d+)$', member.GetName() or '')
+				if match:
+					members[int(match.group(1))] = member.GetName()
+	return members, any(field.GetName() == 'tag' for field in fields)
+
+def nullable_layout(type):
+	"returns (payload field path, whether there is an _isNull field) of a Nullable"
+	path = ['_value']
+	fields = type_fields(type)
+	for field in fields:
+		value_type = field.GetType().GetCanonicalType()
+		# newer phobos wraps the value in a union to not call its destructor
+		if field.GetName() == '_value' and value_type.GetTypeClass() == lldb.eTypeClassUnion and \
+				any(member.GetName() == 'payload' for member in type_fields(value_type)):
+			path.append('payload')
+	return path, any(field.GetName() == '_isNull' for field in fields)
+
+def tuple_layout(type):
+	"returns (child name, field name) of the fields of a Tuple"
+	fields = [field.GetName() for field in type_fields(type)]
+	names = tuple_field_names(type.GetName(), len(fields))
+	return [(names[i] or '[%d]' % i, field) for i, field in enumerate(fields)]
+
+class DSumTypePrinter(BaseSynthProvider):
+	"print the active member of std.sumtype.SumType"
+	def update(self):
+		members, has_tag = phobos_layout(self.valobj.GetType(), sumtype_layout)
+		self.tag = self.valobj.GetChildMemberWithName('tag').GetValueAsUnsigned() if has_tag else 0
+		self.active = None
+		if self.tag in members:
+			self.active = self.valobj.GetChildMemberWithName('storage').GetChildMemberWithName(members[self.tag])
+		return False
+
+	def num_children(self):
+		return self.active.GetNumChildren() if self.active is not None else 0
+
+	def has_children(self):
+		return self.num_children() > 0
+
+	def get_child_at_index(self, index):
+		return self.active.GetChildAtIndex(index)
+
+	def get_child_index(self, name):
+		return self.active.GetIndexOfChildWithName(name) if self.active is not None else None
+
+	def get_summary(self):
+		if self.active is None:
+			return '<invalid tag %d>' % self.tag
+		return get_obj_summary(self.active, self.active.GetTypeName())
+
+class DNullablePrinter(DSumTypePrinter):
+	"print std.typecons.Nullable as null or its value"
+	def update(self):
+		path, has_is_null = phobos_layout(self.valobj.GetType(), nullable_layout)
+		self.active = None
+		if not has_is_null or not self.valobj.GetChildMemberWithName('_isNull').GetValueAsUnsigned():
+			self.active = self.valobj
+			for name in path:
+				self.active = self.active.GetChildMemberWithName(name)
+		return False
+
+	def get_summary(self):
+		if self.active is None:
+			return 'null'
+		return get_obj_summary(self.active, self.active.GetTypeName())
+
+class DTuplePrinter(BaseSynthProvider):
+	"print std.typecons.Tuple fields by their names"
+	def update(self):
+		self.fields = phobos_layout(self.valobj.GetType(), tuple_layout)
+		return False
+
+	def num_children(self):
+		return len(self.fields)
+
+	def has_children(self):
+		return len(self.fields) > 0
+
+	def get_child_at_index(self, index):
+		name, field = self.fields[index]
+		child = self.valobj.GetChildMemberWithName(field)
+		address = child.GetLoadAddress()
+		if address == lldb.LLDB_INVALID_ADDRESS:
+			return child
+		return self.valobj.CreateValueFromAddress(name, address, child.GetType())
+
+	def get_child_index(self, name):
+		for i, (child, field) in enumerate(self.fields):
+			if child == name:
+				return i
+		return None
+
+	def get_summary(self):
+		return '(%s)' % sequence_summary(self, shownames=True)
+
 def is_ptr_to_class(valobj):
 	''' type of dereferenced value is a:
 			class if directbaseclass > 0
@@ -409,6 +1166,94 @@ def is_ptr_to_class(valobj):
 	'''
 	return bool(valobj.Dereference().GetType().GetNumberOfDirectBaseClasses() > 0)
 
+# class symbol suffixes of the ClassInfo and vtable of D classes, mangled and demangled
+class_symbol_suffixes = [('7__ClassZ', '.__Class'), ('6__vtblZ', '.__vtbl')]
+# module UUID -> { file address of a class symbol: fully qualified class name }
+class_indexes = {}
+
+def d_qualified_name(mangled):
+	"returns 'a.b.C' for mangled identifier lists like 3a1b1C or None for other manglings"
+	parts = []
+	i = 0
+	while i < len(mangled):
+		j = i
+		while j < len(mangled) and mangled[j].isdigit():
+			j += 1
+		if j == i:
+			return None
+		length = int(mangled[i:j])
+		parts.append(mangled[j:j + length])
+		i = j + length
+	if i != len(mangled) or not parts or any(part.startswith('__T') for part in parts):
+		return None
+	return '.'.join(parts)
+
+def class_symbol_type_name(name):
+	"returns the class name of ClassInfo and vtable symbols like _D3foo3Bar7__ClassZ or None"
+	for mangled, demangled in class_symbol_suffixes:
+		if name.endswith(demangled):
+			return name[:-len(demangled)]
+		if name.startswith('_D') and name.endswith(mangled):
+			# back references and other mangling features are left to the name lookup
+			return d_qualified_name(name[2:-len(mangled)])
+	return None
+
+def class_index(target, module):
+	"returns the index of class symbols of a module, built once and cached by build-id"
+	uuid = module.GetUUIDString()
+	index = class_indexes.get(uuid)
+	if index is not None:
+		return index
+	cache = type_cache(target)
+	cached = cache.get("classindex", uuid) if uuid else None
+	if cached is not None:
+		index = dict((int(address, 16), name) for address, name in cached.items())
+	else:
+		index = {}
+		for i in range(module.GetNumSymbols()):
+			symbol = module.GetSymbolAtIndex(i)
+			name = symbol.GetMangledName() or symbol.GetName() or ''
+			if '__Class' in name or '__vtbl' in name:
+				type_name = class_symbol_type_name(name)
+				if type_name:
+					index[symbol.GetStartAddress().GetFileAddress()] = type_name
+		if uuid:
+			cache.set("classindex", uuid, dict(('%x' % address, name) for address, name in index.items()))
+	class_indexes[uuid] = index
+	return index
+
+def class_from_index(target, load_address):
+	"returns the class name of a ClassInfo or vtable load address or None"
+	address = target.ResolveLoadAddress(load_address)
+	module = address.GetModule()
+	if not module.IsValid() or not is_d_module(module):
+		return None
+	return class_index(target, module).get(address.GetFileAddress())
+
+def find_class_type(target, name):
+	"finds the type of a class by its TypeInfo_Class name, remembering which name it was found under"
+	cache = type_cache(target)
+	cached_name = cache.get("classes", name)
+	if cached_name is not None:
+		tpObject = find_type(target, cached_name)
+		if tpObject:
+			return tpObject
+		cache.forget("classes", name)
+
+	tpObject = find_type(target, name)
+	if not tpObject and '.' not in name:
+		# dmd: 'object' module is implicitly imported
+		tpObject = find_type(target, 'object.' + name)
+
+	if not tpObject and '.' in name:
+		# ldc: doesn't find types prefixed with e.g. 'object.'
+		last_idx = name.rfind('.')
+		tpObject = find_type(target, name[last_idx+1:])
+
+	if tpObject:
+		cache.set("classes", name, tpObject.GetName())
+	return tpObject
+
 class DObjectPrinter(BaseSynthProvider):
 	def initialize(self):
 		pass
@@ -428,6 +1273,12 @@ class DObjectPrinter(BaseSynthProvider):
 		if self.valobj.GetName().startswith('*'):
 			# stop recursion when dereferencing values
 			return
+
+		# every pointer matches, skip the ones declared in C/C++ modules (SBType.GetModule needs LLDB 16)
+		if hasattr(lldb.SBType, 'GetModule'):
+			module = self.valobj.GetType().GetModule()
+			if module.IsValid() and not is_d_module(module):
+				return
 	
 		if is_ptr_to_class(self.valobj):
 			# print('should be class:',self.valobj.GetTypeName())
@@ -450,12 +1301,12 @@ class DObjectPrinter(BaseSynthProvider):
 		
 		# object of any interface I (technically I* b/c reference semantics) can be cast into Interface***
 
-		address = self.valobj.Cast(target.FindFirstType("void").GetPointerType().GetPointerType().GetPointerType())
+		address = self.valobj.Cast(find_type(target, "void").GetPointerType().GetPointerType().GetPointerType())
 		interface_struct_address = address.Dereference().Dereference().GetValueAsUnsigned()
 
 		# Interface has field 'offset' at relative location 0x18
 		offset_address = interface_struct_address + 0x18
-		offset = self.valobj.CreateValueFromAddress("offset_ptr", offset_address, target.FindFirstType("ulong").GetPointerType())
+		offset = self.valobj.CreateValueFromAddress("offset_ptr", offset_address, find_type(target, "ulong").GetPointerType())
 
 
 		# offset is relative location between interface and object pointer
@@ -480,37 +1331,64 @@ class DObjectPrinter(BaseSynthProvider):
 
 	def get_dynamic_value_from_address(self, address):
 		target: lldb.SBTarget = self.valobj.GetTarget()
-		void_ptr_type:lldb.SBType = target.FindFirstType("void").GetPointerType()
+		void_ptr_type:lldb.SBType = find_type(target, "void").GetPointerType()
 
 		typeinfo_class = self.valobj.CreateValueFromAddress("obj_ptr", address,void_ptr_type.GetPointerType())
+		# the vtable symbol of the class identifies it without any further reads
+		tpObject = self.get_indexed_class(target, typeinfo_class.GetValueAsUnsigned())
+		if tpObject:
+			return self.valobj.CreateValueFromAddress('', address, tpObject)
 		# TypeInfo_Class has field 'name' at relative location 0x20
 		tic_address = typeinfo_class.Dereference().GetValueAsUnsigned() 
 		if not tic_address:
 			return
+		tpObject = self.get_indexed_class(target, tic_address)
+		if tpObject:
+			return self.valobj.CreateValueFromAddress('', address, tpObject)
+		cache = type_cache(target)
+		classinfo = target.ResolveLoadAddress(tic_address)
+		classinfo_key = None
+		cached_name = None
+		if classinfo.GetModule().IsValid():
+			# file addresses stay the same across sessions, unlike load addresses
+			classinfo_key = '%s:%x' % (classinfo.GetModule().GetUUIDString(), classinfo.GetFileAddress())
+			cached_name = cache.get("classinfo", classinfo_key)
+		if cached_name is not None:
+			tpObject = find_type(target, cached_name)
+			if tpObject:
+				return self.valobj.CreateValueFromAddress('', address, tpObject)
+			# validated lazily, the cached name doesn't resolve anymore
+			cache.forget("classinfo", classinfo_key)
+
 		name_address = tic_address + 0x20
-		name_value = self.valobj.CreateValueFromAddress("class_name", name_address, target.FindFirstType("string"))
+		name_value = self.valobj.CreateValueFromAddress("class_name", name_address, find_type(target, "string"))
 		name = (name_value.GetSummary() or '').strip('"')
 		if not name:
 			return
-		
-		tpObject = target.FindFirstType(name)
-		if not tpObject and '.' not in name:
-			# dmd: 'object' module is implicitly imported
-			tpObject = target.FindFirstType('object.' + name)
-		
-		if not tpObject and '.' in name:
-			# ldc: doesn't find types prefixed with e.g. 'object.'
-			last_idx = name.rfind('.')
-			tpObject = target.FindFirstType(name[last_idx+1:])
 
+		tpObject = find_class_type(target, name)
 		if not tpObject:
 			# TODO: LDC does not publish types unless they are used as static type
 			# print('could not find type', name)
 			log.error('could not find type %s', name)
 			return
 
+		if classinfo_key is not None:
+			cache.set("classinfo", classinfo_key, tpObject.GetName())
 		return self.valobj.CreateValueFromAddress('', address, tpObject)
 	
+	def get_indexed_class(self, target, address):
+		"returns the class type of a vtable or TypeInfo_Class address using the symbol index"
+		if not address:
+			return None
+		name = class_from_index(target, address)
+		if name is None:
+			return None
+		tpObject = find_type(target, name)
+		if not tpObject:
+			tpObject = find_class_type(target, name)
+		return tpObject
+
 	def num_children(self):
 		return self.valobj.GetNumChildren()
 
@@ -528,7 +1406,7 @@ class DObjectPrinter(BaseSynthProvider):
 			return self.type_name
 
 		try:
-			tpVoidPtr = self.valobj.target.FindFirstType("void").GetPointerType()
+			tpVoidPtr = find_type(self.valobj.target, "void").GetPointerType()
 			addr= self.valobj.Cast(tpVoidPtr).GetValueAsUnsigned()
 			if not addr:
 				return '%s(null)' % self.valobj.GetTypeName()
@@ -566,104 +1444,1442 @@ def escape_string(str):
 		return str
 
 def parse_d_type(target, type):
-	return target.FindFirstType(type)
+	return find_type(target, type)
+
+# DMD backend type names -> functions returning the D type
+dmd_types = {
+	"bool": lambda target: find_type(target, "bool"),
+	"char": lambda target: find_type(target, "char"),
+	"signed char": lambda target: find_type(target, "ubyte"),
+	"unsigned char": lambda target: find_type(target, "ubyte"),
+	"char8_t": lambda target: find_type(target, "char"),
+	"char16_t": lambda target: find_type(target, "wchar_t"),
+	"short": lambda target: find_type(target, "short"),
+	"wchar_t": lambda target: find_type(target, "wchar_t"),
+	"unsigned short": lambda target: find_type(target, "short"),
+	"enum": lambda target: find_type(target, "int"),
+	"int": lambda target: find_type(target, "int"),
+	"unsigned": lambda target: find_type(target, "int"),
+	"long": lambda target: find_type(target, "int"),
+	"unsigned long": lambda target: find_type(target, "int"),
+	"dchar": lambda target: find_type(target, "dchar"),
+	"long long": lambda target: find_type(target, "long"),
+	"uns long long": lambda target: find_type(target, "long"),
+	"cent": lambda target: find_type(target, "void"),
+	"ucent": lambda target: find_type(target, "void"),
+	"float": lambda target: find_type(target, "float"),
+	"double": lambda target: find_type(target, "double"),
+	"double alias": lambda target: find_type(target, "double"),
+	"long double": lambda target: find_type(target, "long double"),
+	"imaginary float": lambda target: find_type(target, "float"),
+	"imaginary double": lambda target: find_type(target, "double"),
+	"imaginary long double": lambda target: find_type(target, "long double"),
+	"complex float": lambda target: find_type(target, "__complex float"),
+	"complex double": lambda target: find_type(target, "__complex double"),
+	"complex long double": lambda target: find_type(target, "__complex long double"),
+	"float[4]": lambda target: find_type(target, "float").GetArrayType(4),
+	"double[2]": lambda target: find_type(target, "double").GetArrayType(2),
+	"signed char[16]": lambda target: find_type(target, "ubyte").GetArrayType(16),
+	"unsigned char[16]": lambda target: find_type(target, "ubyte").GetArrayType(16),
+	"short[8]": lambda target: find_type(target, "short").GetArrayType(8),
+	"unsigned short[8]": lambda target: find_type(target, "short").GetArrayType(8),
+	"long[4]": lambda target: find_type(target, "int").GetArrayType(4),
+	"unsigned long[4]": lambda target: find_type(target, "int").GetArrayType(4),
+	"long long[2]": lambda target: find_type(target, "long").GetArrayType(2),
+	"unsigned long long[2]": lambda target: find_type(target, "long").GetArrayType(2),
+	"float[8]": lambda target: find_type(target, "float").GetArrayType(8),
+	"double[4]": lambda target: find_type(target, "double").GetArrayType(4),
+	"signed char[32]": lambda target: find_type(target, "ubyte").GetArrayType(32),
+	"unsigned char[32]": lambda target: find_type(target, "ubyte").GetArrayType(32),
+	"short[16]": lambda target: find_type(target, "short").GetArrayType(16),
+	"unsigned short[16]": lambda target: find_type(target, "short").GetArrayType(16),
+	"long[8]": lambda target: find_type(target, "int").GetArrayType(8),
+	"unsigned long[8]": lambda target: find_type(target, "int").GetArrayType(8),
+	"long long[4]": lambda target: find_type(target, "long").GetArrayType(4),
+	"unsigned long long[4]": lambda target: find_type(target, "long").GetArrayType(4),
+	"float[16]": lambda target: find_type(target, "float").GetArrayType(16),
+	"double[8]": lambda target: find_type(target, "double").GetArrayType(8),
+	"signed char[64]": lambda target: find_type(target, "ubyte").GetArrayType(64),
+	"unsigned char[64]": lambda target: find_type(target, "ubyte").GetArrayType(64),
+	"short[32]": lambda target: find_type(target, "short").GetArrayType(32),
+	"unsigned short[32]": lambda target: find_type(target, "short").GetArrayType(32),
+	"long[16]": lambda target: find_type(target, "int").GetArrayType(16),
+	"unsigned long[16]": lambda target: find_type(target, "int").GetArrayType(16),
+	"long long[8]": lambda target: find_type(target, "long").GetArrayType(8),
+	"unsigned long long[8]": lambda target: find_type(target, "long").GetArrayType(8),
+	"nullptr_t": lambda target: find_type(target, "void"),
+	"*": lambda target: find_type(target, "void").GetPointerType(),
+	"&": lambda target: find_type(target, "void").GetReferenceType(),
+	"void": lambda target: find_type(target, "void"),
+	"noreturn": lambda target: find_type(target, "void"),
+	"struct": lambda target: find_type(target, "void"),
+	"array": lambda target: find_type(target, "void"),
+	"C func": lambda target: find_type(target, "void").GetPointerType(),
+	"Pascal func": lambda target: find_type(target, "void").GetPointerType(),
+	"std func": lambda target: find_type(target, "void").GetPointerType(),
+	"*": lambda target: find_type(target, "void").GetPointerType(),
+	"member func": lambda target: find_type(target, "void").GetPointerType(),
+	"D func": lambda target: find_type(target, "void").GetPointerType(),
+	"C func": lambda target: find_type(target, "void").GetPointerType(),
+	"__near &": lambda target: find_type(target, "void").GetReferenceType(),
+	"__ss *": lambda target: find_type(target, "void").GetPointerType(),
+	"__cs *": lambda target: find_type(target, "void").GetPointerType(),
+	"__far16 *": lambda target: find_type(target, "void").GetPointerType(),
+	"__far *": lambda target: find_type(target, "void").GetPointerType(),
+	"__huge *": lambda target: find_type(target, "void").GetPointerType(),
+	"__handle *": lambda target: find_type(target, "void").GetPointerType(),
+	"__immutable *": lambda target: find_type(target, "void").GetPointerType(),
+	"__shared *": lambda target: find_type(target, "void").GetPointerType(),
+	"__restrict *": lambda target: find_type(target, "void").GetPointerType(),
+	"__fg *": lambda target: find_type(target, "void").GetPointerType(),
+	"far C func": lambda target: find_type(target, "void").GetPointerType(),
+	"far Pascal func": lambda target: find_type(target, "void").GetPointerType(),
+	"far std func": lambda target: find_type(target, "void").GetPointerType(),
+	"_far16 Pascal func": lambda target: find_type(target, "void").GetPointerType(),
+	"sys func": lambda target: find_type(target, "void").GetPointerType(),
+	"far sys func": lambda target: find_type(target, "void").GetPointerType(),
+	"__far &": lambda target: find_type(target, "void").GetReferenceType(),
+	"interrupt func": lambda target: find_type(target, "void").GetPointerType(),
+	"memptr": lambda target: find_type(target, "void").GetPointerType(),
+	"ident": lambda target: find_type(target, "void"),
+	"template": lambda target: find_type(target, "void"),
+	"vtshape": lambda target: find_type(target, "void"),
+}
 
 def parse_dmd_type(target, type):
-	return {
-		"bool": target.FindFirstType("bool"),
-		"char": target.FindFirstType("char"),
-		"signed char": target.FindFirstType("ubyte"),
-		"unsigned char": target.FindFirstType("ubyte"),
-		"char8_t": target.FindFirstType("char"),
-		"char16_t": target.FindFirstType("wchar_t"),
-		"short": target.FindFirstType("short"),
-		"wchar_t": target.FindFirstType("wchar_t"),
-		"unsigned short": target.FindFirstType("short"),
-		"enum": target.FindFirstType("int"),
-		"int": target.FindFirstType("int"),
-		"unsigned": target.FindFirstType("int"),
-		"long": target.FindFirstType("int"),
-		"unsigned long": target.FindFirstType("int"),
-		"dchar": target.FindFirstType("dchar"),
-		"long long": target.FindFirstType("long"),
-		"uns long long": target.FindFirstType("long"),
-		"cent": target.FindFirstType("void"),
-		"ucent": target.FindFirstType("void"),
-		"float": target.FindFirstType("float"),
-		"double": target.FindFirstType("double"),
-		"double alias": target.FindFirstType("double"),
-		"long double": target.FindFirstType("long double"),
-		"imaginary float": target.FindFirstType("float"),
-		"imaginary double": target.FindFirstType("double"),
-		"imaginary long double": target.FindFirstType("long double"),
-		"complex float": target.FindFirstType("__complex float"),
-		"complex double": target.FindFirstType("__complex double"),
-		"complex long double": target.FindFirstType("__complex long double"),
-		"float[4]": target.FindFirstType("float").GetArrayType(4),
-		"double[2]": target.FindFirstType("double").GetArrayType(2),
-		"signed char[16]": target.FindFirstType("ubyte").GetArrayType(16),
-		"unsigned char[16]": target.FindFirstType("ubyte").GetArrayType(16),
-		"short[8]": target.FindFirstType("short").GetArrayType(8),
-		"unsigned short[8]": target.FindFirstType("short").GetArrayType(8),
-		"long[4]": target.FindFirstType("int").GetArrayType(4),
-		"unsigned long[4]": target.FindFirstType("int").GetArrayType(4),
-		"long long[2]": target.FindFirstType("long").GetArrayType(2),
-		"unsigned long long[2]": target.FindFirstType("long").GetArrayType(2),
-		"float[8]": target.FindFirstType("float").GetArrayType(8),
-		"double[4]": target.FindFirstType("double").GetArrayType(4),
-		"signed char[32]": target.FindFirstType("ubyte").GetArrayType(32),
-		"unsigned char[32]": target.FindFirstType("ubyte").GetArrayType(32),
-		"short[16]": target.FindFirstType("short").GetArrayType(16),
-		"unsigned short[16]": target.FindFirstType("short").GetArrayType(16),
-		"long[8]": target.FindFirstType("int").GetArrayType(8),
-		"unsigned long[8]": target.FindFirstType("int").GetArrayType(8),
-		"long long[4]": target.FindFirstType("long").GetArrayType(4),
-		"unsigned long long[4]": target.FindFirstType("long").GetArrayType(4),
-		"float[16]": target.FindFirstType("float").GetArrayType(16),
-		"double[8]": target.FindFirstType("double").GetArrayType(8),
-		"signed char[64]": target.FindFirstType("ubyte").GetArrayType(64),
-		"unsigned char[64]": target.FindFirstType("ubyte").GetArrayType(64),
-		"short[32]": target.FindFirstType("short").GetArrayType(32),
-		"unsigned short[32]": target.FindFirstType("short").GetArrayType(32),
-		"long[16]": target.FindFirstType("int").GetArrayType(16),
-		"unsigned long[16]": target.FindFirstType("int").GetArrayType(16),
-		"long long[8]": target.FindFirstType("long").GetArrayType(8),
-		"unsigned long long[8]": target.FindFirstType("long").GetArrayType(8),
-		"nullptr_t": target.FindFirstType("void"),
-		"*": target.FindFirstType("void").GetPointerType(),
-		"&": target.FindFirstType("void").GetReferenceType(),
-		"void": target.FindFirstType("void"),
-		"noreturn": target.FindFirstType("void"),
-		"struct": target.FindFirstType("void"),
-		"array": target.FindFirstType("void"),
-		"C func": target.FindFirstType("void").GetPointerType(),
-		"Pascal func": target.FindFirstType("void").GetPointerType(),
-		"std func": target.FindFirstType("void").GetPointerType(),
-		"*": target.FindFirstType("void").GetPointerType(),
-		"member func": target.FindFirstType("void").GetPointerType(),
-		"D func": target.FindFirstType("void").GetPointerType(),
-		"C func": target.FindFirstType("void").GetPointerType(),
-		"__near &": target.FindFirstType("void").GetReferenceType(),
-		"__ss *": target.FindFirstType("void").GetPointerType(),
-		"__cs *": target.FindFirstType("void").GetPointerType(),
-		"__far16 *": target.FindFirstType("void").GetPointerType(),
-		"__far *": target.FindFirstType("void").GetPointerType(),
-		"__huge *": target.FindFirstType("void").GetPointerType(),
-		"__handle *": target.FindFirstType("void").GetPointerType(),
-		"__immutable *": target.FindFirstType("void").GetPointerType(),
-		"__shared *": target.FindFirstType("void").GetPointerType(),
-		"__restrict *": target.FindFirstType("void").GetPointerType(),
-		"__fg *": target.FindFirstType("void").GetPointerType(),
-		"far C func": target.FindFirstType("void").GetPointerType(),
-		"far Pascal func": target.FindFirstType("void").GetPointerType(),
-		"far std func": target.FindFirstType("void").GetPointerType(),
-		"_far16 Pascal func": target.FindFirstType("void").GetPointerType(),
-		"sys func": target.FindFirstType("void").GetPointerType(),
-		"far sys func": target.FindFirstType("void").GetPointerType(),
-		"__far &": target.FindFirstType("void").GetReferenceType(),
-		"interrupt func": target.FindFirstType("void").GetPointerType(),
-		"memptr": target.FindFirstType("void").GetPointerType(),
-		"ident": target.FindFirstType("void"),
-		"template": target.FindFirstType("void"),
-		"vtshape": target.FindFirstType("void"),
-	}.get(type, "void")
+	return dmd_types.get(type, lambda target: find_type(target, "void"))(target)
+
+# handle id -> SBValue of subtrees left out by dlang-json, valid until the process resumes
+json_handles = {}
+json_handles_stop_id = None
+last_json_handle = 0
+
+def add_json_handle(value, offset):
+	"returns a handle expanding value starting at its child `offset`"
+	global json_handles_stop_id, last_json_handle
+	stop_id = value.GetProcess().GetStopID()
+	if stop_id != json_handles_stop_id:
+		json_handles.clear()
+		json_handles_stop_id = stop_id
+	last_json_handle += 1
+	json_handles[last_json_handle] = (value, offset)
+	return last_json_handle
+
+def value_json(name, value, depth, max_children, offset=0):
+	"converts a value to a JSON compatible dict using the registered synthetic providers and summaries, starting at child `offset`"
+	node = { "name": name, "type": value.GetTypeName() }
+	if value.GetError().Fail():
+		node["error"] = value.GetError().GetCString()
+		return node
+	summary = value.GetSummary()
+	if summary is None:
+		summary = value.GetValue()
+	if summary is not None:
+		node["value"] = summary
+
+	num_children = value.GetNumChildren()
+	if num_children == 0:
+		return node
+	if depth <= 0:
+		node["handle"] = add_json_handle(value, 0)
+		return node
+
+	if offset:
+		node["offset"] = offset
+	node["children"] = []
+	for i in range(offset, min(num_children, offset + max_children)):
+		child = value.GetChildAtIndex(i)
+		node["children"].append(value_json(child.GetName(), child, depth - 1, max_children))
+	if num_children > offset + max_children:
+		node["truncated"] = True
+		node["handle"] = add_json_handle(value, offset + max_children)
+	return node
+
+def dlang_json(debugger, command, result, internal_dict):
+	"""Print a D value and its children as a single JSON document (done by IDE)
+
+	Usage: dlang-json [expression] [--depth N] [--max-children M]
+	       dlang-json --handle H [--depth N] [--max-children M]
+
+	Subtrees deeper than N (default 1) or with more than M (default 100) children
+	get a "handle" which can be expanded with --handle until the process resumes.
+	The handle of a truncated node continues with the children that were left out."""
+	args = shlex.split(command)
+	depth = 1
+	max_children = 100
+	handle = None
+	expression = []
+	i = 0
+	while i < len(args):
+		if args[i] in ('--depth', '--max-children', '--handle') and i + 1 < len(args):
+			if args[i] == '--depth':
+				depth = int(args[i + 1])
+			elif args[i] == '--max-children':
+				max_children = int(args[i + 1])
+			else:
+				handle = int(args[i + 1])
+			i += 2
+		else:
+			expression.append(args[i])
+			i += 1
+
+	process = debugger.GetSelectedTarget().GetProcess()
+	offset = 0
+	if handle is not None:
+		if handle not in json_handles or process.GetStopID() != json_handles_stop_id:
+			result.SetError("Unknown or expired handle: %s" % handle)
+			return
+		value, offset = json_handles[handle]
+		name = str(handle)
+	elif expression:
+		name = ' '.join(expression)
+		value = evaluate(debugger, name)
+	else:
+		result.SetError("Usage: dlang-json [expression] [--depth N] [--max-children M]")
+		return
+
+	result.AppendMessage(json.dumps(value_json(name, value, depth, max_children, offset), separators=(',', ':')))
+
+def evaluate(debugger, expression):
+	"evaluates an expression in the selected frame, preferring the cheaper variable path lookup"
+	frame = debugger.GetSelectedTarget().GetProcess().GetSelectedThread().GetSelectedFrame()
+	value = frame.GetValueForVariablePath(expression)
+	if not value.IsValid() or value.GetError().Fail():
+		value = frame.EvaluateExpression(expression)
+	return value
+
+def slice_of(value):
+	"returns (address, length, element type) of a slice or static array"
+	value = value.GetNonSyntheticValue()
+	type = value.GetType().GetCanonicalType()
+	if type.IsArrayType():
+		return value.GetLoadAddress(), value.GetNumChildren(), type.GetArrayElementType().GetCanonicalType()
+	ptr = value.GetChildMemberWithName("ptr")
+	length = value.GetChildMemberWithName("length").GetValueAsUnsigned()
+	return ptr.GetValueAsUnsigned(), length, ptr.GetType().GetPointeeType().GetCanonicalType()
+
+def read_slice(process, address, offset, size):
+	data = read_memory(process, address + offset, size)
+	if data is None:
+		raise IOError('failed reading 0x%x' % (address + offset))
+	return data
+
+def element_kind(type):
+	"returns 'char', 'int', 'float' or 'bool' for the scalar element types dlang-find can search"
+	if type.GetName() in ('char', 'wchar', 'dchar', 'char8_t', 'char16_t', 'char32_t'):
+		return 'char'
+	elif type.GetBasicType() == lldb.eBasicTypeBool or type.GetName() == 'bool':
+		return 'bool'
+	flags = type.GetTypeFlags()
+	if flags & (lldb.eTypeIsInteger | lldb.eTypeIsEnumeration) or type.GetBasicType() == lldb.eBasicTypeVoid:
+		return 'int'
+	elif flags & lldb.eTypeIsFloat:
+		return 'float'
+	return None
+
+def find_needles(kind, item_size, text, order):
+	"encodes the searched value or substring as it is stored in memory, returns a list of byte patterns"
+	integer_formats = { 1: 'B', 2: 'H', 4: 'I', 8: 'Q' }
+	if kind == 'char' or (kind == 'int' and item_size == 1 and not re.match(r'^-?(0x[0-9a-fA-F]+|[0-9]+)$', text)):
+		if len(text) >= 2 and text[0] == text[-1] and text[0] in '"\'':
+			text = text[1:-1]
+		encoding = { 1: 'utf-8', 2: 'utf-16', 4: 'utf-32' }[item_size]
+		if item_size > 1:
+			encoding += '-le' if order == '<' else '-be'
+		return [text.encode(encoding)]
+	elif kind == 'int':
+		try:
+			value = int(text, 0)
+		except ValueError:
+			raise ValueError('%s is not an integer' % text)
+		# masking makes negative values match their two's complement representation
+		value &= (1 << (8 * item_size)) - 1
+		return [struct.pack(order + integer_formats[item_size], value)]
+	elif kind == 'float':
+		try:
+			value = float(text)
+		except ValueError:
+			raise ValueError('%s is not a floating point number' % text)
+		format = order + { 4: 'f', 8: 'd' }[item_size]
+		if value == 0:
+			return [struct.pack(format, 0.0), struct.pack(format, -0.0)]
+		return [struct.pack(format, value)]
+	elif kind == 'bool':
+		if text not in ('true', 'false'):
+			raise ValueError('%s is not true or false' % text)
+		return [struct.pack('B', 1 if text == 'true' else 0)]
+	raise ValueError('cannot search %s elements of size %d' % (kind, item_size))
+
+def find_in_chunks(read, size, needle, alignment, limit):
+	"""returns up to limit byte offsets aligned to alignment at which needle occurs
+
+	read(offset, length) is called with chunks of scan_chunk_size bytes, the end
+	of the previous chunk is kept so matches crossing chunk borders are found."""
+	matches = []
+	overlap = (len(needle) - 1 + alignment - 1) // alignment * alignment
+	chunk_size = max(alignment, scan_chunk_size - scan_chunk_size % alignment)
+	offset = 0
+	min_match = 0
+	tail = b''
+	while offset < size and len(matches) < limit:
+		chunk = read(offset, min(chunk_size, size - offset))
+		data = tail + chunk
+		base = offset - len(tail)
+		pos = data.find(needle)
+		while pos != -1 and len(matches) < limit:
+			if pos % alignment == 0 and base + pos >= min_match:
+				matches.append(base + pos)
+			pos = data.find(needle, pos + 1)
+		offset += len(chunk)
+		# matches starting before this were fully contained in the scanned data
+		min_match = offset - len(needle) + 1
+		tail = data[len(data) - overlap:] if overlap else b''
+	return matches
+
+def dlang_find(debugger, command, result, internal_dict):
+	"""Find the indices of a value or substring in a D slice without expanding it
+
+	Usage: dlang-find [slice expression] [value|substring] [--limit N]
+
+	Works on char, integral, floating point and bool slices and prints up to N (default 100) indices."""
+	args = shlex.split(command)
+	limit = 100
+	if len(args) >= 2 and args[-2] == '--limit':
+		try:
+			limit = int(args[-1])
+		except ValueError:
+			result.SetError("--limit %s is not a number" % args[-1])
+			return
+		args = args[:-2]
+	if len(args) != 2:
+		result.SetError("Usage: dlang-find [slice expression] [value|substring] [--limit N]")
+		return
+
+	value = evaluate(debugger, args[0])
+	if value.GetError().Fail():
+		result.SetError(value.GetError().GetCString())
+		return
+	process = value.GetProcess()
+	address, length, type = slice_of(value)
+	item_size = max(1, type.GetByteSize())
+	kind = element_kind(type)
+	if kind is None:
+		result.SetError("Cannot search slices of %s" % type.GetName())
+		return
+	invalid = validate_slice(process, address, length, item_size)
+	if invalid is not None:
+		result.SetError(invalid)
+		return
+
+	try:
+		needles = find_needles(kind, item_size, args[1], struct_byte_order(process))
+	except ValueError as e:
+		result.SetError(str(e))
+		return
+	read = lambda offset, size: read_slice(process, address, offset, size)
+	matches = []
+	for needle in needles:
+		# one more than shown tells whether the search was cut short
+		matches.extend(find_in_chunks(read, length * item_size, needle, item_size, limit + 1))
+	matches = sorted(matches)
+	for offset in matches[:limit]:
+		result.AppendMessage('[%d] @ 0x%x' % (offset // item_size, address + offset))
+	if len(matches) > limit:
+		result.AppendMessage('stopped after %d matches' % limit)
+	else:
+		result.AppendMessage('%d matches' % len(matches))
+
+def array_typecode(type):
+	"returns the array module typecode for numeric element types or None"
+	kind = element_kind(type)
+	size = type.GetByteSize()
+	if kind in ('int', 'bool') and size in (1, 2, 4, 8):
+		typecode = { 1: 'b', 2: 'h', 4: 'i', 8: 'q' }[size]
+		return typecode if kind == 'int' and type.GetTypeFlags() & lldb.eTypeIsSigned else typecode.upper()
+	elif kind == 'float' and size in (4, 8):
+		return { 4: 'f', 8: 'd' }[size]
+	return None
+
+class DSliceStats(object):
+	"min, max, mean, NaN and infinity counts and power of two magnitude histogram, updated chunk by chunk"
+
+	def __init__(self):
+		self.count = 0
+		self.nan = 0
+		self.inf = 0
+		self.negative_inf = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+		self.histogram = collections.Counter()
+
+	def add(self, values):
+		if not values:
+			return
+		self.count += len(values)
+		try:
+			total = math.fsum(values)
+		except (OverflowError, ValueError):
+			# ValueError for +inf and -inf in one chunk, OverflowError for finite sums out of range
+			total = float('nan')
+		if math.isinf(total) or total != total:
+			# only filter element by element if there is a NaN, an infinity or an overflow in the chunk
+			numbers = [x for x in values if x == x]
+			self.nan += len(values) - len(numbers)
+			values = numbers
+			if not values:
+				return
+			finite = [x for x in values if not math.isinf(x)]
+			infinite = len(values) - len(finite)
+			if infinite:
+				positive = sum(1 for x in values if x > 0 and math.isinf(x))
+				self.inf += positive
+				self.negative_inf += infinite - positive
+			try:
+				total = math.fsum(finite)
+			except OverflowError:
+				total = sum(finite)
+		self.total += total
+		low = min(values)
+		high = max(values)
+		self.min = low if self.min is None else min(self.min, low)
+		self.max = high if self.max is None else max(self.max, high)
+		self.histogram.update(map(magnitude_bucket, values))
+
+	def mean(self):
+		if self.inf and self.negative_inf:
+			return float('nan')
+		elif self.inf:
+			return float('inf')
+		elif self.negative_inf:
+			return float('-inf')
+		numbers = self.count - self.nan
+		return self.total / numbers if numbers else float('nan')
+
+	def summary(self):
+		return '{min=%s, max=%s, mean=%s}' % (self.min, self.max, self.mean())
+
+	def lines(self):
+		yield 'count: %d' % self.count
+		yield 'min: %s' % self.min
+		yield 'max: %s' % self.max
+		yield 'mean: %s' % self.mean()
+		yield 'nan: %d' % self.nan
+		yield 'inf: %d, -inf: %d' % (self.inf, self.negative_inf)
+		yield 'histogram:'
+		for bucket in sorted(self.histogram, key = magnitude_order):
+			yield '  %s: %d' % (magnitude_range(bucket), self.histogram[bucket])
+
+def magnitude_bucket(x):
+	"returns (sign, e) with 2^(e-1) <= |x| < 2^e, e is inf for infinite values"
+	if x == 0:
+		return (0, 0)
+	sign = 1 if x > 0 else -1
+	if math.isinf(x):
+		return (sign, x * sign)
+	return (sign, math.frexp(x)[1])
+
+def magnitude_order(bucket):
+	sign, exponent = bucket
+	return (sign, sign * exponent)
+
+def power_of_two(exponent):
+	try:
+		return '%g' % math.ldexp(1, exponent)
+	except OverflowError:
+		# the upper bound of the bucket of values >= 2^1023 like double.max is no double anymore
+		return '2^%d' % exponent
+
+def magnitude_range(bucket):
+	sign, exponent = bucket
+	if sign == 0:
+		return '0'
+	elif math.isinf(exponent):
+		return 'inf' if sign > 0 else '-inf'
+	elif sign > 0:
+		return '[%s, %s)' % (power_of_two(exponent - 1), power_of_two(exponent))
+	else:
+		return '(-%s, -%s]' % (power_of_two(exponent), power_of_two(exponent - 1))
+
+def slice_stats(read, length, typecode, order):
+	"computes DSliceStats over a slice reading and decoding it in chunks of scan_chunk_size bytes"
+	item_size = array.array(typecode).itemsize
+	chunk_size = max(item_size, scan_chunk_size - scan_chunk_size % item_size)
+	swap = order != ('<' if sys.byteorder == 'little' else '>')
+	stats = DSliceStats()
+	size = length * item_size
+	for offset in range(0, size, chunk_size):
+		values = array.array(typecode)
+		values.frombytes(read(offset, min(chunk_size, size - offset)))
+		if swap:
+			values.byteswap()
+		stats.add(values)
+	return stats
+
+def dlang_stats_of(debugger, command, result, internal_dict):
+	"""Print min, max, mean, NaN count and a histogram of a numeric D slice
+
+	Usage: dlang-stats-of [slice expression]
+
+	The slice is read in chunks, so this works on slices of any size."""
+	if not command.strip():
+		result.SetError("Usage: dlang-stats-of [slice expression]")
+		return
+
+	value = evaluate(debugger, command.strip())
+	if value.GetError().Fail():
+		result.SetError(value.GetError().GetCString())
+		return
+	process = value.GetProcess()
+	address, length, type = slice_of(value)
+	typecode = array_typecode(type)
+	if typecode is None:
+		result.SetError("Cannot compute statistics of %s" % type.GetName())
+		return
+	invalid = validate_slice(process, address, length, type.GetByteSize())
+	if invalid is not None:
+		result.SetError(invalid)
+		return
+
+	stats = slice_stats(lambda offset, size: read_slice(process, address, offset, size), length, typecode, struct_byte_order(process))
+	for line in stats.lines():
+		result.AppendMessage(line)
+
+def synthetic_class_for(type_name):
+	"returns the synth class LLDB picks for a type name, the last attached matching one"
+	for regex, synth_class in reversed(synthetic_types):
+		if regex.search(type_name):
+			return synth_class
+	return None
+
+class DPrefetcher(object):
+	"""warms the memory and decode caches for the D locals of the selected frame after each stop
+
+	The worker thread stops as soon as the process resumes, the stop ID changes
+	or prefetch_budget bytes have been read. Each variable reads at most one block
+	and the process state is checked before it, so the worker doesn't go on
+	reading once the process resumed. Like formatters it never holds cache_lock
+	while calling into LLDB, see there."""
+
+	def __init__(self, debugger):
+		self.listener = lldb.SBListener('lldb_dlang.prefetch')
+		self.listener.StartListeningForEventClass(debugger, lldb.SBProcess.GetBroadcasterClassName(), lldb.SBProcess.eBroadcastBitStateChanged)
+		self.cancelled = threading.Event()
+		self.worker = None
+		self.lock = threading.Lock()
+		thread = threading.Thread(target=self.run, name='lldb_dlang prefetch listener')
+		thread.daemon = True
+		thread.start()
+
+	def run(self):
+		event = lldb.SBEvent()
+		while True:
+			if not self.listener.WaitForEvent(1, event) or not lldb.SBProcess.EventIsProcessEvent(event):
+				continue
+			state = lldb.SBProcess.GetStateFromEvent(event)
+			if state == lldb.eStateStopped and not lldb.SBProcess.GetRestartedFromEvent(event):
+				if prefetch_locals:
+					self.start(lldb.SBProcess.GetProcessFromEvent(event))
+			else:
+				self.cancel()
+
+	def start(self, process):
+		with self.lock:
+			self.stop_worker()
+			self.cancelled = threading.Event()
+			self.worker = threading.Thread(target=self.prefetch, args=(process, process.GetStopID(), self.cancelled), name='lldb_dlang prefetch')
+			self.worker.daemon = True
+			self.worker.start()
+
+	def cancel(self):
+		with self.lock:
+			self.stop_worker()
+
+	def stop_worker(self):
+		self.cancelled.set()
+		if self.worker is not None:
+			self.worker.join()
+			self.worker = None
+
+	def prefetch(self, process, stop_id, cancelled):
+		try:
+			frame = process.GetSelectedThread().GetSelectedFrame()
+			if not frame.IsValid() or not is_d_module(frame.GetModule()):
+				return
+			budget = prefetch_budget
+			variables = frame.GetVariables(True, True, False, True)
+			for i in range(variables.GetSize()):
+				if budget <= 0 or cancelled.is_set() or process.GetState() != lldb.eStateStopped or process.GetStopID() != stop_id:
+					return
+				budget -= self.warm(variables.GetValueAtIndex(i).GetNonSyntheticValue(), budget)
+		except Exception as e:
+			log.error('prefetch failed: %s', e)
+
+	def warm(self, value, budget):
+		"reads what the printer of value will need first, returns the number of bytes read"
+		synth_class = synthetic_class_for(value.GetTypeName() or '')
+		if synth_class is None or synth_class is DByteBufferPrinter:
+			return 0
+		synth = synth_class(value)
+		if issubclass(synth_class, DBaseStringPrinter):
+			size = min(synth.length, 10000) * synth.get_charsize()
+			if size <= budget:
+				synth.get_summary()
+				return size
+		elif issubclass(synth_class, DArrayPrinter):
+			if synth.per_block and synth.length and synth.invalid is None and render_cache_block_size <= budget:
+				synth.get_block(0)
+				return min(synth.length * synth.item_size, render_cache_block_size)
+		elif synth_class is DAssocArrayPrinter:
+			if render_cache_block_size <= budget:
+				synth.entry_at(0)
+				return render_cache_block_size
+		return 0
+
+prefetcher = None
+
+def start_prefetcher(debugger):
+	global prefetcher
+	if prefetcher is None:
+		prefetcher = DPrefetcher(debugger)
+
+def dlang_prefetch(debugger, command, result, internal_dict):
+	"""Warm the caches for the D locals of the selected frame in the background after each stop
+
+	Usage: dlang-prefetch [on|off]"""
+	global prefetch_locals
+	command = command.strip()
+	if command not in ('on', 'off', ''):
+		result.SetError("Usage: dlang-prefetch [on|off]")
+		return
+	if command:
+		prefetch_locals = command == 'on'
+	if prefetch_locals:
+		start_prefetcher(debugger)
+	elif prefetcher is not None:
+		prefetcher.cancel()
+	result.AppendMessage('prefetching D locals is %s' % ('on' if prefetch_locals else 'off'))
+
+gc_page_size = 4096
+# qualified names of druntime's GC instance, newer druntime moved the GC into core.internal
+gc_instance_names = ['core.internal.gc.proxy.instance', 'gc.proxy.instance']
+# Bins of druntime versions before 2.097, used if the Bins enum is not in the debug info
+default_gc_bins = [('B_16', 0), ('B_32', 1), ('B_64', 2), ('B_128', 3), ('B_256', 4), ('B_512', 5),
+	('B_1024', 6), ('B_2048', 7), ('B_PAGE', 8), ('B_PAGEPLUS', 9), ('B_FREE', 10)]
+
+DGcPool = collections.namedtuple('DGcPool', ['base', 'npages', 'pagetable', 'large', 'freebits', 'finals', 'struct_finals', 'appendable'])
+
+def gc_bins(enumerators):
+	"returns ({Bins value: block size}, B_PAGE, B_PAGEPLUS) from the (name, value) pairs of druntime's Bins enum"
+	sizes = {}
+	values = {}
+	for name, value in enumerators:
+		name = name.split('.')[-1]
+		values[name] = value
+		if name[2:].isdigit():
+			sizes[value] = int(name[2:])
+	return sizes, values['B_PAGE'], values['B_PAGEPLUS']
+
+def read_gc_bits(read, data, first, count, word, order):
+	"""reads bits [first, first + count) of GCBits data, first being a multiple of the
+	word size in bits, returns whole words as bytes in little endian bit order"""
+	bits = word * 8
+	raw = read(data + first // 8, (count + bits - 1) // bits * word)
+	if order == '>':
+		raw = b''.join(raw[i:i + word][::-1] for i in range(0, len(raw), word))
+	return raw
+
+def bit_count(x):
+	return bin(x).count('1')
+
+class DGcTypeNames(object):
+	"names the types of finalized GC blocks from their vtable or TypeInfo, cached per address"
+
+	def __init__(self, read, word, order):
+		self.read = read
+		self.word = word
+		self.format = order + ('Q' if word == 8 else 'I')
+		self.names = {}
+
+	def __call__(self, kind, address):
+		name = self.names.get((kind, address))
+		if name is None:
+			try:
+				if kind == 'class':
+					# vtbl[0] is the TypeInfo_Class, its name follows vtbl, monitor and m_init
+					name = self.read_string(self.read_word(address) + 4 * self.word)
+				else:
+					# the name of TypeInfo_Struct follows vtbl and monitor, newer druntime keeps it mangled
+					name = self.read_string(address + 2 * self.word)
+					if name and name[0] == 'S':
+						name = d_qualified_name(name[1:]) or name
+			except IOError:
+				name = None
+			name = name or '<unknown %s>' % kind
+			self.names[(kind, address)] = name
+		return name
+
+	def read_word(self, address):
+		return struct.unpack(self.format, self.read(address, self.word))[0]
+
+	def read_string(self, address):
+		length = self.read_word(address)
+		if length > 4096:
+			return None
+		return self.read(self.read_word(address + self.word), length).decode('utf-8', 'replace')
+
+class DHeapStats(object):
+	"allocated GC blocks and bytes by size class and by type, updated pool chunk by pool chunk"
+
+	def __init__(self):
+		self.blocks = collections.Counter()
+		self.bytes = collections.Counter()
+		self.type_blocks = collections.Counter()
+		self.type_bytes = collections.Counter()
+		self.pools = 0
+		self.pages = 0
+		self.free_pages = 0
+
+	def add(self, size_class, count, size):
+		"size_class is (0, bin size) for small and (1, power of two) for large blocks"
+		self.blocks[size_class] += count
+		self.bytes[size_class] += count * size
+
+	def add_type(self, name, count, size):
+		self.type_blocks[name] += count
+		self.type_bytes[name] += count * size
+
+	def lines(self, top):
+		yield 'pools: %d, pages: %d (%d free)' % (self.pools, self.pages, self.free_pages)
+		yield '%-16s %12s %16s' % ('size class', 'blocks', 'bytes')
+		for size_class in sorted(self.blocks):
+			large, size = size_class
+			label = ('large <= %d' if large else '%d') % size
+			yield '%-16s %12d %16d' % (label, self.blocks[size_class], self.bytes[size_class])
+		yield '%-16s %12d %16d' % ('total', sum(self.blocks.values()), sum(self.bytes.values()))
+		if self.type_blocks:
+			yield ''
+			yield '%-48s %12s %16s' % ('type', 'blocks', 'bytes')
+			for name, size in self.type_bytes.most_common(top):
+				yield '%-48s %12d %16d' % (name, self.type_blocks[name], size)
+
+def scan_gc_pool(read, pool, bins, word, order, stats, type_name=None):
+	"""adds the allocated blocks of a GC pool to stats, reading heap_scan_pages pages at once
+
+	type_name(kind, address) names the type of blocks with the FINALIZE (kind 'class',
+	address of the vtable) or STRUCTFINAL (kind 'struct', address of the TypeInfo)
+	attribute, None skips the type breakdown."""
+	stats.pools += 1
+	stats.pages += pool.npages
+	if pool.large:
+		scan_large_gc_pool(read, pool, bins, word, order, stats, type_name)
+	else:
+		scan_small_gc_pool(read, pool, bins, word, order, stats, type_name)
+
+def scan_small_gc_pool(read, pool, bins, word, order, stats, type_name):
+	sizes = bins[0]
+	# small pools have a bit per 16 bytes, blocks of bin b start at the bits of block_masks[b]
+	page_bits = gc_page_size >> 4
+	page_bytes = page_bits // 8
+	block_masks = dict((bin, sum(1 << (k * size >> 4) for k in range(gc_page_size // size))) for bin, size in sizes.items())
+	format = order + ('Q' if word == 8 else 'I')
+	for first in range(0, pool.npages, heap_scan_pages):
+		count = min(heap_scan_pages, pool.npages - first)
+		pagetable = bytearray(read(pool.pagetable + first, count))
+		bits = [read_gc_bits(read, data, first * page_bits, count * page_bits, word, order) if data else None
+			for data in (pool.freebits, pool.finals if type_name else 0, pool.struct_finals if type_name else 0)]
+		page_int = lambda raw, i: int.from_bytes(raw[i * page_bytes:(i + 1) * page_bytes], 'little') if raw else 0
+		for i, bin in enumerate(pagetable):
+			size = sizes.get(bin)
+			if size is None:
+				stats.free_pages += 1
+				continue
+			allocated = ~page_int(bits[0], i) & block_masks[bin]
+			blocks = bit_count(allocated)
+			stats.add((0, size), blocks, size)
+			if type_name is None or not blocks:
+				continue
+			finals = page_int(bits[1], i)
+			typed = allocated & (finals | page_int(bits[2], i))
+			if blocks > bit_count(typed):
+				stats.add_type('<untyped>', blocks - bit_count(typed), size)
+			if not typed:
+				continue
+			data = read(pool.base + (first + i) * gc_page_size, gc_page_size)
+			while typed:
+				low = typed & -typed
+				typed ^= low
+				offset = (low.bit_length() - 1) << 4
+				if finals & low:
+					name = type_name('class', struct.unpack_from(format, data, offset)[0])
+				else:
+					# the TypeInfo of small blocks is stored in their last word
+					name = type_name('struct', struct.unpack_from(format, data, offset + size - word)[0])
+				stats.add_type(name, 1, size)
+
+def scan_large_gc_pool(read, pool, bins, word, order, stats, type_name):
+	page, page_plus = bins[1], bins[2]
+	format = order + ('Q' if word == 8 else 'I')
+	block = None
+	def flush(block):
+		pages, name, struct_address = block
+		size = pages * gc_page_size
+		stats.add((1, 1 << (size - 1).bit_length()), 1, size)
+		if struct_address is not None:
+			# structs which aren't array elements keep their TypeInfo in the last word of the block
+			name = type_name('struct', struct.unpack(format, read(struct_address + size - word, word))[0])
+		if name is not None:
+			stats.add_type(name, 1, size)
+	for first in range(0, pool.npages, heap_scan_pages):
+		count = min(heap_scan_pages, pool.npages - first)
+		pagetable = bytearray(read(pool.pagetable + first, count))
+		# large pools have a bit per page, read from the word containing the first one
+		aligned = first - first % (word * 8)
+		finals, struct_finals, appendable = [int.from_bytes(read_gc_bits(read, data, aligned, first + count - aligned, word, order), 'little') >> (first - aligned) if data else 0
+			for data in (pool.finals if type_name else 0, pool.struct_finals if type_name else 0, pool.appendable if type_name else 0)]
+		for i, bin in enumerate(pagetable):
+			if bin == page_plus and block is not None:
+				block[0] += 1
+				continue
+			if block is not None:
+				flush(block)
+				block = None
+			if bin != page:
+				stats.free_pages += 1
+				continue
+			name = None
+			struct_address = None
+			if type_name is not None:
+				address = pool.base + (first + i) * gc_page_size
+				if (finals >> i) & 1:
+					name = type_name('class', struct.unpack(format, read(address, word))[0])
+				elif (struct_finals >> i) & 1 and (appendable >> i) & 1:
+					# large arrays store their length first and the element TypeInfo after it
+					name = type_name('struct', struct.unpack(format, read(address + word, word))[0])
+				elif (struct_finals >> i) & 1:
+					# read from the end of the block once its size is known
+					struct_address = address
+				else:
+					name = '<untyped>'
+			block = [1, name, struct_address]
+	if block is not None:
+		flush(block)
+
+def find_gc_pools(target):
+	"returns the DGcPools and gc_bins of druntime's conservative GC instance"
+	process = target.GetProcess()
+	read = lambda address, size: read_slice(process, address, 0, size)
+	instance = None
+	for name in gc_instance_names:
+		value = target.FindFirstGlobalVariable(name)
+		if value.IsValid():
+			instance = value
+			break
+	if instance is None:
+		raise ValueError("GC instance not found, druntime needs to be built with debug info")
+	word = process.GetAddressByteSize()
+	order = struct_byte_order(process)
+	names = DGcTypeNames(read, word, order)
+	interface = instance.GetValueAsUnsigned()
+	if not interface:
+		raise ValueError("The GC is not initialized")
+	# the instance is a GC interface reference, the Interface in its vtable has the offset to the object
+	address = interface - names.read_word(names.read_word(names.read_word(interface)) + 3 * word)
+	class_name = names('class', names.read_word(address))
+	if not class_name.endswith('.ConservativeGC'):
+		raise ValueError("Only the conservative GC is supported, the GC is " + class_name)
+	gc_type = find_type(target, class_name)
+	if not gc_type.IsValid():
+		raise ValueError("No debug info for %s, druntime needs to be built with debug info" % class_name)
+
+	gc = target.CreateValueFromAddress('gc', lldb.SBAddress(address, target), gc_type)
+	pooltable = gc.GetChildMemberWithName('gcx').Dereference().GetChildMemberWithName('pooltable')
+	npools = pooltable.GetChildMemberWithName('npools').GetValueAsUnsigned()
+	pools_ptr = pooltable.GetChildMemberWithName('pools')
+	pool_type = pools_ptr.GetType().GetPointeeType().GetPointeeType()
+	field = lambda value, name, member=None: (value.GetChildMemberWithName(name).GetChildMemberWithName(member)
+		if member else value.GetChildMemberWithName(name)).GetValueAsUnsigned()
+	pools = []
+	enumerators = None
+	for pool_address in struct.unpack(order + size_t_format(process) * npools, read(pools_ptr.GetValueAsUnsigned(), npools * word)):
+		pool = target.CreateValueFromAddress('pool', lldb.SBAddress(pool_address, target), pool_type)
+		pools.append(DGcPool(field(pool, 'baseAddr'), field(pool, 'npages'), field(pool, 'pagetable'), bool(field(pool, 'isLargeObject')),
+			field(pool, 'freebits', 'data'), field(pool, 'finals', 'data'), field(pool, 'structFinals', 'data'),
+			field(pool, 'appendable', 'data')))
+		members = pool.GetChildMemberWithName('pagetable').GetType().GetPointeeType().GetCanonicalType().GetEnumMembers()
+		if members.IsValid() and members.GetSize():
+			enumerators = [(member.GetName(), member.GetValueAsUnsigned()) for member in
+				(members.GetTypeEnumMemberAtIndex(i) for i in range(members.GetSize()))]
+	if enumerators is None:
+		members = find_type(target, class_name[:-len('ConservativeGC')] + 'Bins').GetEnumMembers()
+		if members.IsValid() and members.GetSize():
+			enumerators = [(member.GetName(), member.GetValueAsUnsigned()) for member in
+				(members.GetTypeEnumMemberAtIndex(i) for i in range(members.GetSize()))]
+		else:
+			enumerators = default_gc_bins
+	return pools, gc_bins(enumerators)
+
+def dlang_heap(debugger, command, result, internal_dict):
+	"""Print the allocated blocks and bytes of the D GC heap by size class
+
+	Usage: dlang-heap [--types] [--top N]
+
+	Reads the pools of druntime's conservative GC, which needs druntime debug info.
+	With --types blocks of classes and of structs with destructors are also grouped
+	by type and the N (default 20) types using the most memory are shown."""
+	args = shlex.split(command)
+	types = False
+	top = 20
+	i = 0
+	while i < len(args):
+		if args[i] == '--types':
+			types = True
+			i += 1
+		elif args[i] == '--top' and i + 1 < len(args):
+			top = int(args[i + 1])
+			i += 2
+		else:
+			result.SetError("Usage: dlang-heap [--types] [--top N]")
+			return
+
+	target = debugger.GetSelectedTarget()
+	process = target.GetProcess()
+	read = lambda address, size: read_slice(process, address, 0, size)
+	word = process.GetAddressByteSize()
+	order = struct_byte_order(process)
+	stats = DHeapStats()
+	type_name = DGcTypeNames(read, word, order) if types else None
+	try:
+		pools, bins = find_gc_pools(target)
+		for pool in pools:
+			scan_gc_pool(read, pool, bins, word, order, stats, type_name)
+	except (ValueError, IOError) as e:
+		result.SetError(str(e))
+		return
+	for line in stats.lines(top):
+		result.AppendMessage(line)
+
+# qualified names of druntime's thread class, whose static members hold the thread and context lists
+thread_class_names = ['core.thread.threadbase.ThreadBase', 'core.thread.osthread.Thread', 'core.thread.Thread']
+# words pushed by fiber_switchContext between the saved stack pointer and its return address
+saved_ip_slots = { 'x86_64': 6 }
+
+DThread = collections.namedtuple('DThread', ['address', 'id', 'name', 'daemon', 'bstack', 'tstack', 'context'])
+DFiber = collections.namedtuple('DFiber', ['context', 'bstack', 'tstack', 'within', 'thread', 'ip'])
+
+def walk_stack_contexts(read, address, size, offsets, format):
+	"yields (address, bstack, tstack, within) of a StackContext list, reading each node at once"
+	seen = set()
+	while address and address not in seen:
+		seen.add(address)
+		data = read(address, size)
+		bstack, tstack, within, next = [struct.unpack_from(format, data, offset)[0] for offset in offsets]
+		yield address, bstack, tstack, within
+		address = next
+
+def list_options(args, flags):
+	"parses --skip N, --limit N, --match TEXT and the given flags of dlang-threads and dlang-fibers"
+	options = { 'skip': 0, 'limit': 50, 'match': None }
+	i = 0
+	while i < len(args):
+		name = args[i][2:]
+		if args[i] in flags:
+			options[name] = True
+			i += 1
+		elif name in options and args[i].startswith('--') and i + 1 < len(args):
+			options[name] = args[i + 1] if name == 'match' else int(args[i + 1])
+			i += 2
+		else:
+			raise ValueError(args[i])
+	return options
+
+def page_lines(items, options, format):
+	"yields the formatted lines of the page of items selected by --skip and --limit"
+	skip = options['skip']
+	page = items[skip:skip + options['limit']]
+	for i, item in enumerate(page):
+		yield format(skip + i, item)
+	if len(page) < len(items):
+		yield 'showing %d-%d of %d, use --skip and --limit to page' % (skip, skip + len(page), len(items))
+
+def format_thread(index, thread):
+	return '#%d Thread 0x%x id 0x%x%s%s stack [0x%x, 0x%x) context 0x%x' % (index, thread.address, thread.id,
+		' "%s"' % thread.name if thread.name else '', ' daemon' if thread.daemon else '', thread.tstack, thread.bstack, thread.context)
+
+def format_fiber(index, fiber, function):
+	line = '#%d context 0x%x stack [0x%x, 0x%x) %d bytes used, %s' % (index, fiber.context, fiber.tstack, fiber.bstack,
+		fiber.bstack - fiber.tstack, 'running on Thread 0x%x' % fiber.thread if fiber.thread else 'suspended')
+	if fiber.within:
+		line += ' within 0x%x' % fiber.within
+	if fiber.ip:
+		line += ', ip 0x%x' % fiber.ip + (' in ' + function if function else '')
+	return line
+
+def field_offsets(type, names):
+	"returns the byte offsets of the named fields of a struct type"
+	offsets = {}
+	for i in range(type.GetNumberOfFields()):
+		field = type.GetFieldAtIndex(i)
+		offsets[field.GetName()] = field.GetOffsetInBytes()
+	return [offsets[name] for name in names]
+
+def target_arch(target):
+	"returns 'x86_64' for x86-64 targets not using the Windows ABI, else the architecture name"
+	triple = target.GetTriple() or ''
+	arch = triple.split('-')[0]
+	if arch == 'x86_64' and 'windows' in triple:
+		return 'x86_64-windows'
+	return arch
+
+class DThreadLists(object):
+	"druntime's threads and fiber contexts, read once per stop"
+
+	def __init__(self, target):
+		self.target = target
+		process = target.GetProcess()
+		read = lambda address, size: read_slice(process, address, 0, size)
+		tbeg = cbeg = None
+		for class_name in thread_class_names:
+			tbeg = target.FindFirstGlobalVariable(class_name + '.sm_tbeg')
+			cbeg = target.FindFirstGlobalVariable(class_name + '.sm_cbeg')
+			if tbeg.IsValid() and cbeg.IsValid():
+				break
+		if not tbeg.IsValid() or not cbeg.IsValid():
+			raise ValueError("druntime thread list not found, druntime needs to be built with debug info")
+		self.functions = {}
+		self.threads = []
+		main_contexts = set()
+		running = {}
+		seen = set()
+		thread = tbeg
+		while thread.GetValueAsUnsigned() and thread.GetValueAsUnsigned() not in seen:
+			seen.add(thread.GetValueAsUnsigned())
+			value = thread.Dereference()
+			main = value.GetChildMemberWithName('m_main')
+			name = value.GetChildMemberWithName('m_name')
+			length = min(name.GetChildMemberWithName('length').GetValueAsUnsigned(), 256)
+			try:
+				name = read(name.GetChildMemberWithName('ptr').GetValueAsUnsigned(), length).decode('utf-8', 'replace') if length else ''
+			except IOError:
+				name = '<unreadable>'
+			context = value.GetChildMemberWithName('m_curr').GetValueAsUnsigned()
+			self.threads.append(DThread(thread.GetValueAsUnsigned(), value.GetChildMemberWithName('m_addr').GetValueAsUnsigned(), name,
+				bool(value.GetChildMemberWithName('m_isDaemon').GetValueAsUnsigned()), main.GetChildMemberWithName('bstack').GetValueAsUnsigned(),
+				main.GetChildMemberWithName('tstack').GetValueAsUnsigned(), context))
+			main_contexts.add(main.GetLoadAddress())
+			running[context] = thread.GetValueAsUnsigned()
+			thread = value.GetChildMemberWithName('next')
+
+		context_type = cbeg.GetType().GetPointeeType().GetCanonicalType()
+		offsets = field_offsets(context_type, ['bstack', 'tstack', 'within', 'next'])
+		format = struct_byte_order(process) + size_t_format(process)
+		word = struct.calcsize(format)
+		slots = saved_ip_slots.get(target_arch(target))
+		self.fibers = []
+		for address, bstack, tstack, within in walk_stack_contexts(read, cbeg.GetValueAsUnsigned(), context_type.GetByteSize(), offsets, format):
+			if address in main_contexts:
+				continue
+			thread = running.get(address)
+			ip = None
+			if thread is None and slots is not None and tstack:
+				data = read_memory(process, tstack + slots * word, word)
+				if data is not None:
+					ip = struct.unpack(format, data)[0]
+			self.fibers.append(DFiber(address, bstack, tstack, within, thread, ip))
+
+	def function(self, ip):
+		if ip not in self.functions:
+			name = None
+			if ip:
+				address = self.target.ResolveLoadAddress(ip)
+				name = address.GetFunction().GetName() or address.GetSymbol().GetName()
+			self.functions[ip] = name
+		return self.functions[ip]
+
+thread_lists_stop_id = None
+thread_lists_cache = None
+
+def thread_lists(target):
+	global thread_lists_stop_id, thread_lists_cache
+	stop_id = target.GetProcess().GetStopID()
+	if thread_lists_cache is None or thread_lists_stop_id != stop_id:
+		thread_lists_cache = DThreadLists(target)
+		thread_lists_stop_id = stop_id
+	return thread_lists_cache
+
+def dlang_threads(debugger, command, result, internal_dict):
+	"""List the threads registered with druntime
+
+	Usage: dlang-threads [--match NAME] [--skip N] [--limit N]
+
+	Shows the Thread object, thread id, name, stack bounds and current context of up
+	to N (default 50) threads. The lists are read once per stop."""
+	try:
+		options = list_options(shlex.split(command), [])
+	except ValueError:
+		result.SetError("Usage: dlang-threads [--match NAME] [--skip N] [--limit N]")
+		return
+	try:
+		lists = thread_lists(debugger.GetSelectedTarget())
+	except (ValueError, IOError) as e:
+		result.SetError(str(e))
+		return
+	threads = [thread for thread in lists.threads if options['match'] is None or options['match'] in thread.name]
+	for line in page_lines(threads, options, format_thread):
+		result.AppendMessage(line)
+
+def dlang_fibers(debugger, command, result, internal_dict):
+	"""List the fibers of the D program
+
+	Usage: dlang-fibers [--running|--suspended] [--match FUNCTION] [--skip N] [--limit N]
+
+	Walks druntime's context list and shows the context, stack bounds, state and, for
+	suspended fibers on x86-64, the saved instruction pointer of up to N (default 50)
+	fibers. --match keeps fibers whose saved instruction pointer is in a function
+	containing FUNCTION. The lists are read once per stop, so paging is instant."""
+	try:
+		options = list_options(shlex.split(command), ['--running', '--suspended'])
+	except ValueError:
+		result.SetError("Usage: dlang-fibers [--running|--suspended] [--match FUNCTION] [--skip N] [--limit N]")
+		return
+	try:
+		lists = thread_lists(debugger.GetSelectedTarget())
+	except (ValueError, IOError) as e:
+		result.SetError(str(e))
+		return
+	fibers = lists.fibers
+	if options.get('running'):
+		fibers = [fiber for fiber in fibers if fiber.thread]
+	if options.get('suspended'):
+		fibers = [fiber for fiber in fibers if not fiber.thread]
+	if options['match'] is not None:
+		fibers = [fiber for fiber in fibers if options['match'] in (lists.function(fiber.ip) or '')]
+	for line in page_lines(fibers, options, lambda index, fiber: format_fiber(index, fiber, lists.function(fiber.ip))):
+		result.AppendMessage(line)
+
+# sections holding global variables scanned by dlang-who-refs
+data_section_names = ['.data', '.bss', '.data.rel.ro', '__data', '__bss', '__common']
+# stacks larger than this are not assumed to belong to a stack pointer
+max_stack_size = 1 << 30
+# errors of the read functions passed to scan_range_for_refs
+read_errors = (IOError,)
+
+class DCoreFile(object):
+	"reads the memory of an ELF core file through mmap, using its PT_LOAD segments"
+
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		if self.map[:4] != b'\x7fELF':
+			raise IOError('%s is not an ELF file' % path)
+		order = '<' if self.map[5:6] == b'\x01' else '>'
+		if self.map[4:5] == b'\x02':
+			phoff, = struct.unpack_from(order + 'Q', self.map, 0x20)
+			phentsize, phnum = struct.unpack_from(order + 'HH', self.map, 0x36)
+			header = order + 'IIQQQQQQ'
+		else:
+			phoff, = struct.unpack_from(order + 'I', self.map, 0x1c)
+			phentsize, phnum = struct.unpack_from(order + 'HH', self.map, 0x2a)
+			header = order + 'IIIIIIII'
+		segments = []
+		for i in range(phnum):
+			fields = struct.unpack_from(header, self.map, phoff + i * phentsize)
+			if self.map[4:5] == b'\x02':
+				type, flags, offset, vaddr, paddr, filesz = fields[:6]
+			else:
+				type, offset, vaddr, paddr, filesz = fields[:5]
+			# PT_LOAD segments with contents, the size in memory may be larger if it wasn't dumped
+			if type == 1 and filesz:
+				segments.append((vaddr, vaddr + filesz, offset))
+		segments.sort()
+		self.starts = [segment[0] for segment in segments]
+		self.segments = segments
+
+	def read(self, address, size):
+		i = bisect.bisect_right(self.starts, address) - 1
+		if i < 0 or address + size > self.segments[i][1]:
+			raise IOError('0x%x is not in the core file' % address)
+		offset = self.segments[i][2] + address - self.segments[i][0]
+		return self.map[offset:offset + size]
+
+def find_words_in_range(data, low, high, word, order):
+	"""returns (offset, value) of the aligned words of data with low <= value < high
+
+	Candidates are found with bytes.find on the high order bytes all values in the
+	range share, so only those are decoded."""
+	typecode = 'Q' if word == 8 else 'I'
+	size = len(data) - len(data) % word
+	if order == ('<' if sys.byteorder == 'little' else '>'):
+		words = memoryview(data[:size]).cast(typecode)
+	else:
+		words = array.array(typecode)
+		words.frombytes(data[:size])
+		words.byteswap()
+	common = word
+	while common and (low >> (8 * (word - common))) != ((high - 1) >> (8 * (word - common))):
+		common -= 1
+	if not common:
+		return [(i * word, value) for i, value in enumerate(words) if low <= value < high]
+	prefix = (low >> (8 * (word - common))).to_bytes(common, 'little' if order == '<' else 'big')
+	# position of the shared bytes inside a word
+	skip = word - common if order == '<' else 0
+	matches = []
+	pos = data.find(prefix, skip)
+	while pos != -1 and pos - skip + word <= size:
+		start = pos - skip
+		if start % word:
+			pos = data.find(prefix, pos + 1)
+			continue
+		value = words[start // word]
+		if low <= value < high:
+			matches.append((start, value))
+		pos = data.find(prefix, start + word + skip)
+	return matches
+
+def scan_range_for_refs(read, start, end, low, high, word, order):
+	"returns (address, value) of the words in [start, end) pointing into [low, high), read in chunks of scan_chunk_size"
+	matches = []
+	start += -start % word
+	chunk_size = max(word, scan_chunk_size - scan_chunk_size % word)
+	for offset in range(start, end, chunk_size):
+		try:
+			data = read(offset, min(chunk_size, end - offset))
+		except read_errors:
+			continue
+		matches.extend((offset + position, value) for position, value in find_words_in_range(data, low, high, word, order))
+	return matches
+
+core_files = {}
+
+def scan_core_task(task):
+	"process pool worker of dlang-who-refs, scans one range of a core file"
+	path, start, end, low, high, word, order = task
+	core = core_files.get(path)
+	if core is None:
+		core = core_files[path] = DCoreFile(path)
+	return scan_range_for_refs(core.read, start, end, low, high, word, order)
+
+def scan_core_parallel(path, ranges, low, high, word, order, jobs):
+	"""scans ranges of a core file in core_task_size pieces on a pool of jobs processes,
+	returns the matches per range"""
+	tasks = []
+	owners = []
+	for i, (start, end) in enumerate(ranges):
+		for offset in range(start, end, core_task_size):
+			tasks.append((path, offset, min(end, offset + core_task_size), low, high, word, order))
+			owners.append(i)
+	matches = [[] for start, end in ranges]
+	pool = multiprocessing.get_context('fork').Pool(jobs)
+	try:
+		for i, found in zip(owners, pool.map(scan_core_task, tasks)):
+			matches[i].extend(found)
+	finally:
+		pool.terminate()
+	return matches
+
+def gc_block_of(pools, pagetables, bins, address):
+	"returns (start, size) of the GC block containing address or None"
+	sizes, page, page_plus = bins
+	for pool, pagetable in zip(pools, pagetables):
+		if not pool.base <= address < pool.base + pool.npages * gc_page_size:
+			continue
+		index = (address - pool.base) // gc_page_size
+		size = sizes.get(pagetable[index])
+		if size is not None:
+			page_start = pool.base + index * gc_page_size
+			return page_start + (address - page_start) // size * size, size
+		first = index
+		while first > 0 and pagetable[first] == page_plus:
+			first -= 1
+		if pagetable[first] != page:
+			return None
+		last = index + 1
+		while last < pool.npages and pagetable[last] == page_plus:
+			last += 1
+		return pool.base + first * gc_page_size, (last - first) * gc_page_size
+	return None
+
+def gc_block_is_free(read, pools, pagetables, bins, address, word, order):
+	"returns whether address is in a free block of a small GC pool, according to its freebits"
+	sizes = bins[0]
+	for pool, pagetable in zip(pools, pagetables):
+		if not pool.base <= address < pool.base + pool.npages * gc_page_size:
+			continue
+		index = (address - pool.base) // gc_page_size
+		size = sizes.get(pagetable[index])
+		if pool.large or size is None or not pool.freebits:
+			return False
+		# small pools have a freebit per 16 bytes, set for the first 16 bytes of free blocks
+		page_start = pool.base + index * gc_page_size
+		bit = (page_start + (address - page_start) // size * size - pool.base) >> 4
+		aligned = bit - bit % (word * 8)
+		try:
+			bits = read_gc_bits(read, pool.freebits, aligned, word * 8, word, order)
+		except read_errors:
+			return False
+		return bool((int.from_bytes(bits, 'little') >> (bit - aligned)) & 1)
+	return False
+
+def gc_used_ranges(pools, pagetables, bins):
+	"returns (start, end) of the runs of pages of the GC pools that are not free"
+	sizes, page, page_plus = bins
+	ranges = []
+	for pool, pagetable in zip(pools, pagetables):
+		run = None
+		for i, bin in enumerate(pagetable):
+			used = bin in sizes or bin == page or bin == page_plus
+			if used and run is None:
+				run = i
+			elif not used and run is not None:
+				ranges.append((pool.base + run * gc_page_size, pool.base + i * gc_page_size))
+				run = None
+		if run is not None:
+			ranges.append((pool.base + run * gc_page_size, pool.base + pool.npages * gc_page_size))
+	return ranges
+
+def referrer_lines(found, label, low, high, pools, pagetables, bins, is_free):
+	"""returns the lines describing the matches of a scanned range which are real referrers,
+	dropping words inside [low, high) and stale words of freed small GC blocks"""
+	lines = []
+	for referrer, value in found:
+		if low <= referrer < high:
+			continue
+		if label is None:
+			if is_free(referrer):
+				continue
+			block = gc_block_of(pools, pagetables, bins, referrer)
+			where = "GC block 0x%x (%d bytes)" % block if block else "GC pool"
+		else:
+			where = label
+		lines.append("0x%x -> 0x%x in %s" % (referrer, value, where))
+	return lines
+
+def read_pagetable(read, pool):
+	return bytearray(b''.join(read(pool.pagetable + first, min(heap_scan_pages, pool.npages - first))
+		for first in range(0, pool.npages, heap_scan_pages)))
+
+def stack_ranges(lists, stack_pointers):
+	"""returns (start, end, label) of the used parts of the thread and fiber stacks
+
+	Running stacks are scanned from the stack pointers of the threads, stacks
+	without one from the top saved in their context."""
+	bottoms = sorted([(thread.bstack, 'stack of Thread 0x%x' % thread.address) for thread in lists.threads] +
+		[(fiber.bstack, 'stack of fiber context 0x%x' % fiber.context) for fiber in lists.fibers])
+	ranges = []
+	used = set()
+	for sp in stack_pointers:
+		i = bisect.bisect_right(bottoms, (sp, ''))
+		if i < len(bottoms) and bottoms[i][0] - sp < max_stack_size:
+			ranges.append((sp, bottoms[i][0], bottoms[i][1]))
+			used.add(bottoms[i][0])
+	for thread in lists.threads:
+		if thread.bstack not in used and thread.tstack:
+			ranges.append((thread.tstack, thread.bstack, 'stack of Thread 0x%x' % thread.address))
+	for fiber in lists.fibers:
+		if fiber.bstack not in used and fiber.tstack:
+			ranges.append((fiber.tstack, fiber.bstack, 'stack of fiber context 0x%x' % fiber.context))
+	return ranges
+
+def thread_stack_pointers(process):
+	"returns the stack pointers of all threads of the process"
+	return [process.GetThreadAtIndex(i).GetFrameAtIndex(0).GetSP() for i in range(process.GetNumThreads())]
+
+def data_section_ranges(target):
+	"returns (start, end, label) of the sections holding global variables"
+	ranges = []
+	def add(section, module):
+		if section.GetName() in data_section_names:
+			start = section.GetLoadAddress(target)
+			if start != lldb.LLDB_INVALID_ADDRESS:
+				ranges.append((start, start + section.GetByteSize(), 'section %s of %s' % (section.GetName(), module.GetFileSpec().fullpath)))
+		for i in range(section.GetNumSubSections()):
+			add(section.GetSubSectionAtIndex(i), module)
+	for module in target.module_iter():
+		for section in module.section_iter():
+			add(section, module)
+	return ranges
+
+def dlang_who_refs(debugger, command, result, internal_dict):
+	"""Find the words pointing into the GC block containing an address
+
+	Usage: dlang-who-refs [address expression] [--size N] [--limit N] [--core PATH] [--jobs N]
+
+	Scans the allocated blocks of the GC pools, the thread and fiber stacks and the data
+	sections in chunks for aligned words pointing into the block and prints up to
+	N (default 100) of them with the block, stack or section they are in. --size
+	looks for pointers into [address, address + N) instead of the GC block. --core
+	reads the memory by mapping PATH, the core file being debugged, which
+	also allows splitting the scan across N processes with --jobs."""
+	usage = "Usage: dlang-who-refs [address expression] [--size N] [--limit N] [--core PATH] [--jobs N]"
+	args = shlex.split(command)
+	options = { '--size': None, '--limit': 100, '--core': None, '--jobs': 1 }
+	expression = []
+	i = 0
+	while i < len(args):
+		if args[i] in options and i + 1 < len(args):
+			options[args[i]] = args[i + 1] if args[i] == '--core' else int(args[i + 1], 0)
+			i += 2
+		else:
+			expression.append(args[i])
+			i += 1
+	if not expression:
+		result.SetError(usage)
+		return
+	value = evaluate(debugger, ' '.join(expression))
+	if value.GetError().Fail():
+		result.SetError(value.GetError().GetCString())
+		return
+	address = value.GetValueAsUnsigned()
+
+	target = debugger.GetSelectedTarget()
+	process = target.GetProcess()
+	read = pool_read = lambda address, size: read_slice(process, address, 0, size)
+	try:
+		pools, bins = find_gc_pools(target)
+		pagetables = [read_pagetable(read, pool) for pool in pools]
+	except (ValueError, IOError) as e:
+		result.SetError(str(e))
+		return
+	if options['--size'] is not None:
+		low, high = address, address + options['--size']
+	else:
+		block = gc_block_of(pools, pagetables, bins, address)
+		if block is None:
+			result.AppendMessage("0x%x is not in a GC block, looking for pointers to it" % address)
+			low, high = address, address + 1
+		else:
+			low, high = block[0], block[0] + block[1]
+			result.AppendMessage("GC block 0x%x (%d bytes)" % block)
+
+	ranges = [(start, end, None) for start, end in gc_used_ranges(pools, pagetables, bins)]
+	try:
+		ranges += stack_ranges(thread_lists(target), thread_stack_pointers(process))
+	except (ValueError, IOError) as e:
+		result.AppendMessage("Not scanning stacks: %s" % e)
+	ranges += data_section_ranges(target)
+
+	word = process.GetAddressByteSize()
+	order = struct_byte_order(process)
+	is_free = lambda address: gc_block_is_free(pool_read, pools, pagetables, bins, address, word, order)
+	lines = []
+	complete = True
+	if options['--core'] is not None and options['--jobs'] > 1:
+		matches = scan_core_parallel(options['--core'], [(start, end) for start, end, label in ranges], low, high, word, order, options['--jobs'])
+		for (start, end, label), found in zip(ranges, matches):
+			lines += referrer_lines(found, label, low, high, pools, pagetables, bins, is_free)
+	else:
+		if options['--core'] is not None:
+			read = DCoreFile(options['--core']).read
+		for start, end, label in ranges:
+			# only referrers which are shown count towards the limit, one more tells if there are others
+			if len(lines) > options['--limit']:
+				complete = False
+				break
+			found = scan_range_for_refs(read, start, end, low, high, word, order)
+			lines += referrer_lines(found, label, low, high, pools, pagetables, bins, is_free)
+	for line in lines[:options['--limit']]:
+		result.AppendMessage(line)
+	if len(lines) > options['--limit'] and complete:
+		result.AppendMessage("%d more, use --limit to show them" % (len(lines) - options['--limit']))
+	elif len(lines) > options['--limit']:
+		result.AppendMessage("stopped after %d referrers, use --limit to show more" % options['--limit'])